@@ -0,0 +1,22 @@
+import argparse
+
+from neo_ae.metric import download_weights
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--weight_path",
+        type=str,
+        required=True,
+        help="Directory to download the LPIPS weights to",
+    )
+    parser.add_argument(
+        "--net_type",
+        type=str,
+        default="alex",
+        help="LPIPS network (alex, squeeze or vgg)",
+    )
+
+    args = parser.parse_args()
+
+    download_weights(args.weight_path, args.net_type)
@@ -0,0 +1,26 @@
+import argparse
+
+import neo_trace_backend
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--container_path",
+        type=str,
+        required=True,
+        help="Trace container, or the run's output directory holding it",
+    )
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        required=True,
+        help="Directory to write <frame>/poc.trace[.bin] into",
+    )
+    parser.add_argument(
+        "--frame", type=int, nargs="*", help="Frames to extract (default: all)"
+    )
+
+    args = parser.parse_args()
+
+    container = neo_trace_backend.load_container(args.container_path)
+    container.extract(args.output_path, args.frame)
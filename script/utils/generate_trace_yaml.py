@@ -17,6 +17,54 @@ if __name__ == "__main__":
     parser.add_argument("--reuse_mode", action="store_true", help="Enable reuse_mode")
     parser.add_argument("--trace_mode", action="store_true", help="Enable trace_mode")
     parser.add_argument("--image_mode", action="store_true", help="Enable image_mode")
+    parser.add_argument(
+        "--trace_format",
+        type=str,
+        default="text",
+        choices=["text", "binary"],
+        help="Trace file format",
+    )
+    parser.add_argument(
+        "--trace_container",
+        action="store_true",
+        help="Write all traces into one container file instead of per-frame directories",
+    )
+    parser.add_argument(
+        "--num_thread", type=int, default=1, help="Number of backend CPU threads"
+    )
+    parser.add_argument(
+        "--sort_mode",
+        type=str,
+        default="comparison",
+        choices=["comparison", "radix"],
+        help="Per-tile depth sort algorithm",
+    )
+    parser.add_argument(
+        "--num_reference",
+        type=int,
+        default=1,
+        help="Number of past frames kept as reuse references",
+    )
+    parser.add_argument(
+        "--num_shard",
+        type=int,
+        default=1,
+        help="Number of frame shards rendered in parallel processes",
+    )
+    parser.add_argument(
+        "--scheduler",
+        type=str,
+        default="reuse",
+        choices=["reuse", "periodic", "background", "adaptive"],
+        help="Sort refresh policy of reuse frames",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cuda",
+        choices=["cuda", "cpu"],
+        help="Device holding the Gaussians (cpu runs the CPU preprocess)",
+    )
     parser.add_argument(
         "--output_path", type=str, default="config.yaml", help="Output YAML file path"
     )
@@ -32,6 +80,14 @@ if __name__ == "__main__":
         "reuse_mode": args.reuse_mode,
         "trace_mode": args.trace_mode,
         "image_mode": args.image_mode,
+        "trace_format": args.trace_format,
+        "trace_container": args.trace_container,
+        "num_thread": args.num_thread,
+        "sort_mode": args.sort_mode,
+        "num_reference": args.num_reference,
+        "num_shard": args.num_shard,
+        "scheduler": args.scheduler,
+        "device": args.device,
     }
 
     os.makedirs(args.output_path, exist_ok=True)
@@ -37,6 +37,29 @@ if __name__ == "__main__":
     parser.add_argument(
         "--figure_idx", type=int, default=0, help="figure index for the run"
     )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Recompute every result instead of reusing the output cache",
+    )
+    parser.add_argument(
+        "--metric_device",
+        type=str,
+        default="cuda",
+        help="Torch device to measure image quality on (e.g., 'cpu')",
+    )
+    parser.add_argument(
+        "--weight_path",
+        type=str,
+        default="",
+        help="Directory with the LPIPS weights; never downloads them if set",
+    )
+    parser.add_argument(
+        "--num_thread",
+        type=int,
+        default=0,
+        help="Torch CPU threads for metrics (0 keeps the default)",
+    )
 
     args = parser.parse_args()
 
@@ -47,6 +70,10 @@ if __name__ == "__main__":
         args.output_path,
         args.device,
     )
+    neo_ae.init_cache(
+        "" if args.no_cache else f"{args.output_path}/postprocess_cache.sqlite"
+    )
+    neo_ae.init_metric(args.metric_device, args.weight_path, args.num_thread)
     neo_ae.init_workload(
         args.resolution,
         args.scene,
@@ -0,0 +1,31 @@
+import argparse
+import os
+
+import neo_trace_frontend
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset_path", type=str, required=True, help="Path to the dataset"
+    )
+    parser.add_argument(
+        "--model_path", type=str, required=True, help="Path to the model"
+    )
+    parser.add_argument(
+        "--yaml_path",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Trace YAML files; outputs go to the directory of each",
+    )
+
+    args = parser.parse_args()
+
+    neo_trace_frontend.sweep(
+        args.dataset_path,
+        args.model_path,
+        [
+            (os.path.dirname(os.path.abspath(yaml_path)), yaml_path)
+            for yaml_path in args.yaml_path
+        ],
+    )
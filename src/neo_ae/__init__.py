@@ -1,3 +1,5 @@
+import torch
+
 from .draw import *
 from .env import *
 from .postprocess import *
@@ -15,6 +17,17 @@ def init_workload(resolution, scene, iteration, algorithm, runtime_measurement):
     set_workload(resolution, scene, iteration, algorithm, runtime_measurement)
 
 
+def init_metric(device="cuda", weight_path="", num_thread=0):
+    set_metric_environment(device, weight_path)
+
+    if num_thread > 0:
+        torch.set_num_threads(num_thread)
+
+
+def init_cache(cache_path):
+    set_cache_environment(cache_path)
+
+
 def draw(figure_idx, summary_path):
     if figure_idx == FIGURE_BASE + 5:
         draw_figure_5(summary_path)
@@ -0,0 +1,103 @@
+import json
+import os
+import sqlite3
+from functools import lru_cache
+
+from .env import get_cache_environment
+
+# Bump when a cached computation changes, to drop the results it stored
+CACHE_VERSION = 1
+
+
+class ResultCache:
+    r"""Postprocessing results persisted in an SQLite file.
+
+    A result is keyed by its input files and a metric name, and is only reused
+    while each file keeps the size and mtime it had when the result was
+    stored. Values are stored as JSON.
+
+    Arguments:
+        path (str): the SQLite file, created if missing.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS result")
+            self.connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS result ("
+            "path TEXT, metric TEXT, stamp TEXT, value TEXT, "
+            "PRIMARY KEY (path, metric))"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def key(item):
+        """Absolute paths and size:mtime stamps of an item, a path or a tuple
+        of paths; None for the stamp if a file is missing."""
+        paths = (item,) if isinstance(item, str) else item
+
+        try:
+            stats = [os.stat(path) for path in paths]
+        except OSError:
+            stats = None
+
+        path = "\n".join(os.path.abspath(path) for path in paths)
+        if stats is None:
+            return path, None
+        return path, ";".join(f"{st.st_size}:{st.st_mtime_ns}" for st in stats)
+
+    def fetch(self, items, metric, compute):
+        """Values of metric for items, in order. compute(items) evaluates the
+        items without a valid stored result, which are then stored."""
+        keys = [self.key(item) for item in items]
+        values = [None] * len(items)
+        misses = list()
+
+        for i, (path, stamp) in enumerate(keys):
+            row = self.connection.execute(
+                "SELECT stamp, value FROM result WHERE path = ? AND metric = ?",
+                (path, metric),
+            ).fetchone()
+
+            if stamp is not None and row is not None and row[0] == stamp:
+                values[i] = json.loads(row[1])
+            else:
+                misses.append(i)
+
+        if len(misses) == 0:
+            return values
+
+        computed = compute([items[i] for i in misses])
+
+        with self.connection:
+            for i, value in zip(misses, computed):
+                values[i] = value
+
+                path, stamp = keys[i]
+                if stamp is not None:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?)",
+                        (path, metric, stamp, json.dumps(value)),
+                    )
+
+        return values
+
+
+@lru_cache(maxsize=None)
+def open_cache(path):
+    return ResultCache(path)
+
+
+def cached(items, metric, compute):
+    """compute(items), reusing the results stored in the cache set by
+    init_cache; the same as compute(items) when there is none."""
+    cache_path = get_cache_environment()
+    if not cache_path:
+        return list(compute(items))
+
+    return open_cache(cache_path).fetch(items, metric, compute)
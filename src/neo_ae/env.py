@@ -40,3 +40,29 @@ def set_workload(resolution, scene, iteration, algorithm, runtime_measurement):
 
 def get_workload():
     return RESOLUTION, SCENE, ITERATION, ALGORITHM, RUNTIME_MEASUREMENT
+
+
+METRIC_DEVICE = "cuda"
+WEIGHT_PATH = ""
+
+
+def set_metric_environment(device, weight_path):
+    global METRIC_DEVICE, WEIGHT_PATH
+    METRIC_DEVICE = device
+    WEIGHT_PATH = weight_path
+
+
+def get_metric_environment():
+    return METRIC_DEVICE, WEIGHT_PATH
+
+
+CACHE_PATH = ""
+
+
+def set_cache_environment(cache_path):
+    global CACHE_PATH
+    CACHE_PATH = cache_path
+
+
+def get_cache_environment():
+    return CACHE_PATH
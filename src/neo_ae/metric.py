@@ -1,4 +1,7 @@
+import os
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from itertools import chain
 from math import exp
 from typing import Sequence
@@ -11,6 +14,56 @@ from PIL import Image
 from torch.autograd import Variable
 from torchvision import models, transforms
 
+from .env import get_metric_environment
+
+LPIPS_URL = (
+    "https://raw.githubusercontent.com/richzhang/PerceptualSimilarity/"
+    + "master/lpips/weights/v{version}/{net_type}.pth"
+)
+
+# Pretrained LPIPS feature networks and their weights
+NETWORKS = {
+    "alex": (models.alexnet, models.AlexNet_Weights.IMAGENET1K_V1),
+    "squeeze": (models.squeezenet1_1, models.SqueezeNet1_1_Weights.IMAGENET1K_V1),
+    "vgg": (models.vgg16, models.VGG16_Weights.IMAGENET1K_V1),
+}
+
+
+def load_weights(url):
+    r"""State dict at url. With a weight path set (see init_metric), it is
+    loaded from the file of the same name there and the network is never
+    used; otherwise it is downloaded to the torch.hub cache on first use."""
+    _, weight_path = get_metric_environment()
+
+    if not weight_path:
+        return torch.hub.load_state_dict_from_url(
+            url,
+            progress=True,
+            map_location=None if torch.cuda.is_available() else torch.device("cpu"),
+        )
+
+    path = os.path.join(weight_path, os.path.basename(url))
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found; fetch it with download_weights or from {url}"
+        )
+
+    return torch.load(path, map_location=torch.device("cpu"))
+
+
+def download_weights(weight_path, net_type: str = "alex", version: str = "0.1"):
+    r"""Downloads the weights LPIPS(net_type, version) needs into weight_path,
+    for later offline use."""
+    os.makedirs(weight_path, exist_ok=True)
+
+    for url in [
+        NETWORKS[net_type][1].url,
+        LPIPS_URL.format(version=version, net_type=net_type),
+    ]:
+        path = os.path.join(weight_path, os.path.basename(url))
+        if not os.path.exists(path):
+            torch.hub.download_url_to_file(url, path)
+
 
 def normalize_activation(x, eps=1e-10):
     norm_factor = torch.sqrt(torch.sum(x**2, dim=1, keepdim=True))
@@ -28,6 +81,14 @@ def get_network(net_type: str):
         raise NotImplementedError("choose net_type from [alex, squeeze, vgg].")
 
 
+def load_network(net_type: str):
+    network, weights = NETWORKS[net_type]
+
+    model = network()
+    model.load_state_dict(load_weights(weights.url))
+    return model
+
+
 class LinLayers(nn.ModuleList):
     def __init__(self, n_channels_list: Sequence[int]):
         super(LinLayers, self).__init__(
@@ -77,7 +138,7 @@ class SqueezeNet(BaseNet):
     def __init__(self):
         super(SqueezeNet, self).__init__()
 
-        self.layers = models.squeezenet1_1(True).features
+        self.layers = load_network("squeeze").features
         self.target_layers = [2, 5, 8, 10, 11, 12, 13]
         self.n_channels_list = [64, 128, 256, 384, 384, 512, 512]
 
@@ -88,7 +149,7 @@ class AlexNet(BaseNet):
     def __init__(self):
         super(AlexNet, self).__init__()
 
-        self.layers = models.alexnet(True).features
+        self.layers = load_network("alex").features
         self.target_layers = [2, 5, 8, 10, 12]
         self.n_channels_list = [64, 192, 384, 256, 256]
 
@@ -99,7 +160,7 @@ class VGG16(BaseNet):
     def __init__(self):
         super(VGG16, self).__init__()
 
-        self.layers = models.vgg16(weights=models.VGG16_Weights.IMAGENET1K_V1).features
+        self.layers = load_network("vgg").features
         self.target_layers = [4, 9, 16, 23, 30]
         self.n_channels_list = [64, 128, 256, 512, 512]
 
@@ -107,18 +168,8 @@ class VGG16(BaseNet):
 
 
 def get_state_dict(net_type: str = "alex", version: str = "0.1"):
-    # build url
-    url = (
-        "https://raw.githubusercontent.com/richzhang/PerceptualSimilarity/"
-        + f"master/lpips/weights/v{version}/{net_type}.pth"
-    )
-
-    # download
-    old_state_dict = torch.hub.load_state_dict_from_url(
-        url,
-        progress=True,
-        map_location=None if torch.cuda.is_available() else torch.device("cpu"),
-    )
+    # download, or load from the weight path
+    old_state_dict = load_weights(LPIPS_URL.format(version=version, net_type=net_type))
 
     # rename keys
     new_state_dict = OrderedDict()
@@ -159,7 +210,8 @@ class LPIPS(nn.Module):
         diff = [(fx - fy) ** 2 for fx, fy in zip(feat_x, feat_y)]
         res = [l(d).mean((2, 3), True) for d, l in zip(diff, self.lin)]
 
-        return torch.sum(torch.cat(res, 0), 0, True)
+        # One value per image of the batch
+        return torch.sum(torch.cat(res, 1), 1, True)
 
 
 def l1_loss(network_output, gt):
@@ -237,6 +289,22 @@ def measure_SSIM(img1, img2, window_size=11, size_average=True):
     return _ssim(img1, img2, window, window_size, channel, size_average)
 
 
+@lru_cache(maxsize=None)
+def _get_LPIPS(net_type, version, device):
+    return LPIPS(net_type, version).to(device)
+
+
+def get_LPIPS(net_type: str = "alex", version: str = "0.1", device="cuda"):
+    r"""LPIPS criterion on device, built (and its weights loaded) once per
+    network, version and device. "cuda", torch.device("cuda") and the
+    current "cuda:<n>" are the same device."""
+    device = torch.device(device)
+    if device.type == "cuda" and device.index is None:
+        device = torch.device("cuda", torch.cuda.current_device())
+
+    return _get_LPIPS(net_type, version, device)
+
+
 def measure_LPIPS(
     x: torch.Tensor, y: torch.Tensor, net_type: str = "alex", version: str = "0.1"
 ):
@@ -249,21 +317,127 @@ def measure_LPIPS(
                         'alex' | 'squeeze' | 'vgg'. Default: 'alex'.
         version (str): the version of LPIPS. Default: 0.1.
     """
-    device = x.device
-    criterion = LPIPS(net_type, version).to(device)
+    criterion = get_LPIPS(net_type, version, x.device)
     return criterion(x, y).item()
 
 
-def measure(img1_path, img2_path, metric):
-    read_image = (
-        lambda file_path: tf.to_tensor(Image.open(file_path))
-        .unsqueeze(0)[:, :3, :, :]
-        .cuda()
-    )
+def read_image(file_path):
+    return tf.to_tensor(Image.open(file_path)).unsqueeze(0)[:, :3, :, :]
+
 
+def read_image_pair(img1_path, img2_path):
     img1 = read_image(img1_path)
     img2 = read_image(img2_path)
-    img2 = transforms.Resize(img1.shape[-2:])(img2)
+
+    if img2.shape[-2:] != img1.shape[-2:]:
+        img2 = transforms.Resize(img1.shape[-2:])(img2)
+
+    return img1, img2
+
+
+class MetricEngine:
+    r"""Measures several metrics over many image pairs.
+
+    The LPIPS network and SSIM window are built once per engine, on its first
+    evaluation, so an engine with nothing to measure (e.g. every result is
+    cached) never loads weights or touches the device. Each pair is decoded
+    once, on num_worker threads while the previous batch is being evaluated,
+    and pairs of the same size are evaluated batch_size at a time.
+
+    Arguments:
+        metrics (Sequence[str]): any of 'PSNR' | 'SSIM' | 'LPIPS'.
+        device: where metrics are evaluated. Default: the one set by
+                init_metric.
+    """
+
+    def __init__(
+        self,
+        metrics: Sequence[str] = ("PSNR", "LPIPS"),
+        batch_size: int = 8,
+        num_worker: int = 4,
+        device=None,
+    ):
+        if device is None:
+            device, _ = get_metric_environment()
+
+        for metric in metrics:
+            if metric not in ["PSNR", "SSIM", "LPIPS"]:
+                raise ValueError(f"Unknown metric: {metric}")
+
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.num_worker = num_worker
+        self.device = torch.device(device)
+
+        self.lpips = None
+        self.window = None
+
+    def _evaluate(self, pairs):
+        img1 = torch.cat([img1 for img1, _ in pairs]).to(self.device)
+        img2 = torch.cat([img2 for _, img2 in pairs]).to(self.device)
+
+        values = dict()
+
+        with torch.no_grad():
+            if "PSNR" in self.metrics:
+                mse = ((img1 - img2) ** 2).view(img1.shape[0], -1).mean(1)
+                values["PSNR"] = 20 * torch.log10(1.0 / torch.sqrt(mse))
+            if "SSIM" in self.metrics:
+                if self.window is None:
+                    self.window = create_window(11, 3).to(self.device)
+                values["SSIM"] = _ssim(img1, img2, self.window, 11, 3, False)
+            if "LPIPS" in self.metrics:
+                if self.lpips is None:
+                    self.lpips = get_LPIPS("alex", "0.1", self.device)
+                values["LPIPS"] = self.lpips(img1, img2).view(-1)
+
+        values = {metric: value.tolist() for metric, value in values.items()}
+
+        return [
+            {metric: value[i] for metric, value in values.items()}
+            for i in range(len(pairs))
+        ]
+
+    def measure(self, pairs):
+        """Metrics of each (img1_path, img2_path) pair, in order, as dicts
+        from metric name to value. img2 is resized to img1 if they differ."""
+        chunks = [
+            pairs[i : i + self.batch_size]
+            for i in range(0, len(pairs), self.batch_size)
+        ]
+        results = list()
+
+        with ThreadPoolExecutor(self.num_worker) as executor:
+
+            def decode(chunk):
+                return [executor.submit(read_image_pair, *pair) for pair in chunk]
+
+            futures = decode(chunks[0]) if chunks else []
+
+            for i in range(len(chunks)):
+                images = [future.result() for future in futures]
+                futures = decode(chunks[i + 1]) if i + 1 < len(chunks) else []
+
+                # A batch holds images of one size only
+                batch = list()
+                for pair in images:
+                    if batch and pair[0].shape != batch[0][0].shape:
+                        results += self._evaluate(batch)
+                        batch = list()
+                    batch.append(pair)
+
+                results += self._evaluate(batch)
+
+        return results
+
+
+def measure(img1_path, img2_path, metric, device=None):
+    if device is None:
+        device, _ = get_metric_environment()
+
+    img1, img2 = read_image_pair(img1_path, img2_path)
+    img1 = img1.to(device)
+    img2 = img2.to(device)
 
     if metric == "PSNR":
         return measure_PSNR(img1, img2)
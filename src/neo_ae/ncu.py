@@ -0,0 +1,126 @@
+import csv
+import re
+from functools import lru_cache
+from operator import itemgetter
+
+import numpy as np
+
+KERNEL_NAME = "Kernel Name"
+RUNTIME = "gpu__time_duration.avg"
+READ_SECTORS = "lts__d_sectors_fill_sysmem.sum"
+WRITE_SECTORS = "lts__t_sectors_aperture_sysmem_op_write.sum"
+
+SECTOR_SIZE = 32
+
+
+class KernelClassifier:
+    r"""Maps kernel names to stages with one compiled regex.
+
+    A name belongs to the stage of the first (stage, kernel) pair whose kernel
+    is a substring of it, or to no stage (-1).
+
+    Arguments:
+        processType_function (Sequence[tuple[str, str]]): (stage, kernel) pairs.
+    """
+
+    def __init__(self, processType_function):
+        self.stages = list(dict.fromkeys(stage for stage, _ in processType_function))
+
+        # Alternatives are tried in order, each looking ahead for its kernel
+        self.pattern = re.compile(
+            "|".join(
+                f"(?=.*?({re.escape(kernel)}))" for _, kernel in processType_function
+            ),
+            re.DOTALL,
+        )
+        self.group_stage = [
+            self.stages.index(stage) for stage, _ in processType_function
+        ]
+
+    def classify(self, names):
+        """Stage id of each name, as an array."""
+        unique, inverse = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+
+        stage = np.full(len(unique), -1)
+        for i, name in enumerate(unique):
+            match = self.pattern.match(name)
+            if match is not None:
+                stage[i] = self.group_stage[match.lastindex - 1]
+
+        return stage[inverse.reshape(-1)]
+
+
+@lru_cache(maxsize=None)
+def get_classifier(processType_function):
+    return KernelClassifier(processType_function)
+
+
+def read_columns(csv_file_path, columns):
+    """Columns of a CSV file as tuples of strings, in the order given; columns
+    the file does not have are empty strings."""
+    with open(csv_file_path, mode="r", newline="") as readfile:
+        reader = csv.reader(readfile)
+        header = next(reader, [])
+
+        present = [column for column in columns if column in header]
+
+        # The trailing index keeps the getter returning tuples for one column
+        getter = itemgetter(*[header.index(column) for column in present], 0)
+        rows = list(map(getter, reader))
+
+    values = dict(zip(present, zip(*rows)))
+    return [values.get(column, ("",) * len(rows)) for column in columns]
+
+
+def to_array(values, valid):
+    """Floats of a metric column at the valid rows, with empty cells as 0.
+    Other rows, such as the units row of a raw page export, are not
+    converted."""
+    array = np.asarray(values, dtype=str)[valid]
+    array[array == ""] = "0"
+    return array.astype(np.float64)
+
+
+def load_ncu(csv_file_path, processType_function, skip_until=None):
+    r"""Per-stage runtime and sysmem traffic of an Nsight Compute CSV export.
+
+    Only the kernel name, runtime and sysmem sector columns are read. Rows are
+    classified with KernelClassifier and summed per stage.
+
+    Arguments:
+        csv_file_path (str): the ncu CSV export.
+        processType_function (Sequence[tuple[str, str]]): (stage, kernel) pairs.
+        skip_until (str): if given, rows up to and including the first kernel
+                          containing it are skipped (e.g. a warm-up frame).
+
+    Returns:
+        (runtime_breakdown, memory_breakdown): dicts from every stage to the
+        summed gpu__time_duration.avg and to the sysmem traffic in bytes.
+    """
+    classifier = get_classifier(tuple(processType_function))
+
+    names, runtime, read_sectors, write_sectors = read_columns(
+        csv_file_path, [KERNEL_NAME, RUNTIME, READ_SECTORS, WRITE_SECTORS]
+    )
+
+    stage = classifier.classify(names)
+    if skip_until is not None:
+        skip = np.flatnonzero(
+            np.char.find(np.asarray(names, dtype=str), skip_until) >= 0
+        )
+        stage[: skip[0] + 1 if len(skip) > 0 else len(stage)] = -1
+
+    valid = stage >= 0
+    runtime = to_array(runtime, valid)
+    traffic = (
+        to_array(read_sectors, valid) + to_array(write_sectors, valid)
+    ) * SECTOR_SIZE
+
+    num_stage = len(classifier.stages)
+    runtime = np.bincount(stage[valid], runtime, num_stage)
+    traffic = np.bincount(stage[valid], traffic, num_stage)
+
+    return (
+        dict(zip(classifier.stages, runtime.tolist())),
+        dict(zip(classifier.stages, traffic.tolist())),
+    )
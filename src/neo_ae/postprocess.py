@@ -1,10 +1,15 @@
 import csv
 import glob
+import json
+import os
 import re
 import statistics
+from concurrent.futures import ProcessPoolExecutor
 
+from .cache import cached
 from .env import *
-from .metric import measure
+from .metric import MetricEngine
+from .ncu import load_ncu
 
 TARGET_FPS = 60
 
@@ -47,27 +52,7 @@ def postprocess_figure_5():
             for resolution in resolution_list:
                 csv_file_path = f"{OUTPUT_PATH}/{DEVICE}-{resolution}.csv"
 
-                memory_breakdown = dict()
-                for process_type in ["feature extraction", "sorting", "rasterization"]:
-                    memory_breakdown[process_type] = 0
-
-                with open(csv_file_path, mode="r") as readfile:
-                    reader = csv.DictReader(readfile)
-                    for row in reader:
-                        kernel_name = row["Kernel Name"]
-                        for proc_type, kernel in processType_function:
-                            if kernel in kernel_name:
-                                read_sectors = float(
-                                    row["lts__d_sectors_fill_sysmem.sum"] or 0.0
-                                )
-                                write_sectors = float(
-                                    row["lts__t_sectors_aperture_sysmem_op_write.sum"]
-                                    or 0.0
-                                )
-                                memory_breakdown[proc_type] += (
-                                    read_sectors + write_sectors
-                                ) * 32
-                                break
+                _, memory_breakdown = read_ncu(csv_file_path, processType_function)
 
                 writer.writerow(
                     [
@@ -130,55 +115,18 @@ def postprocess_figure_10():
             for algorithm in ["gs", "neo"]:
                 csv_file_path = f"{OUTPUT_PATH}/{DEVICE}-{algorithm}.csv"
 
-                memory_breakdown = dict()
-                for process_type in [
-                    "feature extraction",
-                    "sorting",
-                    "rasterization",
-                ]:
-                    memory_breakdown[process_type] = 0
-
-                runtime_breakdown = dict()
-                for process_type in [
-                    "feature extraction",
-                    "sorting",
-                    "rasterization",
-                ]:
-                    runtime_breakdown[process_type] = 0
-
                 processType_function = (
                     gs_processType_function
                     if algorithm == "gs"
                     else neo_processType_function
                 )
-                neo_flag = False
-
-                with open(csv_file_path, mode="r") as readfile:
-                    reader = csv.DictReader(readfile)
-                    for row in reader:
-                        kernel_name = row["Kernel Name"]
-
-                        if algorithm == "neo" and not neo_flag:
-                            if "renderCUDA" in kernel_name:
-                                neo_flag = True
-                            continue
-
-                        for proc_type, kernel in processType_function:
-                            if kernel in kernel_name:
-                                read_sectors = float(
-                                    row["lts__d_sectors_fill_sysmem.sum"] or 0.0
-                                )
-                                write_sectors = float(
-                                    row["lts__t_sectors_aperture_sysmem_op_write.sum"]
-                                    or 0.0
-                                )
-                                memory_breakdown[proc_type] += (
-                                    read_sectors + write_sectors
-                                ) * 32
-                                runtime_breakdown[proc_type] += float(
-                                    row["gpu__time_duration.avg"] or 0.0
-                                )
-                                break
+
+                # Neo skips its first frame, which ends with the first renderCUDA
+                runtime_breakdown, memory_breakdown = read_ncu(
+                    csv_file_path,
+                    processType_function,
+                    skip_until="renderCUDA" if algorithm == "neo" else None,
+                )
 
                 actual_iteration = ITERATION if algorithm == "gs" else ITERATION - 1
 
@@ -212,18 +160,86 @@ def postprocess_figure_10():
                 )
 
 
+LATENCY_PATTERN = re.compile(rb"\(([\d.]+) FPS\)")
+TRAFFIC_PATTERN = re.compile(rb"Total DRAM Traffic\s*:\s*([\d.]+)\s*MB")
+
+LOG_BLOCK_SIZE = 64 * KB
+
+
+def parse_log(log_path):
+    """(latency, traffic) of a sim.log, from its last FPS and DRAM traffic
+    lines; None for either if missing. The file is read backward a block at
+    a time and only until both are found, as they are printed at the end."""
+    latency, traffic = None, None
+
+    with open(log_path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+
+        while end > 0 and (latency is None or traffic is None):
+            begin = max(end - LOG_BLOCK_SIZE, 0)
+            f.seek(begin)
+            block = f.read(end - begin) + tail
+            end = begin
+
+            # The first line may continue in the previous block
+            tail = b""
+            if begin > 0:
+                cut = block.find(b"\n")
+                if cut < 0:
+                    tail = block
+                    continue
+                block, tail = block[cut:], block[:cut]
+
+            if latency is None:
+                matches = LATENCY_PATTERN.findall(block)
+                latency = 1000.0 / float(matches[-1]) if matches else None
+            if traffic is None:
+                matches = TRAFFIC_PATTERN.findall(block)
+                traffic = float(matches[-1]) if matches else None
+
+    return latency, traffic
+
+
 def extract_latency(log_path):
-    with open(log_path, "r") as f:
-        content = f.read()
-    matches = re.findall(r"\(([\d.]+) FPS\)", content)
-    return 1000.0 / float(matches[-1]) if matches else None
+    return parse_log(log_path)[0]
 
 
 def extract_traffic(log_path):
-    with open(log_path, "r") as f:
-        content = f.read()
-        matches = re.findall(r"Total DRAM Traffic\s*:\s*([\d.]+)\s*MB", content)
-    return float(matches[-1]) if matches else None
+    return parse_log(log_path)[1]
+
+
+def parse_logs(log_files):
+    """parse_log of each file, on a process pool."""
+    if len(log_files) < 2:
+        return [parse_log(path) for path in log_files]
+
+    with ProcessPoolExecutor() as executor:
+        return list(
+            executor.map(
+                parse_log,
+                log_files,
+                chunksize=max(len(log_files) // (4 * os.cpu_count()), 1),
+            )
+        )
+
+
+def read_logs(log_path):
+    """(path, latency, traffic) of each log_path/trace/*/sim.log. Only logs
+    that are new or changed since cached are parsed."""
+    log_files = glob.glob(f"{log_path}/trace/*/sim.log")
+    logs = cached(log_files, "sim.log", parse_logs)
+    return [(path, *log) for path, log in zip(log_files, logs)]
+
+
+def read_ncu(csv_file_path, processType_function, skip_until=None):
+    """load_ncu, cached."""
+
+    def compute(csv_files):
+        return [load_ncu(path, processType_function, skip_until) for path in csv_files]
+
+    metric = f"ncu {json.dumps([processType_function, skip_until])}"
+    return tuple(cached([csv_file_path], metric, compute)[0])
 
 
 def arithmetric_mean(values):
@@ -234,6 +250,20 @@ def geometric_mean(values):
     return statistics.geometric_mean(values) if len(values) > 0 else 0
 
 
+def measure_renders(engine, path, frames):
+    """(PSNR, LPIPS) of path/renders against path/gt for each frame. Only
+    frames whose images are new or changed since cached are measured."""
+    metrics = cached(
+        [
+            (f"{path}/gt/{idx:05d}.png", f"{path}/renders/{idx:05d}.png")
+            for idx in frames
+        ],
+        "+".join(engine.metrics),
+        engine.measure,
+    )
+    return [(metric["PSNR"], metric["LPIPS"]) for metric in metrics]
+
+
 def postprocess_figure_15():
     DATASET_PATH, MODEL_PATH, YAML_PATH, OUTPUT_PATH, DEVICE = get_environment()
     RESOLUTION, SCENE, ITERATION, ALGORITHM, RUNTIME_MEASUREMENT = get_workload()
@@ -297,13 +327,9 @@ def postprocess_figure_15():
             for scene in dataset_list:
                 for resolution in resolution_list:
                     log_path = f"{OUTPUT_PATH}/neo/{scene}/{resolution}"
-                    log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-                    latency = list()
-                    for path in log_files:
-                        lat = extract_latency(path)
-                        if lat is not None:
-                            latency.append(lat)
+                    latency = [
+                        lat for _, lat, _ in read_logs(log_path) if lat is not None
+                    ]
 
                     writer.writerow(
                         [
@@ -352,23 +378,8 @@ def postprocess_figure_16():
             ]:
                 csv_file_path = f"{OUTPUT_PATH}/{DEVICE}-gs-{scene}-QHD.csv"
 
-                total_traffic = 0
-
-                with open(csv_file_path, mode="r") as readfile:
-                    reader = csv.DictReader(readfile)
-                    for row in reader:
-                        kernel_name = row["Kernel Name"]
-                        for proc_type, kernel in processType_function:
-                            if kernel in kernel_name:
-                                read_sectors = float(
-                                    row["lts__d_sectors_fill_sysmem.sum"] or 0.0
-                                )
-                                write_sectors = float(
-                                    row["lts__t_sectors_aperture_sysmem_op_write.sum"]
-                                    or 0.0
-                                )
-                                total_traffic += (read_sectors + write_sectors) * 32
-                                break
+                _, memory_breakdown = read_ncu(csv_file_path, processType_function)
+                total_traffic = sum(memory_breakdown.values())
 
                 writer.writerow(
                     [
@@ -404,13 +415,9 @@ def postprocess_figure_16():
             for scene in dataset_list:
                 for resolution in resolution_list:
                     log_path = f"{OUTPUT_PATH}/../figure_15/neo/{scene}/{resolution}"
-                    log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-                    traffic = list()
-                    for path in log_files:
-                        traf = extract_traffic(path)
-                        if traf is not None:
-                            traffic.append(traf)
+                    traffic = [
+                        traf for _, _, traf in read_logs(log_path) if traf is not None
+                    ]
 
                     writer.writerow(
                         [
@@ -474,13 +481,9 @@ def postprocess_figure_17():
             for scene in dataset_list:
                 for resolution in resolution_list:
                     log_path = f"{OUTPUT_PATH}/A/neo/{scene}/{resolution}"
-                    log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-                    latency = list()
-                    for path in log_files:
-                        lat = extract_latency(path)
-                        if lat is not None:
-                            latency.append(lat)
+                    latency = [
+                        lat for _, lat, _ in read_logs(log_path) if lat is not None
+                    ]
 
                     writer.writerow(
                         [
@@ -508,13 +511,7 @@ def postprocess_figure_17():
 
             for step in [1, 2, 4, 8, 16]:
                 log_path = f"{OUTPUT_PATH}/B/step-{step}/neo/{scene}/{resolution}"
-                log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-                latency = list()
-                for path in log_files:
-                    lat = extract_latency(path)
-                    if lat is not None:
-                        latency.append(lat)
+                latency = [lat for _, lat, _ in read_logs(log_path) if lat is not None]
 
                 writer.writerow(
                     [
@@ -548,13 +545,9 @@ def postprocess_figure_18():
             )
 
             log_path = f"{OUTPUT_PATH}/../figure_17/B/step-1/neo/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
             latency = list()
             traffic = list()
-            for path in log_files:
-                lat = extract_latency(path)
-                traf = extract_traffic(path)
+            for _, lat, traf in read_logs(log_path):
                 if lat is not None:
                     latency.append(lat)
                 if traf is not None:
@@ -571,13 +564,9 @@ def postprocess_figure_18():
             )
 
             log_path = f"{OUTPUT_PATH}/neo_s/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
             latency = list()
             traffic = list()
-            for path in log_files:
-                lat = extract_latency(path)
-                traf = extract_traffic(path)
+            for _, lat, traf in read_logs(log_path):
                 if lat is not None:
                     latency.append(lat)
                 if traf is not None:
@@ -601,6 +590,7 @@ def postprocess_figure_19():
     if DEVICE == "server":
         scene = "train"
         resolution = "QHD"
+        engine = MetricEngine(("PSNR", "LPIPS"))
 
         with open(f"{OUTPUT_PATH}/{DEVICE}.csv", mode="w") as writefile:
             writer = csv.writer(writefile)
@@ -617,24 +607,16 @@ def postprocess_figure_19():
             )
 
             log_path = f"{OUTPUT_PATH}/neo/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-            rows = list()
-
-            for path in log_files:
-                lat = extract_latency(path)
-                idx = int(path.split("/")[-2])
-                psnr = measure(
-                    f"{OUTPUT_PATH}/neo/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/neo/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "PSNR",
-                )
-                lpips = measure(
-                    f"{OUTPUT_PATH}/neo/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/neo/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "LPIPS",
-                )
-                rows.append((idx, lat, psnr, lpips))
+            rows = [
+                (int(path.split("/")[-2]), lat) for path, lat, _ in read_logs(log_path)
+            ]
+
+            quality = measure_renders(
+                engine,
+                f"{OUTPUT_PATH}/neo/{scene}/{resolution}",
+                [idx for idx, _ in rows],
+            )
+            rows = [row + value for row, value in zip(rows, quality)]
 
             rows.sort(key=lambda x: x[0])
 
@@ -652,24 +634,16 @@ def postprocess_figure_19():
                 )
 
             log_path = f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-            rows = list()
-
-            for path in log_files:
-                lat = extract_latency(path)
-                idx = int(path.split("/")[-2])
-                psnr = measure(
-                    f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "PSNR",
-                )
-                lpips = measure(
-                    f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "LPIPS",
-                )
-                rows.append((idx, lat, psnr, lpips))
+            rows = [
+                (int(path.split("/")[-2]), lat) for path, lat, _ in read_logs(log_path)
+            ]
+
+            quality = measure_renders(
+                engine,
+                f"{OUTPUT_PATH}/periodic_sorting/{scene}/{resolution}",
+                [idx for idx, _ in rows],
+            )
+            rows = [row + value for row, value in zip(rows, quality)]
 
             rows.sort(key=lambda x: x[0])
 
@@ -687,24 +661,16 @@ def postprocess_figure_19():
                 )
 
             log_path = f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-            rows = list()
-
-            for path in log_files:
-                lat = extract_latency(path)
-                idx = int(path.split("/")[-2])
-                psnr = measure(
-                    f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "PSNR",
-                )
-                lpips = measure(
-                    f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "LPIPS",
-                )
-                rows.append((idx, lat, psnr, lpips))
+            rows = [
+                (int(path.split("/")[-2]), lat) for path, lat, _ in read_logs(log_path)
+            ]
+
+            quality = measure_renders(
+                engine,
+                f"{OUTPUT_PATH}/neo_hs/{scene}/{resolution}",
+                [idx for idx, _ in rows],
+            )
+            rows = [row + value for row, value in zip(rows, quality)]
 
             rows.sort(key=lambda x: x[0])
 
@@ -724,35 +690,21 @@ def postprocess_figure_19():
             log_path = (
                 f"{OUTPUT_PATH}/sort_time/background_sorting/{scene}/{resolution}"
             )
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-            background_latency = list()
-
-            for path in log_files:
-                lat = extract_latency(path)
-                background_latency.append(lat)
+            background_latency = [lat for _, lat, _ in read_logs(log_path)]
 
             background_mean_latency = arithmetric_mean(background_latency) / 6
 
             log_path = f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}"
-            log_files = glob.glob(f"{log_path}/trace/*/sim.log")
-
-            rows = list()
-
-            for path in log_files:
-                lat = extract_latency(path)
-                idx = int(path.split("/")[-2])
-                psnr = measure(
-                    f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "PSNR",
-                )
-                lpips = measure(
-                    f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}/gt/{idx:05d}.png",
-                    f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}/renders/{idx:05d}.png",
-                    "LPIPS",
-                )
-                rows.append((idx, lat, psnr, lpips))
+            rows = [
+                (int(path.split("/")[-2]), lat) for path, lat, _ in read_logs(log_path)
+            ]
+
+            quality = measure_renders(
+                engine,
+                f"{OUTPUT_PATH}/background_sorting/{scene}/{resolution}",
+                [idx for idx, _ in rows],
+            )
+            rows = [row + value for row, value in zip(rows, quality)]
 
             rows.sort(key=lambda x: x[0])
 
@@ -776,6 +728,7 @@ def postprocess_table_2():
 
     if DEVICE == "server":
         resolution = "QHD"
+        engine = MetricEngine(("PSNR", "LPIPS"))
 
         with open(f"{OUTPUT_PATH}/{DEVICE}.csv", mode="w") as writefile:
             writer = csv.writer(writefile)
@@ -801,24 +754,14 @@ def postprocess_table_2():
                     log_path = f"{OUTPUT_PATH}/reuse-{'true' if reuse else 'false'}/neo/{scene}/{resolution}"
                     log_files = glob.glob(f"{log_path}/renders/*.png")
 
-                    psnr_list = list()
-                    lpips_list = list()
-
-                    for path in log_files:
-                        idx = int(path.split("/")[-1].split(".")[0])
-                        psnr = measure(
-                            f"{OUTPUT_PATH}/reuse-{'true' if reuse else 'false'}/neo/{scene}/{resolution}/gt/{idx:05d}.png",
-                            f"{OUTPUT_PATH}/reuse-{'true' if reuse else 'false'}/neo/{scene}/{resolution}/renders/{idx:05d}.png",
-                            "PSNR",
-                        )
-                        lpips = measure(
-                            f"{OUTPUT_PATH}/reuse-{'true' if reuse else 'false'}/neo/{scene}/{resolution}/gt/{idx:05d}.png",
-                            f"{OUTPUT_PATH}/reuse-{'true' if reuse else 'false'}/neo/{scene}/{resolution}/renders/{idx:05d}.png",
-                            "LPIPS",
-                        )
-
-                        psnr_list.append(psnr)
-                        lpips_list.append(lpips)
+                    quality = measure_renders(
+                        engine,
+                        log_path,
+                        [int(path.split("/")[-1].split(".")[0]) for path in log_files],
+                    )
+
+                    psnr_list = [psnr for psnr, _ in quality]
+                    lpips_list = [lpips for _, lpips in quality]
 
                     writer.writerow(
                         [
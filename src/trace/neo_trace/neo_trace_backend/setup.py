@@ -17,10 +17,13 @@ setup(
         CUDAExtension(
             name="neo_trace_backend._C",
             sources=[
+                str(src_dir / "cuda_rasterizer" / "footprint.cu"),
                 str(src_dir / "cuda_rasterizer" / "forward.cu"),
                 str(src_dir / "cuda_rasterizer" / "preprocess.cu"),
                 str(src_dir / "cuda_rasterizer" / "rasterize.cu"),
                 str(src_dir / "cuda_rasterizer" / "sort.cu"),
+                str(src_dir / "cuda_rasterizer" / "state.cu"),
+                str(src_dir / "cuda_rasterizer" / "trace.cu"),
                 str(src_dir / "cuda_rasterizer" / "utils.cu"),
                 str(src_dir / "cuda_rasterizer" / "variable.cu"),
                 str(src_dir / "ext.cpp"),
@@ -1,25 +1,49 @@
 import math
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
 
 from . import _C
+from .trace import load_container, load_trace, merge_containers
 
 INITIAL_PHASE = 0
 REUSE_PHASE = 1
 
+TEXT_TRACE = 0
+BINARY_TRACE = 1
 
-def set_config(W, H, tile_size, min_tile_size, chunk_size):
+COMPARISON_SORT = 0
+RADIX_SORT = 1
+
+# The backend keeps a single global frame state, so renders run one at a
+# time on one worker and every other call waits for the pending render.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neo_trace_backend")
+_pending = None
+
+
+def _wait():
+    global _pending
+
+    if _pending is not None:
+        pending, _pending = _pending, None
+        pending.result()
+
+
+def set_config(W, H, tile_size, min_tile_size, chunk_size, num_thread=1):
+    _wait()
     args = (
         W,
         H,
         tile_size,
         min_tile_size,
         chunk_size,
+        num_thread,
     )
     _C.set_config(*args)
 
 
 def set_cam(camera):
+    _wait()
     args = (
         math.tan(camera.FoVx * 0.5),
         math.tan(camera.FoVy * 0.5),
@@ -31,6 +55,7 @@ def set_cam(camera):
 
 
 def set_gaussian(gaussians):
+    _wait()
     args = (
         gaussians.get_xyz,
         gaussians.get_opacity,
@@ -42,17 +67,152 @@ def set_gaussian(gaussians):
     _C.set_gaussian(*args)
 
 
-def set_trace(trace, trace_dir):
-    _C.set_trace(trace, trace_dir)
+def set_trace(trace, trace_dir, trace_format=TEXT_TRACE, frame=-1):
+    """Trace the next renders into trace_dir, or under frame id frame while a
+    trace container is open."""
+    _wait()
+    _C.set_trace(trace, trace_dir, trace_format, frame)
+
+
+def open_trace_container(path):
+    """Append the traces of the next renders to the container at path.
+
+    The container is created if needed; an existing one is appended to. Its
+    index is written by close_trace_container (and at exit). Read it with
+    load_container.
+    """
+    _wait()
+    _C.open_trace_container(path)
+
+
+def close_trace_container():
+    _wait()
+    _C.close_trace_container()
+
+
+def set_image(image):
+    """Whether the next renders blend an image. Without one, only the lists
+    and traces are built, and get_img() (or render_async(W, H)) raises
+    RuntimeError until a render runs with an image again."""
+    _wait()
+    _C.set_image(image)
+
+
+def set_sort_mode(sort_mode):
+    _wait()
+    _C.set_sort_mode(sort_mode)
 
 
 def set_phase(phase):
+    _wait()
     _C.set_phase(phase)
 
 
+def set_reference(num_ref):
+    _wait()
+    _C.set_reference(num_ref)
+
+
+def set_iter(iter):
+    _wait()
+    _C.set_iter(iter)
+
+
+def save_state(path):
+    """Save the reuse state the next render builds on to a binary file.
+
+    That is the reference frames (reuse lists, footprints and camera poses)
+    and the frame count, so a reuse render after load_state comes out as it
+    would have in the saving process.
+    """
+    _wait()
+    _C.save_state(path)
+
+
+def load_state(path):
+    """Restore a state saved by save_state.
+
+    This replaces set_reference and set_iter. Call after set_config and
+    set_gaussian with the resolution, tiling and Gaussians the state was
+    saved with, otherwise RuntimeError is raised. RuntimeError is also raised
+    for a truncated or corrupt file, which leaves the state unchanged.
+    """
+    _wait()
+    _C.load_state(path)
+
+
 def render():
-    _C.render()
+    """Render the current frame and return its statistics (see get_stats)."""
+    _wait()
+    return _C.render()
+
+
+def render_wait():
+    """Block until the last render and its trace file have finished.
+
+    Raises RuntimeError if a trace could not be written; render() raises it
+    too, for the trace of an earlier frame."""
+    _wait()
+    _C.flush_trace()
 
 
 def get_img(W, H):
+    """Image of the last render; raises RuntimeError if it ran without one
+    (see set_image)."""
+    _wait()
     return _C.get_img().reshape(3, H, W)
+
+
+def get_stats():
+    """Statistics of the last render.
+
+    num_new and num_reuse count the entries merged from the new and reuse
+    lists (all new entries in the initial phase), num_merge the entries of
+    the merged lists and num_drop those not kept for the next frame's reuse.
+    num_duplicated is the number of tile entries binned, num_culled the
+    number of Gaussians with radius 0. new_per_tile, reuse_per_tile and
+    merge_per_tile are int32 NumPy arrays owned by the returned object, and
+    *_ms the wall time of each render step.
+    """
+    _wait()
+    return _C.get_stats()
+
+
+def get_lists():
+    """Tile lists of the last render as read-only NumPy views.
+
+    Returns {"merge": ..., "reuse": ...}: the merged lists the frame was
+    rendered from and the reuse lists kept for the next frame (as in
+    poc.trace). Each is a dict of CSR arrays: tile i holds
+    idx[offset[i]:offset[i] + count[i]] (int32 Gaussian ids) and the same
+    range of depth (float32), where offset has NUM_TILE + 1 entries and a
+    tile may leave unused slots before the next one. "reuse" also has
+    subtile_mask, uint8 rows aligned with idx, packed as in the binary trace.
+
+    The arrays share memory with the backend's list buffers and are only
+    valid until the next render(), set_reference() or set_gaussian(); copy
+    them to keep them longer. subtile_mask is rebuilt by every call.
+    """
+    _wait()
+    return _C.get_lists()
+
+
+def _render_frame(W, H):
+    _C.render()
+
+    if W is not None and H is not None:
+        return _C.get_img().reshape(3, H, W).clone()
+
+
+def render_async(W=None, H=None):
+    """Start rendering the current frame on a background thread.
+
+    Returns a future. If ``W`` and ``H`` are given, the future resolves to a
+    copy of the rendered image. The next backend call waits for the render
+    to finish, so per-frame output handling can overlap the next frame.
+    """
+    global _pending
+
+    _wait()
+    _pending = _executor.submit(_render_frame, W, H)
+    return _pending
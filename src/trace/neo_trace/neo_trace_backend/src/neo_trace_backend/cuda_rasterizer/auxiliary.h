@@ -35,11 +35,29 @@ __device__ const float SH_C3[] = {
     1.445305721320277f,
     -0.5900435899266435f};
 
-__forceinline__ __device__ float ndc2Pix(float v, int S) {
+// Host copies of the coefficients above for the CPU preprocess
+const float SH_C0_HOST = 0.28209479177387814f;
+const float SH_C1_HOST = 0.4886025119029199f;
+const float SH_C2_HOST[] = {
+    1.0925484305920792f,
+    -1.0925484305920792f,
+    0.31539156525252005f,
+    -1.0925484305920792f,
+    0.5462742152960396f};
+const float SH_C3_HOST[] = {
+    -0.5900435899266435f,
+    2.890611442640554f,
+    -0.4570457994644658f,
+    0.3731763325901154f,
+    -0.4570457994644658f,
+    1.445305721320277f,
+    -0.5900435899266435f};
+
+__forceinline__ __host__ __device__ float ndc2Pix(float v, int S) {
     return ((v + 1.0) * S - 1.0) * 0.5;
 }
 
-__forceinline__ __device__ float3 transformPoint4x3(const float3 &p, const float *matrix) {
+__forceinline__ __host__ __device__ float3 transformPoint4x3(const float3 &p, const float *matrix) {
     float3 transformed = {
         matrix[0] * p.x + matrix[4] * p.y + matrix[8] * p.z + matrix[12],
         matrix[1] * p.x + matrix[5] * p.y + matrix[9] * p.z + matrix[13],
@@ -48,7 +66,7 @@ __forceinline__ __device__ float3 transformPoint4x3(const float3 &p, const float
     return transformed;
 }
 
-__forceinline__ __device__ float4 transformPoint4x4(const float3 &p, const float *matrix) {
+__forceinline__ __host__ __device__ float4 transformPoint4x4(const float3 &p, const float *matrix) {
     float4 transformed = {
         matrix[0] * p.x + matrix[4] * p.y + matrix[8] * p.z + matrix[12],
         matrix[1] * p.x + matrix[5] * p.y + matrix[9] * p.z + matrix[13],
@@ -111,11 +129,11 @@ __forceinline__ __device__ float sigmoid(float x) {
     return 1.0f / (1.0f + expf(-x));
 }
 
-__forceinline__ __device__ bool in_frustum(int idx,
-                                           const float *orig_points,
-                                           const float *viewmatrix,
-                                           const float *projmatrix,
-                                           float3 &p_view) {
+__forceinline__ __host__ __device__ bool in_frustum(int idx,
+                                                    const float *orig_points,
+                                                    const float *viewmatrix,
+                                                    const float *projmatrix,
+                                                    float3 &p_view) {
     float3 p_orig = {orig_points[3 * idx], orig_points[3 * idx + 1], orig_points[3 * idx + 2]};
 
     // Bring points to screen space
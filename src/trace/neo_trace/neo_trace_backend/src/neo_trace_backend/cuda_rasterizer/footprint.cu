@@ -0,0 +1,207 @@
+#include "footprint.h"
+#include "utils.h"
+#include "variable.h"
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+
+namespace poc {
+
+// Subtile results are cached as one word per tile, i.e. up to
+// tile_size / min_tile_size = 8. Larger factors are computed on demand.
+#define MAX_SUBTILE 64
+
+struct gaussian_2d_t {
+    float2 p;
+    int max_radius;
+    float e_val[2];
+    float2 e_vec[2];
+};
+
+static gaussian_2d_t load_gaussian(const int cam, const int idx) {
+    gaussian_2d_t g;
+
+    g.p = {g_gaussian_mean2D_cpu[cam][idx * 2],
+           g_gaussian_mean2D_cpu[cam][idx * 2 + 1]};
+    g.max_radius = g_gaussian_radii_cpu[cam][idx];
+
+    for (int i = 0; i < 2; i++) {
+        g.e_val[i] = g_gaussian_eigen_value_cpu[cam][i][idx];
+        g.e_vec[i] = {g_gaussian_eigen_vector_cpu[cam][i][idx * 2],
+                      g_gaussian_eigen_vector_cpu[cam][i][idx * 2 + 1]};
+    }
+
+    return g;
+}
+
+static bool tile_test(const gaussian_2d_t &g, const int tx, const int ty) {
+    return g.max_radius != 0 && obb_test(g.p,
+                                         tx, ty,
+                                         g.e_vec[0], g.e_vec[1],
+                                         g.e_val[0], g.e_val[1],
+                                         g_tile_size);
+}
+
+static bool subtile_test(const gaussian_2d_t &g, const int tx, const int ty, const int dx, const int dy) {
+    const int factor = g_tile_size / g_min_tile_size;
+
+    return obb_test(g.p,
+                    factor * tx + dx, factor * ty + dy,
+                    g.e_vec[0], g.e_vec[1],
+                    g.e_val[0], g.e_val[1],
+                    g_tile_size / factor);
+}
+
+static bool in_rect(const footprint_t &f, const int tx, const int ty) {
+    return tx >= f.rect_min_x && tx < f.rect_max_x && ty >= f.rect_min_y && ty < f.rect_max_y;
+}
+
+// Position of tile (tx, ty) within the rect, matching the tx-outer loops of sort
+static int64_t rect_index(const footprint_t &f, const int tx, const int ty) {
+    return (int64_t)(tx - f.rect_min_x) * (f.rect_max_y - f.rect_min_y) + (ty - f.rect_min_y);
+}
+
+void compute_footprint() {
+    const uint2 grid = {TILE_WIDTH, TILE_HEIGHT};
+    const int cam = g_curr_cam;
+    const int ref = g_curr_ref;
+    const int factor = g_tile_size / g_min_tile_size;
+    const bool cache_subtile = g_trace && factor * factor <= MAX_SUBTILE;
+
+    auto &footprint = g_footprint[ref];
+    footprint.resize(g_P);
+
+    parallel_range(g_num_thread, g_P, [&](const int, const int begin, const int end) {
+        for (int idx = begin; idx < end; idx++) {
+            const float2 p = {g_gaussian_mean2D_cpu[cam][idx * 2],
+                              g_gaussian_mean2D_cpu[cam][idx * 2 + 1]};
+            const int max_radius = g_gaussian_radii_cpu[cam][idx];
+
+            footprint_t &f = footprint[idx];
+
+            if (max_radius == 0) {
+                f.rect_min_x = f.rect_min_y = f.rect_max_x = f.rect_max_y = 0;
+                continue;
+            }
+
+            const uint2 rect_min = {
+                min(grid.x, max((int)0, (int)((p.x - max_radius) / g_tile_size))),
+                min(grid.y, max((int)0, (int)((p.y - max_radius) / g_tile_size)))};
+            const uint2 rect_max = {
+                min(grid.x, max((int)0, (int)((p.x + max_radius + g_tile_size - 1) / g_tile_size))),
+                min(grid.y, max((int)0, (int)((p.y + max_radius + g_tile_size - 1) / g_tile_size)))};
+
+            f.rect_min_x = rect_min.x;
+            f.rect_min_y = rect_min.y;
+            f.rect_max_x = max(rect_min.x, rect_max.x);
+            f.rect_max_y = max(rect_min.y, rect_max.y);
+        }
+    });
+
+    int64_t num_word = 0;
+    int64_t num_rect_tile = 0;
+
+    for (auto &f : footprint) {
+        const int64_t area = (int64_t)(f.rect_max_x - f.rect_min_x) * (f.rect_max_y - f.rect_min_y);
+
+        f.mask_offset = num_word;
+        f.subtile_offset = num_rect_tile;
+
+        num_word += (area + 63) / 64;
+        num_rect_tile += area;
+    }
+
+    // Every Gaussian owns whole words, so workers never share one
+    g_footprint_mask[ref].assign(num_word, 0);
+
+    if (cache_subtile)
+        g_footprint_subtile[ref].assign(num_rect_tile, 0);
+    else
+        g_footprint_subtile[ref].clear();
+
+    parallel_range(g_num_thread, g_P, [&](const int, const int begin, const int end) {
+        for (int idx = begin; idx < end; idx++) {
+            const footprint_t &f = footprint[idx];
+            const gaussian_2d_t g = load_gaussian(g_curr_cam, idx);
+
+            uint64_t *mask = &g_footprint_mask[ref][f.mask_offset];
+
+            for (int tx = f.rect_min_x; tx < f.rect_max_x; tx++)
+                for (int ty = f.rect_min_y; ty < f.rect_max_y; ty++) {
+                    if (!tile_test(g, tx, ty))
+                        continue;
+
+                    const int64_t bit = rect_index(f, tx, ty);
+                    mask[bit / 64] |= (uint64_t)1 << (bit % 64);
+
+                    if (!cache_subtile)
+                        continue;
+
+                    uint64_t subtiles = 0;
+                    for (int dx = 0; dx < factor; dx++)
+                        for (int dy = 0; dy < factor; dy++)
+                            if (subtile_test(g, tx, ty, dx, dy))
+                                subtiles |= (uint64_t)1 << (factor * dy + dx);
+
+                    g_footprint_subtile[ref][f.subtile_offset + bit] = subtiles;
+                }
+        }
+    });
+}
+
+void reset_footprint() {
+    const int num_slot = g_num_ref + 1;
+
+    g_footprint.assign(num_slot, {});
+    g_footprint_mask.assign(num_slot, {});
+    g_footprint_subtile.assign(num_slot, {});
+}
+
+bool footprint_contains(const int ref, const int idx, const int tx, const int ty) {
+    if (idx >= g_footprint[ref].size())
+        return false;
+
+    const footprint_t &f = g_footprint[ref][idx];
+    if (!in_rect(f, tx, ty))
+        return false;
+
+    const int64_t bit = rect_index(f, tx, ty);
+    return (g_footprint_mask[ref][f.mask_offset + bit / 64] >> (bit % 64)) & 1;
+}
+
+bool footprint_overlap(const int idx, const int tx, const int ty) {
+    const int ref = g_curr_ref;
+
+    // The oriented box can reach past the radius-bounded rect
+    if (idx < g_footprint[ref].size() && in_rect(g_footprint[ref][idx], tx, ty))
+        return footprint_contains(ref, idx, tx, ty);
+
+    return tile_test(load_gaussian(g_curr_cam, idx), tx, ty);
+}
+
+void footprint_subtile(const int ref, const int cam, const int tile, const int idx, std::vector<bool> &subtiles) {
+    const int factor = g_tile_size / g_min_tile_size;
+    const int tx = tile % TILE_WIDTH;
+    const int ty = tile / TILE_WIDTH;
+
+    subtiles.clear();
+    subtiles.resize(factor * factor);
+
+    if (!g_footprint_subtile[ref].empty() && footprint_contains(ref, idx, tx, ty)) {
+        const footprint_t &f = g_footprint[ref][idx];
+        const uint64_t mask = g_footprint_subtile[ref][f.subtile_offset + rect_index(f, tx, ty)];
+
+        for (int k = 0; k < factor * factor; k++)
+            subtiles[k] = (mask >> k) & 1;
+        return;
+    }
+
+    const gaussian_2d_t g = load_gaussian(cam, idx);
+
+    for (int dx = 0; dx < factor; dx++)
+        for (int dy = 0; dy < factor; dy++)
+            if (subtile_test(g, tx, ty, dx, dy))
+                subtiles[factor * dy + dx] = true;
+}
+
+} // namespace poc
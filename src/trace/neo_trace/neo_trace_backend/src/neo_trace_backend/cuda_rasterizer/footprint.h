@@ -0,0 +1,32 @@
+#ifndef FOOTPRINT_H
+#define FOOTPRINT_H
+
+#include <vector>
+
+namespace poc {
+
+// Footprint of Gaussian idx: the radius-bounded tile rect used by sort, and
+// one bit per tile of the rect (column-major, tx outer) that is set where
+// obb_test passes. While tracing, the subtile obb_test result of each tile
+// of the rect is kept as well (bit factor * dy + dx).
+//
+// Footprints are computed once per frame into reference slot g_curr_ref and
+// stay there while the slot is a reference frame (see variable.h).
+void compute_footprint();
+
+// Drops all footprints and sizes the storage for g_num_ref + 1 slots.
+void reset_footprint();
+
+// Inside the rect and passing obb_test (the test sort uses) in slot ref.
+bool footprint_contains(const int ref, const int idx, const int tx, const int ty);
+
+// Equivalent to max_radius != 0 && obb_test(...) for any tile, current frame.
+bool footprint_overlap(const int idx, const int tx, const int ty);
+
+// Subtile obb_test results of Gaussian idx in tile, for the frame whose
+// footprints are in slot ref and 2D Gaussians in camera buffer cam.
+void footprint_subtile(const int ref, const int cam, const int tile, const int idx, std::vector<bool> &subtiles);
+
+} // namespace poc
+
+#endif
@@ -1,10 +1,16 @@
+#include "footprint.h"
 #include "forward.h"
 #include "preprocess.h"
 #include "rasterize.h"
 #include "sort.h"
+#include "trace.h"
 #include "utils.h"
 #include "variable.h"
-#include <fstream>
+
+#include <chrono>
+#include <exception>
+#include <memory>
+#include <stdexcept>
 
 namespace poc {
 
@@ -37,16 +43,21 @@ static torch::Tensor l_gaussian_eigen_value_cpu[2][2];
 static torch::Tensor l_gaussian_is_frustum_culled_cpu[2];
 
 static torch::Tensor img;
+// Whether the last render blended an image; g_raw_img is stale or
+// uninitialized otherwise
+static bool l_img_valid = false;
 
 void set_config(const int W, const int H,
                 const int tile_size,
                 const int min_tile_size,
-                const int chunk_size) {
+                const int chunk_size,
+                const int num_thread) {
     g_W = W;
     g_H = H;
     g_tile_size = tile_size;
     g_min_tile_size = min_tile_size;
     g_chunk_size = chunk_size;
+    g_num_thread = num_thread;
 }
 
 void set_cam(const float tan_fovx, const float tan_fovy,
@@ -56,13 +67,34 @@ void set_cam(const float tan_fovx, const float tan_fovy,
     g_cam[g_curr_cam].tan_fovx = tan_fovx;
     g_cam[g_curr_cam].tan_fovy = tan_fovy;
 
-    l_view_matrix[g_curr_cam] = view_matrix.contiguous();
-    l_proj_matrix[g_curr_cam] = proj_matrix.contiguous();
-    l_cam_pos[g_curr_cam] = cam_pos.contiguous();
+    // Keep the camera on the same device as the Gaussians (see set_gaussian)
+    auto device = l_gaussian_mean3D.device();
+
+    l_view_matrix[g_curr_cam] = view_matrix.to(device).contiguous();
+    l_proj_matrix[g_curr_cam] = proj_matrix.to(device).contiguous();
+    l_cam_pos[g_curr_cam] = cam_pos.to(device).contiguous();
 
     g_cam[g_curr_cam].view_matrix = l_view_matrix[g_curr_cam].data_ptr<float>();
     g_cam[g_curr_cam].proj_matrix = l_proj_matrix[g_curr_cam].data_ptr<float>();
     g_cam[g_curr_cam].cam_pos = l_cam_pos[g_curr_cam].data_ptr<float>();
+
+    // Pose the reuse phase compares reference frames against
+    auto view_matrix_cpu = view_matrix.to(torch::kCPU).contiguous();
+    std::copy(view_matrix_cpu.data_ptr<float>(), view_matrix_cpu.data_ptr<float>() + 16, g_ref_pose[g_curr_ref].begin());
+}
+
+// Host buffer the 2D Gaussians of tensor are copied into after preprocess.
+// Pinned so that the per-frame copy runs at full bandwidth. CPU tensors are
+// used directly.
+static torch::Tensor alloc_staging(const torch::Tensor &tensor) {
+    if (!tensor.is_cuda())
+        return tensor;
+
+    return torch::empty(tensor.sizes(), tensor.options().device(torch::kCPU).pinned_memory(true));
+}
+
+static void stage(torch::Tensor &staging, const torch::Tensor &tensor) {
+    staging.copy_(tensor, /*non_blocking=*/true);
 }
 
 void set_gaussian(const torch::Tensor &gaussian_mean3D,
@@ -74,6 +106,10 @@ void set_gaussian(const torch::Tensor &gaussian_mean3D,
     auto int_opts = gaussian_mean3D.options().dtype(torch::kInt32);
     auto float_opts = gaussian_mean3D.options().dtype(torch::kFloat32);
 
+    // Gaussians on the CPU select the CPU preprocess. All 2D buffers are then
+    // allocated on the CPU and render() uses them without a device copy.
+    g_cpu_preprocess = !gaussian_mean3D.is_cuda();
+
     g_P = gaussian_mean3D.size(0);
     g_D = degree_of_SH;
     g_M = gaussian_SH.size(1);
@@ -90,6 +126,8 @@ void set_gaussian(const torch::Tensor &gaussian_mean3D,
     g_gaussian_rotation = l_gaussian_rotation.data_ptr<float>();
     g_gaussian_SH = l_gaussian_SH.data_ptr<float>();
 
+    reset_reference();
+
     for (int cam = 0; cam < 2; cam++) {
         l_gaussian_mean2D[cam] = torch::zeros({g_P, 2}, float_opts);
         l_gaussian_conic_opacity[cam] = torch::zeros({g_P, 4}, float_opts);
@@ -105,24 +143,63 @@ void set_gaussian(const torch::Tensor &gaussian_mean3D,
         g_gaussian_depth[cam] = l_gaussian_depth[cam].data_ptr<float>();
         g_gaussian_is_frustum_culled[cam] = l_gaussian_is_frustum_culled[cam].data_ptr<int>();
 
+        l_gaussian_mean2D_cpu[cam] = alloc_staging(l_gaussian_mean2D[cam]);
+        l_gaussian_conic_opacity_cpu[cam] = alloc_staging(l_gaussian_conic_opacity[cam]);
+        l_gaussian_rgb_cpu[cam] = alloc_staging(l_gaussian_rgb[cam]);
+        l_gaussian_radii_cpu[cam] = alloc_staging(l_gaussian_radii[cam]);
+        l_gaussian_depth_cpu[cam] = alloc_staging(l_gaussian_depth[cam]);
+        l_gaussian_is_frustum_culled_cpu[cam] = alloc_staging(l_gaussian_is_frustum_culled[cam]);
+
+        g_gaussian_mean2D_cpu[cam] = l_gaussian_mean2D_cpu[cam].data_ptr<float>();
+        g_gaussian_conic_opacity_cpu[cam] = l_gaussian_conic_opacity_cpu[cam].data_ptr<float>();
+        g_gaussian_rgb_cpu[cam] = l_gaussian_rgb_cpu[cam].data_ptr<float>();
+        g_gaussian_radii_cpu[cam] = l_gaussian_radii_cpu[cam].data_ptr<int>();
+        g_gaussian_depth_cpu[cam] = l_gaussian_depth_cpu[cam].data_ptr<float>();
+        g_gaussian_is_frustum_culled_cpu[cam] = l_gaussian_is_frustum_culled_cpu[cam].data_ptr<int>();
+
         for (int i = 0; i < 2; i++) {
-            l_gaussian_eigen_vector[cam][i] = torch::zeros({g_P, 3}, float_opts);
+            l_gaussian_eigen_vector[cam][i] = torch::zeros({g_P, 2}, float_opts);
             l_gaussian_eigen_value[cam][i] = torch::zeros({g_P}, float_opts);
             g_gaussian_eigen_vector[cam][i] = l_gaussian_eigen_vector[cam][i].data_ptr<float>();
             g_gaussian_eigen_value[cam][i] = l_gaussian_eigen_value[cam][i].data_ptr<float>();
+
+            l_gaussian_eigen_vector_cpu[cam][i] = alloc_staging(l_gaussian_eigen_vector[cam][i]);
+            l_gaussian_eigen_value_cpu[cam][i] = alloc_staging(l_gaussian_eigen_value[cam][i]);
+            g_gaussian_eigen_vector_cpu[cam][i] = l_gaussian_eigen_vector_cpu[cam][i].data_ptr<float>();
+            g_gaussian_eigen_value_cpu[cam][i] = l_gaussian_eigen_value_cpu[cam][i].data_ptr<float>();
         }
     }
 }
 
-void set_trace(bool trace, const std::string trace_dir) {
+void set_trace(bool trace, const std::string trace_dir, int trace_format, int frame) {
     g_trace = trace;
     g_trace_dir = trace_dir;
+    g_trace_format = trace_format;
+    g_trace_frame = frame;
+}
+
+void set_image(bool image) {
+    g_image = image;
+}
+
+void set_sort_mode(int sort_mode) {
+    g_sort_mode = sort_mode;
 }
 
 void set_phase(int phase) {
     g_phase = phase;
 }
 
+void set_reference(int num_ref) {
+    g_num_ref = num_ref;
+    reset_reference();
+}
+
+// Frame count so far; its parity picks the chunk offsets of the reuse sort
+void set_iter(int iter) {
+    g_iter = iter;
+}
+
 static torch::Tensor wrap_pointer_to_tensor(float *array, int size) {
     auto options = torch::TensorOptions().dtype(torch::kFloat32).requires_grad(false);
     torch::Tensor tensor = torch::from_blob(array, {size}, options);
@@ -130,220 +207,138 @@ static torch::Tensor wrap_pointer_to_tensor(float *array, int size) {
     return tensor;
 }
 
-void render() {
-    preprocess();
+// Milliseconds since t, then restarts t
+static double lap(std::chrono::steady_clock::time_point &t) {
+    const auto now = std::chrono::steady_clock::now();
+    const double ms = std::chrono::duration<double, std::milli>(now - t).count();
 
-    l_gaussian_mean2D_cpu[g_curr_cam] = l_gaussian_mean2D[g_curr_cam].cpu().contiguous();
-    l_gaussian_conic_opacity_cpu[g_curr_cam] = l_gaussian_conic_opacity[g_curr_cam].cpu().contiguous();
-    l_gaussian_rgb_cpu[g_curr_cam] = l_gaussian_rgb[g_curr_cam].cpu().contiguous();
-    l_gaussian_radii_cpu[g_curr_cam] = l_gaussian_radii[g_curr_cam].cpu().contiguous();
-    l_gaussian_depth_cpu[g_curr_cam] = l_gaussian_depth[g_curr_cam].cpu().contiguous();
-    l_gaussian_is_frustum_culled_cpu[g_curr_cam] = l_gaussian_is_frustum_culled[g_curr_cam].cpu().contiguous();
-
-    g_gaussian_mean2D_cpu[g_curr_cam] = l_gaussian_mean2D_cpu[g_curr_cam].data_ptr<float>();
-    g_gaussian_conic_opacity_cpu[g_curr_cam] = l_gaussian_conic_opacity_cpu[g_curr_cam].data_ptr<float>();
-    g_gaussian_rgb_cpu[g_curr_cam] = l_gaussian_rgb_cpu[g_curr_cam].data_ptr<float>();
-    g_gaussian_radii_cpu[g_curr_cam] = l_gaussian_radii_cpu[g_curr_cam].data_ptr<int>();
-    g_gaussian_depth_cpu[g_curr_cam] = l_gaussian_depth_cpu[g_curr_cam].data_ptr<float>();
-    g_gaussian_is_frustum_culled_cpu[g_curr_cam] = l_gaussian_is_frustum_culled_cpu[g_curr_cam].data_ptr<int>();
-
-    for (int i = 0; i < 2; i++) {
-        l_gaussian_eigen_vector_cpu[g_curr_cam][i] = l_gaussian_eigen_vector[g_curr_cam][i].cpu().contiguous();
-        l_gaussian_eigen_value_cpu[g_curr_cam][i] = l_gaussian_eigen_value[g_curr_cam][i].cpu().contiguous();
-
-        g_gaussian_eigen_vector_cpu[g_curr_cam][i] = l_gaussian_eigen_vector_cpu[g_curr_cam][i].data_ptr<float>();
-        g_gaussian_eigen_value_cpu[g_curr_cam][i] = l_gaussian_eigen_value_cpu[g_curr_cam][i].data_ptr<float>();
-    }
+    t = now;
+    return ms;
+}
 
-    sort();
+std::shared_ptr<stats_t> render() {
+    auto t = std::chrono::steady_clock::now();
 
-    std::vector<int> num_new_duplicated_gaussian_per_tile;
-    std::vector<int> num_reuse_duplicated_gaussian_per_tile;
+    preprocess();
 
-    if (g_trace) {
-        if (g_phase == REUSE_PHASE) {
-            num_new_duplicated_gaussian_per_tile.resize(NUM_TILE);
-            num_reuse_duplicated_gaussian_per_tile.resize(NUM_TILE);
-
-            for (int i = 0; i < NUM_TILE; i++) {
-                num_new_duplicated_gaussian_per_tile[i] = g_gaussian_per_tile[i].size();
-                num_reuse_duplicated_gaussian_per_tile[i] = g_reuse_gaussian_per_tile[i].size();
-            }
-        } else {
-            num_new_duplicated_gaussian_per_tile.resize(NUM_TILE);
-
-            for (int i = 0; i < NUM_TILE; i++)
-                num_new_duplicated_gaussian_per_tile[i] = g_gaussian_per_tile[i].size();
+    // Refill the staging buffers allocated in set_gaussian. Colors and conics
+    // are only read when blending, and the frustum culling result only by the
+    // trace writer.
+    if (!g_cpu_preprocess) {
+        stage(l_gaussian_mean2D_cpu[g_curr_cam], l_gaussian_mean2D[g_curr_cam]);
+        stage(l_gaussian_radii_cpu[g_curr_cam], l_gaussian_radii[g_curr_cam]);
+        stage(l_gaussian_depth_cpu[g_curr_cam], l_gaussian_depth[g_curr_cam]);
+
+        for (int i = 0; i < 2; i++) {
+            stage(l_gaussian_eigen_vector_cpu[g_curr_cam][i], l_gaussian_eigen_vector[g_curr_cam][i]);
+            stage(l_gaussian_eigen_value_cpu[g_curr_cam][i], l_gaussian_eigen_value[g_curr_cam][i]);
+        }
+
+        if (g_image) {
+            stage(l_gaussian_conic_opacity_cpu[g_curr_cam], l_gaussian_conic_opacity[g_curr_cam]);
+            stage(l_gaussian_rgb_cpu[g_curr_cam], l_gaussian_rgb[g_curr_cam]);
         }
+
+        if (g_trace)
+            stage(l_gaussian_is_frustum_culled_cpu[g_curr_cam], l_gaussian_is_frustum_culled[g_curr_cam]);
+
+        cudaDeviceSynchronize();
     }
 
+    g_stats.num_culled = 0;
+    for (int i = 0; i < g_P; i++)
+        g_stats.num_culled += g_gaussian_radii_cpu[g_curr_cam][i] == 0;
+
+    g_stats.preprocess_ms = lap(t);
+
+    compute_footprint();
+    g_stats.footprint_ms = lap(t);
+
+    sort();
+    g_stats.sort_ms = lap(t);
+
     rasterize();
+    g_stats.rasterize_ms = lap(t);
 
     img = wrap_pointer_to_tensor(g_raw_img, g_W * g_H * NUM_CHANNELS);
+    l_img_valid = g_image;
 
+    // A failed earlier trace write is rethrown once this frame is complete
+    std::exception_ptr trace_error;
     if (g_trace) {
-        if (g_phase == REUSE_PHASE) {
-            std::ofstream trace_file(g_trace_dir + "/poc.trace");
-            if (trace_file.is_open()) {
-                trace_file << g_W << "\n";
-                trace_file << g_H << "\n";
-                trace_file << g_tile_size << "\n";
-                trace_file << g_min_tile_size << "\n";
-                trace_file << g_chunk_size << "\n";
-                trace_file << g_P << "\n";
-                trace_file << NUM_TILE << "\n";
-
-                for (int i = 0; i < g_P; i++) {
-                    trace_file << g_gaussian_is_frustum_culled_cpu[g_curr_cam][i] << "\n";
-                    trace_file << g_duplicated_gaussian[i].size() << "\n";
-
-                    for (auto e : g_duplicated_gaussian[i])
-                        trace_file << e << " ";
-
-                    if (g_duplicated_gaussian[i].size() > 0)
-                        trace_file << "\n";
-                }
-
-                for (int i = 0; i < NUM_TILE; i++) {
-                    trace_file << num_new_duplicated_gaussian_per_tile[i] << "\n";
-                    trace_file << num_reuse_duplicated_gaussian_per_tile[i] << "\n";
-                    trace_file << g_reuse_gaussian_per_tile[i].size() << "\n";
-
-                    for (auto e : g_reuse_gaussian_per_tile[i]) {
-                        trace_file << e.idx << " ";
-
-                        const float2 p = {g_gaussian_mean2D_cpu[g_curr_cam][e.idx * 2],
-                                          g_gaussian_mean2D_cpu[g_curr_cam][e.idx * 2 + 1]};
-
-                        float gaussian_e_val[2];
-                        float2 gaussian_e_vec[2];
-
-                        for (int j = 0; j < 2; j++) {
-                            gaussian_e_val[j] = g_gaussian_eigen_value_cpu[g_curr_cam][j][e.idx];
-                            gaussian_e_vec[j] = {g_gaussian_eigen_vector_cpu[g_curr_cam][j][e.idx * 2],
-                                                 g_gaussian_eigen_vector_cpu[g_curr_cam][j][e.idx * 2 + 1]};
-                        }
-
-                        std::vector<bool> subtiles;
-
-                        int factor = g_tile_size / g_min_tile_size;
-
-                        subtiles.clear();
-                        subtiles.resize(factor * factor);
-
-                        int tx = i % TILE_WIDTH;
-                        int ty = i / TILE_WIDTH;
-
-                        for (int dx = 0; dx < factor; dx++)
-                            for (int dy = 0; dy < factor; dy++) {
-                                if (obb_test(p,
-                                             factor * tx + dx, factor * ty + dy,
-                                             gaussian_e_vec[0], gaussian_e_vec[1],
-                                             gaussian_e_val[0], gaussian_e_val[1],
-                                             g_tile_size / factor))
-                                    subtiles[factor * dy + dx] = true;
-                            }
-
-                        for (auto subtile : subtiles)
-                            trace_file << subtile << " ";
-
-                        trace_file << "\n";
-                    }
-
-                    if (g_reuse_gaussian_per_tile[i].size() > 0)
-                        trace_file << "\n";
-                }
-
-                trace_file.close();
-            } else {
-                std::cerr << "Unable to open trace file\n";
-            }
-        } else {
-            std::ofstream trace_file(g_trace_dir + "/poc.trace");
-            if (trace_file.is_open()) {
-                trace_file << g_W << "\n";
-                trace_file << g_H << "\n";
-                trace_file << g_tile_size << "\n";
-                trace_file << g_min_tile_size << "\n";
-                trace_file << g_chunk_size << "\n";
-                trace_file << g_P << "\n";
-                trace_file << NUM_TILE << "\n";
-
-                for (int i = 0; i < g_P; i++) {
-                    trace_file << g_gaussian_is_frustum_culled_cpu[g_curr_cam][i] << "\n";
-                    trace_file << g_duplicated_gaussian[i].size() << "\n";
-
-                    for (auto e : g_duplicated_gaussian[i])
-                        trace_file << e << " ";
-
-                    if (g_duplicated_gaussian[i].size() > 0)
-                        trace_file << "\n";
-                }
-
-                for (int i = 0; i < NUM_TILE; i++) {
-                    trace_file << num_new_duplicated_gaussian_per_tile[i] << "\n";
-                    trace_file << 0 << "\n";
-                    trace_file << g_reuse_gaussian_per_tile[i].size() << "\n";
-
-                    for (auto e : g_reuse_gaussian_per_tile[i]) {
-                        trace_file << e.idx << " ";
-
-                        const float2 p = {g_gaussian_mean2D_cpu[g_curr_cam][e.idx * 2],
-                                          g_gaussian_mean2D_cpu[g_curr_cam][e.idx * 2 + 1]};
-
-                        float gaussian_e_val[2];
-                        float2 gaussian_e_vec[2];
-
-                        for (int j = 0; j < 2; j++) {
-                            gaussian_e_val[j] = g_gaussian_eigen_value_cpu[g_curr_cam][j][e.idx];
-                            gaussian_e_vec[j] = {g_gaussian_eigen_vector_cpu[g_curr_cam][j][e.idx * 2],
-                                                 g_gaussian_eigen_vector_cpu[g_curr_cam][j][e.idx * 2 + 1]};
-                        }
-
-                        std::vector<bool> subtiles;
-
-                        int factor = g_tile_size / g_min_tile_size;
-
-                        subtiles.clear();
-                        subtiles.resize(factor * factor);
-
-                        int tx = i % TILE_WIDTH;
-                        int ty = i / TILE_WIDTH;
-
-                        for (int dx = 0; dx < factor; dx++)
-                            for (int dy = 0; dy < factor; dy++) {
-                                if (obb_test(p,
-                                             factor * tx + dx, factor * ty + dy,
-                                             gaussian_e_vec[0], gaussian_e_vec[1],
-                                             gaussian_e_val[0], gaussian_e_val[1],
-                                             g_tile_size / factor))
-                                    subtiles[factor * dy + dx] = true;
-                            }
-
-                        for (auto subtile : subtiles)
-                            trace_file << subtile << " ";
-
-                        trace_file << "\n";
-                    }
-
-                    if (g_reuse_gaussian_per_tile[i].size() > 0)
-                        trace_file << "\n";
-                }
-
-                trace_file.close();
-            } else {
-                std::cerr << "Unable to open trace file\n";
-            }
+        try {
+            write_trace(g_stats.new_per_tile, g_stats.reuse_per_tile);
+        } catch (...) {
+            trace_error = std::current_exception();
         }
     }
+    g_stats.trace_ms = lap(t);
 
     g_iter++;
     g_prev_cam = (g_prev_cam ? 0 : 1);
     g_curr_cam = (g_curr_cam ? 0 : 1);
+
+    advance_reference();
+
+    if (trace_error)
+        std::rethrow_exception(trace_error);
+
+    return get_stats();
 }
 
 torch::Tensor get_img() {
+    if (!l_img_valid)
+        throw std::runtime_error("No image: the last render ran with set_image(false), or none ran");
+
     return img;
 }
 
+// A copy, so the per-tile arrays handed to Python outlive later renders
+std::shared_ptr<stats_t> get_stats() {
+    return std::make_shared<stats_t>(g_stats);
+}
+
+// Slot the last render left its reuse lists in; render advances g_curr_ref
+static int last_ref() {
+    return (g_curr_ref + g_num_ref) % (g_num_ref + 1);
+}
+
+csr_list_t<tile_key_t> &get_merge_list() {
+    return g_merge_gaussian_per_tile;
+}
+
+csr_list_t<tile_key_t> &get_reuse_list() {
+    return g_reuse_gaussian_per_tile[last_ref()];
+}
+
+// Rebuilt on every call, reusing its capacity
+static std::vector<uint8_t> l_subtile_mask;
+
+const std::vector<uint8_t> &get_subtile_mask() {
+    const int factor = g_tile_size / g_min_tile_size;
+    const int num_subtile = factor * factor;
+    const int subtile_mask_size = (num_subtile + 7) / 8;
+    const int ref = last_ref();
+
+    // The last render's 2D Gaussians are in g_prev_cam until the next render
+    auto &reuse = get_reuse_list();
+
+    l_subtile_mask.assign(reuse.key.size() * subtile_mask_size, 0);
+
+    parallel_for(g_num_thread, reuse.size(), [&](const int, const int i) {
+        thread_local std::vector<bool> subtiles;
+
+        for (const tile_key_t *e = reuse.begin(i); e != reuse.end(i); e++) {
+            footprint_subtile(ref, g_prev_cam, i, e->idx, subtiles);
+
+            uint8_t *mask = &l_subtile_mask[(e - reuse.key.data()) * subtile_mask_size];
+            for (int k = 0; k < num_subtile; k++)
+                if (subtiles[k])
+                    mask[k / 8] |= (1 << (k % 8));
+        }
+    });
+
+    return l_subtile_mask;
+}
+
 } // namespace poc
@@ -5,12 +5,17 @@
 #include <cuda_runtime.h>
 #include <torch/extension.h>
 
+#include "variable.h"
+
+#include <memory>
+
 namespace poc {
 
 void set_config(const int W, const int H,
                 const int tile_size,
                 const int min_tile_size,
-                const int chunk_size);
+                const int chunk_size,
+                const int num_thread);
 
 void set_cam(const float tan_fovx, const float tan_fovy,
              const torch::Tensor &view_matrix,
@@ -24,14 +29,46 @@ void set_gaussian(const torch::Tensor &gaussian_mean3D,
                   const torch::Tensor &gaussian_SH,
                   const int degree_of_SH);
 
-void set_trace(bool trace, const std::string trace_dir);
+void set_trace(bool trace, const std::string trace_dir, int trace_format, int frame);
+
+void set_image(bool image);
+
+void set_sort_mode(int sort_mode);
 
 void set_phase(int phase);
 
-void render();
+void set_reference(int num_ref);
+
+void set_iter(int iter);
+
+std::shared_ptr<stats_t> render();
+
+void flush_trace();
+
+void open_trace_container(const std::string path);
 
+void close_trace_container();
+
+void save_state(const std::string path);
+
+void load_state(const std::string path);
+
+// Throws std::runtime_error unless the last render ran with an image
 torch::Tensor get_img();
 
+std::shared_ptr<stats_t> get_stats();
+
+// Merged lists and reuse lists (kept for the next frame) of the last render.
+// These are the backend's buffers, valid until the next render,
+// set_reference or set_gaussian.
+csr_list_t<tile_key_t> &get_merge_list();
+
+csr_list_t<tile_key_t> &get_reuse_list();
+
+// Subtile masks of the reuse list entries: subtile_mask_size bytes per key
+// slot of get_reuse_list(), packed as in the binary trace (see trace.h)
+const std::vector<uint8_t> &get_subtile_mask();
+
 } // namespace poc
 
 #endif
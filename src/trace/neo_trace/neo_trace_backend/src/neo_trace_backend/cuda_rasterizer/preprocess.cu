@@ -1,5 +1,6 @@
 #include "auxiliary.h"
 #include "preprocess.h"
+#include "utils.h"
 #include "variable.h"
 
 #include <cooperative_groups.h>
@@ -13,7 +14,7 @@ namespace cg = cooperative_groups;
 
 namespace poc {
 
-__device__ void computeCov3D(const glm::vec3 scale, const glm::vec4 rot, float *cov3D) {
+__host__ __device__ void computeCov3D(const glm::vec3 scale, const glm::vec4 rot, float *cov3D) {
     glm::mat3 S = glm::mat3(1.0f);
     S[0][0] = scale.x;
     S[1][1] = scale.y;
@@ -42,7 +43,7 @@ __device__ void computeCov3D(const glm::vec3 scale, const glm::vec4 rot, float *
     cov3D[5] = Sigma[2][2];
 }
 
-__device__ float3 computeCov2D(const float3 &mean, float focal_x, float focal_y, float tan_fovx, float tan_fovy, const float *cov3D, const float *viewmatrix) {
+__host__ __device__ float3 computeCov2D(const float3 &mean, float focal_x, float focal_y, float tan_fovx, float tan_fovy, const float *cov3D, const float *viewmatrix) {
     float3 t = transformPoint4x3(mean, viewmatrix);
 
     const float limx = 1.3f * tan_fovx;
@@ -76,39 +77,47 @@ __device__ float3 computeCov2D(const float3 &mean, float focal_x, float focal_y,
     return {float(cov[0][0]), float(cov[0][1]), float(cov[1][1])};
 }
 
-__device__ glm::vec3 computeColorFromSH(int idx, int deg, int max_coeffs, const glm::vec3 *means, glm::vec3 campos, const float *shs) {
+__host__ __device__ glm::vec3 computeColorFromSH(int idx, int deg, int max_coeffs, const glm::vec3 *means, glm::vec3 campos, const float *shs) {
+#ifdef __CUDA_ARCH__
+    const float C0 = SH_C0, C1 = SH_C1;
+    const float *C2 = SH_C2, *C3 = SH_C3;
+#else
+    const float C0 = SH_C0_HOST, C1 = SH_C1_HOST;
+    const float *C2 = SH_C2_HOST, *C3 = SH_C3_HOST;
+#endif
+
     glm::vec3 pos = means[idx];
     glm::vec3 dir = pos - campos;
     dir = dir / glm::length(dir);
 
     glm::vec3 *sh = ((glm::vec3 *)shs) + idx * max_coeffs;
-    glm::vec3 result = SH_C0 * sh[0];
+    glm::vec3 result = C0 * sh[0];
 
     if (deg > 0) {
         float x = dir.x;
         float y = dir.y;
         float z = dir.z;
-        result = result - SH_C1 * y * sh[1] + SH_C1 * z * sh[2] - SH_C1 * x * sh[3];
+        result = result - C1 * y * sh[1] + C1 * z * sh[2] - C1 * x * sh[3];
 
         if (deg > 1) {
             float xx = x * x, yy = y * y, zz = z * z;
             float xy = x * y, yz = y * z, xz = x * z;
             result = result +
-                     SH_C2[0] * xy * sh[4] +
-                     SH_C2[1] * yz * sh[5] +
-                     SH_C2[2] * (2.0f * zz - xx - yy) * sh[6] +
-                     SH_C2[3] * xz * sh[7] +
-                     SH_C2[4] * (xx - yy) * sh[8];
+                     C2[0] * xy * sh[4] +
+                     C2[1] * yz * sh[5] +
+                     C2[2] * (2.0f * zz - xx - yy) * sh[6] +
+                     C2[3] * xz * sh[7] +
+                     C2[4] * (xx - yy) * sh[8];
 
             if (deg > 2) {
                 result = result +
-                         SH_C3[0] * y * (3.0f * xx - yy) * sh[9] +
-                         SH_C3[1] * xy * z * sh[10] +
-                         SH_C3[2] * y * (4.0f * zz - xx - yy) * sh[11] +
-                         SH_C3[3] * z * (2.0f * zz - 3.0f * xx - 3.0f * yy) * sh[12] +
-                         SH_C3[4] * x * (4.0f * zz - xx - yy) * sh[13] +
-                         SH_C3[5] * z * (xx - yy) * sh[14] +
-                         SH_C3[6] * x * (xx - 3.0f * yy) * sh[15];
+                         C3[0] * y * (3.0f * xx - yy) * sh[9] +
+                         C3[1] * xy * z * sh[10] +
+                         C3[2] * y * (4.0f * zz - xx - yy) * sh[11] +
+                         C3[3] * z * (2.0f * zz - 3.0f * xx - 3.0f * yy) * sh[12] +
+                         C3[4] * x * (4.0f * zz - xx - yy) * sh[13] +
+                         C3[5] * z * (xx - yy) * sh[14] +
+                         C3[6] * x * (xx - 3.0f * yy) * sh[15];
             }
         }
     }
@@ -116,11 +125,11 @@ __device__ glm::vec3 computeColorFromSH(int idx, int deg, int max_coeffs, const
     return glm::max(result, 0.0f);
 }
 
+// Projects Gaussian idx onto the image plane. Shared by the CUDA kernel and
+// the CPU preprocess so that both produce the same 2D Gaussians.
 template <int C>
-__global__ void preprocessCUDA(
-    // Tile Inputs
-    const dim3 grid,
-    const int tile_size,
+__forceinline__ __host__ __device__ void preprocess_gaussian(
+    const int idx,
 
     // Camera Inputs
     const float tan_fovx, float tan_fovy,
@@ -147,10 +156,6 @@ __global__ void preprocessCUDA(
     float *first_eigen_vec, float *first_eigen_val,
     float *second_eigen_vec, float *second_eigen_val,
     int *frustum_culling) {
-    auto idx = cg::this_grid().thread_rank();
-    if (idx >= P)
-        return;
-
     means2D[idx] = {0, 0};
     conic_opacity[idx] = {0, 0, 0};
     rgb[idx * C + 0] = 0;
@@ -228,7 +233,132 @@ __global__ void preprocessCUDA(
     frustum_culling[idx] = 0;
 }
 
-static void preprocessCUDA_wrapper(
+template <int C>
+__global__ void preprocessCUDA(
+    // Tile Inputs
+    const dim3 grid,
+    const int tile_size,
+
+    // Camera Inputs
+    const float tan_fovx, float tan_fovy,
+    const float focal_x, float focal_y,
+    const float *viewmatrix,
+    const float *projmatrix,
+    const glm::vec3 *cam_pos,
+    const int W, int H,
+
+    // 3D Gaussian Inputs
+    const int P, int D, int M,
+    const float *means3D,
+    const float *opacities,
+    const glm::vec3 *scales,
+    const glm::vec4 *rotations,
+    const float *SHs,
+
+    // 2D Gaussian Outputs
+    float2 *means2D,
+    float4 *conic_opacity,
+    float *rgb,
+    int *radii,
+    float *depths,
+    float *first_eigen_vec, float *first_eigen_val,
+    float *second_eigen_vec, float *second_eigen_val,
+    int *frustum_culling) {
+    auto idx = cg::this_grid().thread_rank();
+    if (idx >= P)
+        return;
+
+    preprocess_gaussian<C>(
+        idx,
+
+        // Camera Inputs
+        tan_fovx, tan_fovy,
+        focal_x, focal_y,
+        viewmatrix,
+        projmatrix,
+        cam_pos,
+        W, H,
+
+        // 3D Gaussian Inputs
+        P, D, M,
+        means3D,
+        opacities,
+        scales,
+        rotations,
+        SHs,
+
+        // 2D Gaussian Outputs
+        means2D,
+        conic_opacity,
+        rgb,
+        radii,
+        depths,
+        first_eigen_vec, first_eigen_val,
+        second_eigen_vec, second_eigen_val,
+        frustum_culling);
+}
+
+template <int C>
+static void preprocessCPU(
+    // Camera Inputs
+    const float tan_fovx, float tan_fovy,
+    const float focal_x, float focal_y,
+    const float *viewmatrix,
+    const float *projmatrix,
+    const glm::vec3 *cam_pos,
+    const int W, int H,
+
+    // 3D Gaussian Inputs
+    const int P, int D, int M,
+    const float *means3D,
+    const float *opacities,
+    const glm::vec3 *scales,
+    const glm::vec4 *rotations,
+    const float *SHs,
+
+    // 2D Gaussian Outputs
+    float2 *means2D,
+    float4 *conic_opacity,
+    float *rgb,
+    int *radii,
+    float *depths,
+    float *first_eigen_vec, float *first_eigen_val,
+    float *second_eigen_vec, float *second_eigen_val,
+    int *frustum_culling) {
+    parallel_range(g_num_thread, P, [&](const int thread, const int begin, const int end) {
+        for (int idx = begin; idx < end; idx++)
+            preprocess_gaussian<C>(
+                idx,
+
+                // Camera Inputs
+                tan_fovx, tan_fovy,
+                focal_x, focal_y,
+                viewmatrix,
+                projmatrix,
+                cam_pos,
+                W, H,
+
+                // 3D Gaussian Inputs
+                P, D, M,
+                means3D,
+                opacities,
+                scales,
+                rotations,
+                SHs,
+
+                // 2D Gaussian Outputs
+                means2D,
+                conic_opacity,
+                rgb,
+                radii,
+                depths,
+                first_eigen_vec, first_eigen_val,
+                second_eigen_vec, second_eigen_val,
+                frustum_culling);
+    });
+}
+
+static void preprocess_wrapper(
     // Tile Inputs
     const dim3 grid,
     const int tile_size,
@@ -260,6 +390,36 @@ static void preprocessCUDA_wrapper(
     const float focal_x = W / (2.0f * tan_fovx);
     const float focal_y = H / (2.0f * tan_fovy);
 
+    if (g_cpu_preprocess) {
+        preprocessCPU<NUM_CHANNELS>(
+            // Camera Inputs
+            tan_fovx, tan_fovy,
+            focal_x, focal_y,
+            viewmatrix,
+            projmatrix,
+            cam_pos,
+            W, H,
+
+            // 3D Gaussian Inputs
+            P, D, M,
+            means3D,
+            opacities,
+            scales,
+            rotations,
+            SHs,
+
+            // 2D Gaussian Outputs
+            means2D,
+            conic_opacity,
+            rgb,
+            radii,
+            depths,
+            first_eigen_vec, first_eigen_val,
+            second_eigen_vec, second_eigen_val,
+            frustum_culling);
+        return;
+    }
+
     preprocessCUDA<NUM_CHANNELS><<<(P + 255) / 256, 256>>>(
         // Tile Inputs
         grid,
@@ -295,7 +455,7 @@ static void preprocessCUDA_wrapper(
 void preprocess() {
     const dim3 tile_grid(TILE_WIDTH, TILE_HEIGHT, 1);
 
-    preprocessCUDA_wrapper(
+    preprocess_wrapper(
         // Tile Inputs
         tile_grid,
         g_tile_size,
@@ -1,3 +1,4 @@
+#include "footprint.h"
 #include "rasterize.h"
 #include "utils.h"
 #include "variable.h"
@@ -7,12 +8,12 @@
 
 namespace poc {
 
-void rasterize() {
-    const int W = g_W;
-    const int H = g_H;
+// Size (in pixels) of g_raw_img/g_raw_T; reallocated only on resolution change.
+static int l_num_pixel = 0;
 
-    const int tile_W = (W + g_tile_size - 1) / g_tile_size;
-    const int tile_H = (H + g_tile_size - 1) / g_tile_size;
+static void alloc_frame_buffer() {
+    if (g_raw_img != NULL && l_num_pixel == g_W * g_H)
+        return;
 
     if (g_raw_img != NULL)
         delete[] g_raw_img;
@@ -20,106 +21,135 @@ void rasterize() {
     if (g_raw_T != NULL)
         delete[] g_raw_T;
 
-    g_raw_img = new float[W * H * NUM_CHANNELS];
-    g_raw_T = new float[W * H];
+    l_num_pixel = g_W * g_H;
 
-    for (int p = 0; p < W * H; p++) {
-        for (int ch = 0; ch < NUM_CHANNELS; ch++)
-            g_raw_img[p * NUM_CHANNELS + ch] = 0.f;
-        g_raw_T[p] = 1.f;
-    }
+    g_raw_img = new float[l_num_pixel * NUM_CHANNELS];
+    g_raw_T = new float[l_num_pixel];
+}
 
-    g_reuse_gaussian_per_tile.clear();
-    g_reuse_gaussian_per_tile.resize(NUM_TILE);
+static void clear_tile(const int tw, const int th) {
+    const int W = g_W;
+    const int H = g_H;
 
-    for (int i = 0; i < NUM_TILE; i++) {
-        if (DEBUG_MODE) {
-            int w = i % TILE_WIDTH;
-            int h = i / TILE_WIDTH;
+    for (int y = th * g_tile_size; y < min((th + 1) * g_tile_size, H); y++)
+        for (int x = tw * g_tile_size; x < min((tw + 1) * g_tile_size, W); x++) {
+            const int pix = y * W + x;
 
-            if (W_START > w * g_tile_size || W_END < w * g_tile_size)
-                continue;
-            if (H_START > h * g_tile_size || H_END < h * g_tile_size)
-                continue;
+            for (int ch = 0; ch < NUM_CHANNELS; ch++)
+                g_raw_img[ch * W * H + pix] = 0.f;
+            g_raw_T[pix] = 1.f;
         }
+}
 
-        int tx = i % TILE_WIDTH;
-        int ty = i / TILE_WIDTH;
-
-        for (auto tile_key : g_merge_gaussian_per_tile[i]) {
-            const float2 p = {g_gaussian_mean2D_cpu[g_curr_cam][tile_key.idx * 2],
-                              g_gaussian_mean2D_cpu[g_curr_cam][tile_key.idx * 2 + 1]};
-            const float depth = g_gaussian_depth_cpu[g_curr_cam][tile_key.idx];
-            const int max_radius = g_gaussian_radii_cpu[g_curr_cam][tile_key.idx];
+static void update_reuse_list(const int i) {
+    int tx = i % TILE_WIDTH;
+    int ty = i / TILE_WIDTH;
 
-            float gaussian_e_val[2];
-            float2 gaussian_e_vec[2];
+    auto &merge = g_merge_gaussian_per_tile;
+    auto &reuse = g_reuse_gaussian_per_tile[g_curr_ref];
 
-            for (int j = 0; j < 2; j++) {
-                gaussian_e_val[j] = g_gaussian_eigen_value_cpu[g_curr_cam][j][tile_key.idx];
-                gaussian_e_vec[j] = {g_gaussian_eigen_vector_cpu[g_curr_cam][j][tile_key.idx * 2],
-                                     g_gaussian_eigen_vector_cpu[g_curr_cam][j][tile_key.idx * 2 + 1]};
-            }
+    tile_key_t *reuse_key = reuse.begin(i);
 
-            const tile_key_t next_tile_key = {depth, tile_key.idx};
+    for (const tile_key_t *tile_key = merge.begin(i); tile_key != merge.end(i); tile_key++) {
+        const float depth = g_gaussian_depth_cpu[g_curr_cam][tile_key->idx];
+        const tile_key_t next_tile_key = {depth, tile_key->idx};
 
-            if (max_radius != 0 && obb_test(p, tx, ty, gaussian_e_vec[0], gaussian_e_vec[1], gaussian_e_val[0], gaussian_e_val[1], g_tile_size))
-                g_reuse_gaussian_per_tile[i].push_back(next_tile_key);
-        }
+        if (footprint_overlap(tile_key->idx, tx, ty))
+            reuse_key[reuse.count[i]++] = next_tile_key;
     }
+}
 
-    for (int th = 0; th < tile_H; th++)
-        for (int tw = 0; tw < tile_W; tw++) {
-            if (DEBUG_MODE) {
-                if (W_START > tw * g_tile_size || W_END < tw * g_tile_size)
+static void blend_tile(const int tw, const int th) {
+    const int W = g_W;
+    const int H = g_H;
+
+    const int tile_W = (W + g_tile_size - 1) / g_tile_size;
+
+    int global_tile_idx = th * tile_W + tw;
+    auto &reuse = g_reuse_gaussian_per_tile[g_curr_ref];
+
+    for (const tile_key_t *tile_key = reuse.begin(global_tile_idx); tile_key != reuse.end(global_tile_idx); tile_key++) {
+        const tile_key_t key = *tile_key;
+        const float2 xy = {g_gaussian_mean2D_cpu[g_curr_cam][key.idx * 2],
+                           g_gaussian_mean2D_cpu[g_curr_cam][key.idx * 2 + 1]};
+        const float rgb[3] = {g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3],
+                              g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3 + 1],
+                              g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3 + 2]};
+        const float4 con_o = {g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4],
+                              g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 1],
+                              g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 2],
+                              g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 3]};
+
+        for (int dh = 0; dh < g_tile_size; dh++)
+            for (int dw = 0; dw < g_tile_size; dw++) {
+                const float2 pixf = {tw * g_tile_size + dw, th * g_tile_size + dh};
+                const int pix = (int)pixf.y * W + (int)pixf.x;
+
+                if (pixf.x >= W || pixf.y >= H)
                     continue;
-                if (H_START > th * g_tile_size || H_END < th * g_tile_size)
+
+                const float2 d = {xy.x - pixf.x, xy.y - pixf.y};
+                const float power = -0.5f * (con_o.x * d.x * d.x + con_o.z * d.y * d.y) - con_o.y * d.x * d.y;
+
+                if (power > 0.f)
                     continue;
-            }
 
-            int global_tile_idx = th * tile_W + tw;
-            for (auto key : g_reuse_gaussian_per_tile[global_tile_idx]) {
-                const float2 xy = {g_gaussian_mean2D_cpu[g_curr_cam][key.idx * 2],
-                                   g_gaussian_mean2D_cpu[g_curr_cam][key.idx * 2 + 1]};
-                const float rgb[3] = {g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3],
-                                      g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3 + 1],
-                                      g_gaussian_rgb_cpu[g_curr_cam][key.idx * 3 + 2]};
-                const float4 con_o = {g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4],
-                                      g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 1],
-                                      g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 2],
-                                      g_gaussian_conic_opacity_cpu[g_curr_cam][key.idx * 4 + 3]};
+                const float alpha = min(0.99f, con_o.w * exp(power));
 
-                for (int dh = 0; dh < g_tile_size; dh++)
-                    for (int dw = 0; dw < g_tile_size; dw++) {
-                        const float2 pixf = {tw * g_tile_size + dw, th * g_tile_size + dh};
-                        const int pix = (int)pixf.y * W + (int)pixf.x;
+                if (alpha < 1.f / 255.f)
+                    continue;
 
-                        if (pixf.x >= W || pixf.y >= H)
-                            continue;
+                const float test_T = g_raw_T[pix] * (1.f - alpha);
 
-                        const float2 d = {xy.x - pixf.x, xy.y - pixf.y};
-                        const float power = -0.5f * (con_o.x * d.x * d.x + con_o.z * d.y * d.y) - con_o.y * d.x * d.y;
+                if (test_T < 0.0001f)
+                    continue;
 
-                        if (power > 0.f)
-                            continue;
+                for (int ch = 0; ch < NUM_CHANNELS; ch++)
+                    g_raw_img[ch * W * H + pix] += rgb[ch] * alpha * g_raw_T[pix];
 
-                        const float alpha = min(0.99f, con_o.w * exp(power));
+                g_raw_T[pix] = test_T;
+            }
+    }
+}
 
-                        if (alpha < 1.f / 255.f)
-                            continue;
+void rasterize() {
+    alloc_frame_buffer();
 
-                        const float test_T = g_raw_T[pix] * (1.f - alpha);
+    // A tile's reuse list is a subset of its merged list
+    auto &reuse = g_reuse_gaussian_per_tile[g_curr_ref];
 
-                        if (test_T < 0.0001f)
-                            continue;
+    reuse.offset = g_merge_gaussian_per_tile.offset;
+    reuse.count.assign(NUM_TILE, 0);
+    reuse.alloc();
 
-                        for (int ch = 0; ch < NUM_CHANNELS; ch++)
-                            g_raw_img[ch * W * H + pix] += rgb[ch] * alpha * g_raw_T[pix];
+    // Tiles own disjoint pixels and reuse lists, so each worker clears,
+    // rebuilds and blends whole tiles independently. Without an image only
+    // the reuse lists the next frame needs are rebuilt.
+    parallel_for(g_num_thread, NUM_TILE, [](const int, const int i) {
+        const int tw = i % TILE_WIDTH;
+        const int th = i / TILE_WIDTH;
 
-                        g_raw_T[pix] = test_T;
-                    }
-            }
+        if (g_image)
+            clear_tile(tw, th);
+
+        if (DEBUG_MODE) {
+            if (W_START > tw * g_tile_size || W_END < tw * g_tile_size)
+                return;
+            if (H_START > th * g_tile_size || H_END < th * g_tile_size)
+                return;
         }
+
+        update_reuse_list(i);
+
+        if (g_image)
+            blend_tile(tw, th);
+    });
+
+    int64_t num_reuse = 0;
+    for (int i = 0; i < NUM_TILE; i++)
+        num_reuse += reuse.count[i];
+
+    g_stats.num_drop = g_stats.num_merge - num_reuse;
 }
 
 } // namespace poc
@@ -1,8 +1,11 @@
+#include "footprint.h"
 #include "sort.h"
 #include "utils.h"
 #include "variable.h"
 
 #include <algorithm>
+#include <cmath>
+#include <cstring>
 #include <cuda.h>
 #include <cuda_runtime.h>
 #include <iostream>
@@ -10,230 +13,338 @@
 
 namespace poc {
 
-static void scratch_sort() {
-    const uint2 grid = {TILE_WIDTH, TILE_HEIGHT};
+// Write cursors of the binning pass: worker t stores its entries for tile k
+// from l_tile_cursor[t][k] on. Workers own contiguous Gaussian ranges in
+// order, so every tile list comes out in Gaussian order.
+static std::vector<std::vector<int64_t>> l_tile_cursor;
+
+// Order-preserving map from float depth to unsigned key
+static uint32_t depth_key(const float depth) {
+    uint32_t bits;
+    std::memcpy(&bits, &depth, sizeof(bits));
+
+    return (bits & 0x80000000u) ? ~bits : (bits | 0x80000000u);
+}
+
+// Stable LSD radix sort of [begin, end) by depth, 8 bits per pass. Passes
+// where every key has the same digit are skipped, and short ranges (most
+// chunks) use insertion sort.
+static void radix_sort(tile_key_t *begin, tile_key_t *end) {
+    const int n = end - begin;
+
+    if (n <= 64) {
+        for (int i = 1; i < n; i++) {
+            const tile_key_t tile_key = begin[i];
+            const uint32_t key = depth_key(tile_key.depth);
+
+            int j = i - 1;
+            while (j >= 0 && depth_key(begin[j].depth) > key) {
+                begin[j + 1] = begin[j];
+                j--;
+            }
+            begin[j + 1] = tile_key;
+        }
+        return;
+    }
+
+    thread_local std::vector<uint32_t> keys, keys_tmp;
+    thread_local std::vector<tile_key_t> values_tmp;
 
-    g_gaussian_per_tile.clear();
-    g_gaussian_per_tile.resize(NUM_TILE);
+    keys.resize(n);
+    keys_tmp.resize(n);
+    values_tmp.resize(n);
 
-    g_merge_gaussian_per_tile.clear();
-    g_merge_gaussian_per_tile.resize(NUM_TILE);
+    for (int i = 0; i < n; i++)
+        keys[i] = depth_key(begin[i].depth);
 
-    g_duplicated_gaussian.clear();
-    g_duplicated_gaussian.resize(g_P);
+    uint32_t *src_key = keys.data();
+    uint32_t *dst_key = keys_tmp.data();
+    tile_key_t *src = begin;
+    tile_key_t *dst = values_tmp.data();
 
-    for (int idx = 0; idx < g_P; idx++) {
-        const float2 p = {g_gaussian_mean2D_cpu[g_curr_cam][idx * 2],
-                          g_gaussian_mean2D_cpu[g_curr_cam][idx * 2 + 1]};
-        const float depth = g_gaussian_depth_cpu[g_curr_cam][idx];
-        const int max_radius = g_gaussian_radii_cpu[g_curr_cam][idx];
+    for (int shift = 0; shift < 32; shift += 8) {
+        int count[256] = {0};
+        for (int i = 0; i < n; i++)
+            count[(src_key[i] >> shift) & 0xFF]++;
 
-        float gaussian_e_val[2];
-        float2 gaussian_e_vec[2];
+        if (count[(src_key[0] >> shift) & 0xFF] == n)
+            continue;
 
-        for (int i = 0; i < 2; i++) {
-            gaussian_e_val[i] = g_gaussian_eigen_value_cpu[g_curr_cam][i][idx];
-            gaussian_e_vec[i] = {g_gaussian_eigen_vector_cpu[g_curr_cam][i][idx * 2],
-                                 g_gaussian_eigen_vector_cpu[g_curr_cam][i][idx * 2 + 1]};
+        int offset = 0;
+        for (int d = 0; d < 256; d++) {
+            const int c = count[d];
+            count[d] = offset;
+            offset += c;
         }
 
-        const uint2 rect_min = {
-            min(grid.x, max((int)0, (int)((p.x - max_radius) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((p.y - max_radius) / g_tile_size)))};
-        const uint2 rect_max = {
-            min(grid.x, max((int)0, (int)((p.x + max_radius + g_tile_size - 1) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((p.y + max_radius + g_tile_size - 1) / g_tile_size)))};
-
-        for (int tx = rect_min.x; tx < rect_max.x; tx++)
-            for (int ty = rect_min.y; ty < rect_max.y; ty++) {
-                if (DEBUG_MODE) {
-                    if (W_START > tx * g_tile_size || W_END < tx * g_tile_size)
-                        continue;
-                    if (H_START > ty * g_tile_size || H_END < ty * g_tile_size)
-                        continue;
-                }
+        for (int i = 0; i < n; i++) {
+            const int pos = count[(src_key[i] >> shift) & 0xFF]++;
+            dst_key[pos] = src_key[i];
+            dst[pos] = src[i];
+        }
 
-                tile_key_t tile_key = {depth, idx};
-                const uint64_t key = ty * grid.x + tx;
-                if (max_radius != 0 && obb_test(p,
-                                                tx, ty,
-                                                gaussian_e_vec[0], gaussian_e_vec[1],
-                                                gaussian_e_val[0], gaussian_e_val[1],
-                                                g_tile_size)) {
-                    g_gaussian_per_tile[key].push_back(tile_key);
-                    g_duplicated_gaussian[idx].push_back(key);
-                }
-            }
+        std::swap(src_key, dst_key);
+        std::swap(src, dst);
+    }
+
+    if (src != begin)
+        std::copy(src, src + n, begin);
+}
+
+static void sort_tile(tile_key_t *begin, tile_key_t *end) {
+    if (g_sort_mode == RADIX_SORT) {
+        radix_sort(begin, end);
+        return;
     }
 
-    auto cmp = [](const tile_key_t &a, const tile_key_t &b) {
+    std::sort(begin, end, [](const tile_key_t &a, const tile_key_t &b) {
         return a.depth < b.depth;
-    };
+    });
+}
 
-    for (int i = 0; i < NUM_TILE; i++) {
-        std::sort(g_gaussian_per_tile[i].begin(), g_gaussian_per_tile[i].end(), cmp);
+// Calls fn(key) for every tile Gaussian idx is binned into this frame. In
+// the reuse phase, tiles it already covered in the reference frame are
+// skipped since it is still in their reuse lists.
+template <typename F>
+static void for_each_tile(const int idx, const bool reuse, F fn) {
+    const uint2 grid = {TILE_WIDTH, TILE_HEIGHT};
+    const footprint_t &f = g_footprint[g_curr_ref][idx];
 
-        g_merge_gaussian_per_tile[i].clear();
+    for (int tx = f.rect_min_x; tx < f.rect_max_x; tx++)
+        for (int ty = f.rect_min_y; ty < f.rect_max_y; ty++) {
+            if (DEBUG_MODE) {
+                if (W_START > tx * g_tile_size || W_END < tx * g_tile_size)
+                    continue;
+                if (H_START > ty * g_tile_size || H_END < ty * g_tile_size)
+                    continue;
+            }
 
-        int new_idx = 0;
-        while (new_idx < g_gaussian_per_tile[i].size()) {
-            g_merge_gaussian_per_tile[i].push_back(g_gaussian_per_tile[i][new_idx]);
-            new_idx++;
+            if (reuse && footprint_contains(g_prev_ref, idx, tx, ty))
+                continue;
+
+            if (footprint_contains(g_curr_ref, idx, tx, ty))
+                fn(ty * grid.x + tx);
         }
-    }
 }
 
-static void reuse_sort() {
-    const uint2 grid = {TILE_WIDTH, TILE_HEIGHT};
+// Fills g_gaussian_per_tile and g_duplicated_gaussian: count, prefix sum, fill.
+static void bin_gaussians(const bool reuse) {
+    const int num_thread = num_worker(g_num_thread, g_P);
+
+    auto &tiles = g_gaussian_per_tile;
+    auto &duplicated = g_duplicated_gaussian;
 
-    g_gaussian_per_tile.clear();
-    g_gaussian_per_tile.resize(NUM_TILE);
+    l_tile_cursor.resize(num_thread);
+    for (auto &cursor : l_tile_cursor)
+        cursor.assign(NUM_TILE, 0);
 
-    g_merge_gaussian_per_tile.clear();
-    g_merge_gaussian_per_tile.resize(NUM_TILE);
+    duplicated.reset(g_P);
 
-    g_duplicated_gaussian.clear();
-    g_duplicated_gaussian.resize(g_P);
+    parallel_range(num_thread, g_P, [&](const int thread, const int begin, const int end) {
+        auto &cursor = l_tile_cursor[thread];
 
-    for (int idx = 0; idx < g_P; idx++) {
-        const float2 p = {g_gaussian_mean2D_cpu[g_curr_cam][idx * 2],
-                          g_gaussian_mean2D_cpu[g_curr_cam][idx * 2 + 1]};
-        const float depth = g_gaussian_depth_cpu[g_curr_cam][idx];
-        const int max_radius = g_gaussian_radii_cpu[g_curr_cam][idx];
+        for (int idx = begin; idx < end; idx++)
+            for_each_tile(idx, reuse, [&](const int key) {
+                cursor[key]++;
+                duplicated.count[idx]++;
+            });
+    });
 
-        float gaussian_e_val[2];
-        float2 gaussian_e_vec[2];
+    tiles.reset(NUM_TILE);
 
-        for (int i = 0; i < 2; i++) {
-            gaussian_e_val[i] = g_gaussian_eigen_value_cpu[g_curr_cam][i][idx];
-            gaussian_e_vec[i] = {g_gaussian_eigen_vector_cpu[g_curr_cam][i][idx * 2],
-                                 g_gaussian_eigen_vector_cpu[g_curr_cam][i][idx * 2 + 1]};
+    int64_t offset = 0;
+    for (int key = 0; key < NUM_TILE; key++) {
+        tiles.offset[key] = offset;
+
+        for (auto &cursor : l_tile_cursor) {
+            const int64_t count = cursor[key];
+            cursor[key] = offset;
+            offset += count;
         }
 
-        const float2 prev_p = {g_gaussian_mean2D_cpu[g_prev_cam][idx * 2],
-                               g_gaussian_mean2D_cpu[g_prev_cam][idx * 2 + 1]};
-        const int prev_max_radius = g_gaussian_radii_cpu[g_prev_cam][idx];
+        tiles.count[key] = offset - tiles.offset[key];
+    }
+    tiles.offset[NUM_TILE] = offset;
+    tiles.alloc();
+
+    for (int idx = 0; idx < g_P; idx++)
+        duplicated.offset[idx + 1] = duplicated.offset[idx] + duplicated.count[idx];
+    duplicated.alloc();
 
-        float prev_gaussian_e_val[2];
-        float2 prev_gaussian_e_vec[2];
+    parallel_range(num_thread, g_P, [&](const int thread, const int begin, const int end) {
+        auto &cursor = l_tile_cursor[thread];
 
-        for (int i = 0; i < 2; i++) {
-            prev_gaussian_e_val[i] = g_gaussian_eigen_value_cpu[g_prev_cam][i][idx];
-            prev_gaussian_e_vec[i] = {g_gaussian_eigen_vector_cpu[g_prev_cam][i][idx * 2],
-                                      g_gaussian_eigen_vector_cpu[g_prev_cam][i][idx * 2 + 1]};
+        for (int idx = begin; idx < end; idx++) {
+            const tile_key_t tile_key = {g_gaussian_depth_cpu[g_curr_cam][idx], idx};
+            int *duplicated_key = duplicated.begin(idx);
+
+            for_each_tile(idx, reuse, [&](const int key) {
+                tiles.key[cursor[key]++] = tile_key;
+                *duplicated_key++ = key;
+            });
         }
+    });
+}
 
-        const uint2 rect_min = {
-            min(grid.x, max((int)0, (int)((p.x - max_radius) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((p.y - max_radius) / g_tile_size)))};
-        const uint2 rect_max = {
-            min(grid.x, max((int)0, (int)((p.x + max_radius + g_tile_size - 1) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((p.y + max_radius + g_tile_size - 1) / g_tile_size)))};
-        const uint2 prev_rect_min = {
-            min(grid.x, max((int)0, (int)((prev_p.x - prev_max_radius) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((prev_p.y - prev_max_radius) / g_tile_size)))};
-        const uint2 prev_rect_max = {
-            min(grid.x, max((int)0, (int)((prev_p.x + prev_max_radius + g_tile_size - 1) / g_tile_size))),
-            min(grid.y, max((int)0, (int)((prev_p.y + prev_max_radius + g_tile_size - 1) / g_tile_size)))};
-
-        for (int tx = rect_min.x; tx < rect_max.x; tx++)
-            for (int ty = rect_min.y; ty < rect_max.y; ty++) {
-                if (DEBUG_MODE) {
-                    if (W_START > tx * g_tile_size || W_END < tx * g_tile_size)
-                        continue;
-                    if (H_START > ty * g_tile_size || H_END < ty * g_tile_size)
-                        continue;
-                }
+static void scratch_sort() {
+    auto &tiles = g_gaussian_per_tile;
+    auto &merge = g_merge_gaussian_per_tile;
 
-                tile_key_t tile_key = {depth, idx};
-                const uint64_t key = ty * grid.x + tx;
-
-                if (prev_max_radius != 0 &&
-                    tx >= prev_rect_min.x && tx < prev_rect_max.x &&
-                    ty >= prev_rect_min.y && ty < prev_rect_max.y &&
-                    obb_test(prev_p,
-                             tx, ty,
-                             prev_gaussian_e_vec[0], prev_gaussian_e_vec[1],
-                             prev_gaussian_e_val[0], prev_gaussian_e_val[1],
-                             g_tile_size))
-                    continue;
+    bin_gaussians(false);
 
-                if (max_radius != 0 && obb_test(p,
-                                                tx, ty,
-                                                gaussian_e_vec[0], gaussian_e_vec[1],
-                                                gaussian_e_val[0], gaussian_e_val[1],
-                                                g_tile_size)) {
-                    g_gaussian_per_tile[key].push_back(tile_key);
-                    g_duplicated_gaussian[idx].push_back(key);
-                }
-            }
+    merge.offset = tiles.offset;
+    merge.count = tiles.count;
+    merge.alloc();
+
+    parallel_for(g_num_thread, NUM_TILE, [&](const int, const int i) {
+        sort_tile(tiles.begin(i), tiles.end(i));
+        std::copy(tiles.begin(i), tiles.end(i), merge.begin(i));
+    });
+
+    g_stats.num_new = tiles.offset[NUM_TILE];
+    g_stats.num_reuse = 0;
+}
+
+// Sets g_prev_ref to the valid reference whose pose is nearest the current
+// camera, by the squared distance between world-to-view matrices. Ties go to
+// the most recent frame, so with one reference this is the previous frame.
+static void select_reference() {
+    const int num_slot = g_num_ref + 1;
+    const auto &pose = g_ref_pose[g_curr_ref];
+
+    float min_dist = INFINITY;
+    g_prev_ref = (g_curr_ref + num_slot - 1) % num_slot;
+
+    for (int k = 1; k < num_slot; k++) {
+        const int ref = (g_curr_ref + num_slot - k) % num_slot;
+
+        if (!g_ref_valid[ref])
+            continue;
+
+        float dist = 0.f;
+        for (int j = 0; j < 16; j++)
+            dist += (g_ref_pose[ref][j] - pose[j]) * (g_ref_pose[ref][j] - pose[j]);
+
+        if (dist < min_dist) {
+            min_dist = dist;
+            g_prev_ref = ref;
+        }
     }
+}
 
-    auto cmp = [](const tile_key_t &a, const tile_key_t &b) {
-        return a.depth < b.depth;
-    };
+static void reuse_sort() {
+    select_reference();
+
+    auto &tiles = g_gaussian_per_tile;
+    auto &reuse = g_reuse_gaussian_per_tile[g_prev_ref];
+    auto &merge = g_merge_gaussian_per_tile;
+
+    bin_gaussians(true);
+
+    if (reuse.size() != NUM_TILE) {
+        reuse.reset(NUM_TILE);
+        reuse.alloc();
+    }
+
+    merge.reset(NUM_TILE);
+    for (int i = 0; i < NUM_TILE; i++)
+        merge.offset[i + 1] = merge.offset[i] + tiles.count[i] + reuse.count[i];
+    merge.alloc();
 
-    int total_new_cnt = 0;
-    int total_reuse_cnt = 0;
+    std::vector<int> new_cnt(num_worker(g_num_thread, NUM_TILE), 0);
+    std::vector<int> reuse_cnt(num_worker(g_num_thread, NUM_TILE), 0);
 
-    for (int i = 0; i < NUM_TILE; i++) {
+    parallel_for(g_num_thread, NUM_TILE, [&](const int thread, const int i) {
         if (DEBUG_MODE) {
             int w = i % TILE_WIDTH;
             int h = i / TILE_WIDTH;
 
             if (W_START > w * g_tile_size || W_END < w * g_tile_size)
-                continue;
+                return;
             if (H_START > h * g_tile_size || H_END < h * g_tile_size)
-                continue;
+                return;
         }
 
-        std::sort(g_gaussian_per_tile[i].begin(), g_gaussian_per_tile[i].end(), cmp);
+        sort_tile(tiles.begin(i), tiles.end(i));
 
-        const int reuse_size = g_reuse_gaussian_per_tile[i].size();
+        const int reuse_size = reuse.count[i];
 
         if (g_iter % 2 == 0) {
             for (int j = 0; j < reuse_size; j += g_chunk_size)
-                std::sort(g_reuse_gaussian_per_tile[i].begin() + j,
-                          g_reuse_gaussian_per_tile[i].begin() + min(j + g_chunk_size, reuse_size), cmp);
+                sort_tile(reuse.begin(i) + j, reuse.begin(i) + min(j + g_chunk_size, reuse_size));
         } else {
-            std::sort(g_reuse_gaussian_per_tile[i].begin(),
-                      g_reuse_gaussian_per_tile[i].begin() + min(g_chunk_size / 2, reuse_size), cmp);
+            sort_tile(reuse.begin(i), reuse.begin(i) + min(g_chunk_size / 2, reuse_size));
 
             for (int j = g_chunk_size / 2; j < reuse_size; j += g_chunk_size)
-                std::sort(g_reuse_gaussian_per_tile[i].begin() + j,
-                          g_reuse_gaussian_per_tile[i].begin() + min(j + g_chunk_size, reuse_size), cmp);
+                sort_tile(reuse.begin(i) + j, reuse.begin(i) + min(j + g_chunk_size, reuse_size));
         }
 
-        g_merge_gaussian_per_tile[i].clear();
+        const tile_key_t *new_key = tiles.begin(i);
+        const tile_key_t *reuse_key = reuse.begin(i);
+        const int new_size = tiles.count[i];
+
+        tile_key_t *merge_key = merge.begin(i);
+        int merge_size = 0;
 
         int new_idx = 0;
         int reuse_idx = 0;
 
-        while (new_idx < g_gaussian_per_tile[i].size() || reuse_idx < g_reuse_gaussian_per_tile[i].size()) {
-            float new_gaussian_depth = (new_idx < g_gaussian_per_tile[i].size()) ? g_gaussian_per_tile[i][new_idx].depth : 1e10;
-            float reuse_gaussian_depth = (reuse_idx < g_reuse_gaussian_per_tile[i].size()) ? g_reuse_gaussian_per_tile[i][reuse_idx].depth : 1e10;
+        while (new_idx < new_size || reuse_idx < reuse_size) {
+            float new_gaussian_depth = (new_idx < new_size) ? new_key[new_idx].depth : 1e10;
+            float reuse_gaussian_depth = (reuse_idx < reuse_size) ? reuse_key[reuse_idx].depth : 1e10;
 
             if (new_gaussian_depth < reuse_gaussian_depth) {
-                total_new_cnt++;
+                new_cnt[thread]++;
 
-                if (g_merge_gaussian_per_tile[i].size() != 0 && g_merge_gaussian_per_tile[i].back().idx == g_gaussian_per_tile[i][new_idx].idx)
+                if (merge_size != 0 && merge_key[merge_size - 1].idx == new_key[new_idx].idx)
                     new_idx++;
                 else {
-                    g_merge_gaussian_per_tile[i].push_back(g_gaussian_per_tile[i][new_idx]);
+                    merge_key[merge_size++] = new_key[new_idx];
                     new_idx++;
                 }
             } else {
-                total_reuse_cnt++;
+                reuse_cnt[thread]++;
 
-                if (g_merge_gaussian_per_tile[i].size() != 0 && g_merge_gaussian_per_tile[i].back().idx == g_reuse_gaussian_per_tile[i][reuse_idx].idx)
+                if (merge_size != 0 && merge_key[merge_size - 1].idx == reuse_key[reuse_idx].idx)
                     reuse_idx++;
                 else {
-                    g_merge_gaussian_per_tile[i].push_back(g_reuse_gaussian_per_tile[i][reuse_idx]);
+                    merge_key[merge_size++] = reuse_key[reuse_idx];
                     reuse_idx++;
                 }
             }
         }
+
+        merge.count[i] = merge_size;
+    });
+
+    int64_t total_new_cnt = 0;
+    int64_t total_reuse_cnt = 0;
+
+    for (int t = 0; t < new_cnt.size(); t++) {
+        total_new_cnt += new_cnt[t];
+        total_reuse_cnt += reuse_cnt[t];
     }
+
+    g_stats.num_new = total_new_cnt;
+    g_stats.num_reuse = total_reuse_cnt;
+}
+
+void reset_reference() {
+    const int num_slot = g_num_ref + 1;
+
+    g_curr_ref = 0;
+    g_prev_ref = num_slot - 1;
+
+    g_ref_valid.assign(num_slot, false);
+    g_ref_pose.resize(num_slot);
+    g_reuse_gaussian_per_tile.assign(num_slot, {});
+
+    reset_footprint();
+}
+
+void advance_reference() {
+    g_ref_valid[g_curr_ref] = true;
+    g_curr_ref = (g_curr_ref + 1) % (g_num_ref + 1);
 }
 
 void sort() {
@@ -241,6 +352,21 @@ void sort() {
         scratch_sort();
     else
         reuse_sort();
+
+    g_stats.phase = g_phase;
+    g_stats.num_duplicated = g_duplicated_gaussian.offset[g_P];
+    g_stats.num_merge = 0;
+
+    for (int i = 0; i < NUM_TILE; i++)
+        g_stats.num_merge += g_merge_gaussian_per_tile.count[i];
+
+    g_stats.new_per_tile = g_gaussian_per_tile.count;
+    g_stats.merge_per_tile = g_merge_gaussian_per_tile.count;
+
+    if (g_phase == REUSE_PHASE)
+        g_stats.reuse_per_tile = g_reuse_gaussian_per_tile[g_prev_ref].count;
+    else
+        g_stats.reuse_per_tile.assign(NUM_TILE, 0);
 }
 
 } // namespace poc
@@ -3,6 +3,13 @@
 
 namespace poc {
 
+// Empties every reference slot (see variable.h)
+void reset_reference();
+
+// Keeps the frame just rendered as a reference and moves on to the next
+// slot of the ring, overwriting the oldest reference.
+void advance_reference();
+
 void sort();
 
 } // namespace poc
@@ -0,0 +1,245 @@
+#include "sort.h"
+#include "state.h"
+#include "variable.h"
+
+#include <array>
+#include <cstring>
+#include <fstream>
+#include <stdexcept>
+
+namespace poc {
+
+template <typename T>
+static void write_array(std::ostream &file, const T *data, const int64_t size) {
+    file.write((const char *)data, size * sizeof(T));
+}
+
+template <typename T>
+static void read_array(std::istream &file, T *data, const int64_t size) {
+    file.read((char *)data, size * sizeof(T));
+}
+
+// Size-prefixed vector
+template <typename T>
+static void write_vector(std::ostream &file, const std::vector<T> &v) {
+    const int64_t size = v.size();
+
+    write_array(file, &size, 1);
+    write_array(file, v.data(), size);
+}
+
+// Bytes left in a file being read, which bounds every size read from it
+static int64_t remaining(std::istream &file, const int64_t file_size) {
+    return file_size - (int64_t)file.tellg();
+}
+
+// Fails the stream instead of allocating if the size runs past the file
+template <typename T>
+static void read_vector(std::istream &file, const int64_t file_size, std::vector<T> &v) {
+    int64_t size = 0;
+
+    read_array(file, &size, 1);
+    if (!file)
+        return;
+    if (size < 0 || size > remaining(file, file_size) / (int64_t)sizeof(T)) {
+        file.setstate(std::ios::failbit);
+        return;
+    }
+
+    v.resize(size);
+    read_array(file, v.data(), size);
+}
+
+// Slots whose data is stored; the others are never read before being rebuilt
+static bool stored(const int ref) {
+    return g_ref_valid[ref] && ref != g_curr_ref;
+}
+
+void save_state(const std::string path) {
+    std::ofstream file(path, std::ios::binary);
+    if (!file.is_open())
+        throw std::runtime_error("Unable to open state file " + path);
+
+    state_header_t header;
+    std::memset(&header, 0, sizeof(header));
+    std::memcpy(header.magic, STATE_MAGIC, sizeof(header.magic));
+    header.version = STATE_VERSION;
+    header.header_size = sizeof(state_header_t);
+    header.W = g_W;
+    header.H = g_H;
+    header.tile_size = g_tile_size;
+    header.min_tile_size = g_min_tile_size;
+    header.P = g_P;
+    header.num_tile = NUM_TILE;
+    header.num_ref = g_num_ref;
+    header.curr_ref = g_curr_ref;
+    header.prev_ref = g_prev_ref;
+    header.iter = g_iter;
+
+    write_array(file, &header, 1);
+
+    for (int ref = 0; ref < g_num_ref + 1; ref++) {
+        const uint8_t valid = g_ref_valid[ref];
+        write_array(file, &valid, 1);
+
+        if (!stored(ref))
+            continue;
+
+        auto &reuse = g_reuse_gaussian_per_tile[ref];
+
+        write_array(file, g_ref_pose[ref].data(), 16);
+        write_array(file, reuse.count.data(), NUM_TILE);
+        for (int i = 0; i < NUM_TILE; i++)
+            write_array(file, reuse.begin(i), reuse.count[i]);
+
+        write_vector(file, g_footprint[ref]);
+        write_vector(file, g_footprint_mask[ref]);
+    }
+
+    if (!file)
+        throw std::runtime_error("Unable to write state file " + path);
+}
+
+// A stored reference slot, read in full before any global is touched
+struct state_slot_t {
+    int ref;
+    std::array<float, 16> pose;
+    csr_list_t<tile_key_t> reuse;
+    std::vector<footprint_t> footprint;
+    std::vector<uint64_t> mask;
+};
+
+// Every key names one of the Gaussians
+static bool valid_reuse(const csr_list_t<tile_key_t> &reuse) {
+    for (const tile_key_t &key : reuse.key)
+        if (key.idx < 0 || key.idx >= g_P)
+            return false;
+
+    return true;
+}
+
+// Either no footprint, or one per Gaussian laid out as compute_footprint does
+static bool valid_footprint(const std::vector<footprint_t> &footprint, const std::vector<uint64_t> &mask) {
+    if (footprint.empty())
+        return mask.empty();
+    if ((int64_t)footprint.size() != g_P)
+        return false;
+
+    int64_t num_word = 0;
+    int64_t num_rect_tile = 0;
+
+    for (const footprint_t &f : footprint) {
+        if (f.rect_min_x < 0 || f.rect_min_x > f.rect_max_x || f.rect_max_x > TILE_WIDTH ||
+            f.rect_min_y < 0 || f.rect_min_y > f.rect_max_y || f.rect_max_y > TILE_HEIGHT)
+            return false;
+        if (f.mask_offset != num_word || f.subtile_offset != num_rect_tile)
+            return false;
+
+        const int64_t area = (int64_t)(f.rect_max_x - f.rect_min_x) * (f.rect_max_y - f.rect_min_y);
+
+        num_word += (area + 63) / 64;
+        num_rect_tile += area;
+    }
+
+    return (int64_t)mask.size() == num_word;
+}
+
+void load_state(const std::string path) {
+    std::ifstream file(path, std::ios::binary | std::ios::ate);
+    if (!file.is_open())
+        throw std::runtime_error("Unable to open state file " + path);
+
+    const int64_t file_size = file.tellg();
+    file.seekg(0);
+
+    state_header_t header;
+    read_array(file, &header, 1);
+
+    if (!file || std::memcmp(header.magic, STATE_MAGIC, sizeof(header.magic)) != 0)
+        throw std::runtime_error(path + " is not a Neo state file");
+    if (header.version != STATE_VERSION || header.header_size != sizeof(state_header_t))
+        throw std::runtime_error("Unsupported state version " + std::to_string(header.version) + " in " + path);
+
+    if (header.W != g_W || header.H != g_H ||
+        header.tile_size != g_tile_size || header.min_tile_size != g_min_tile_size ||
+        header.P != g_P || header.num_tile != NUM_TILE)
+        throw std::runtime_error(path + " was saved with another configuration or Gaussians");
+
+    // Each slot takes at least its valid byte
+    if (header.num_ref < 1 || header.num_ref >= remaining(file, file_size) ||
+        header.curr_ref < 0 || header.curr_ref > header.num_ref ||
+        header.prev_ref < 0 || header.prev_ref > header.num_ref ||
+        header.iter < 0)
+        throw std::runtime_error(path + " is not a Neo state file");
+
+    const int num_slot = header.num_ref + 1;
+
+    std::vector<uint8_t> valid(num_slot, 0);
+    std::vector<state_slot_t> slots;
+
+    for (int ref = 0; ref < num_slot && file; ref++) {
+        read_array(file, &valid[ref], 1);
+
+        // As stored(ref), for the slots being read
+        if (!file || !valid[ref] || ref == header.curr_ref)
+            continue;
+
+        state_slot_t &slot = slots.emplace_back();
+        auto &reuse = slot.reuse;
+
+        slot.ref = ref;
+        read_array(file, slot.pose.data(), 16);
+
+        reuse.reset(NUM_TILE);
+        read_array(file, reuse.count.data(), NUM_TILE);
+        if (!file)
+            break;
+
+        // A tile lists each Gaussian at most once
+        for (int i = 0; i < NUM_TILE; i++) {
+            if (reuse.count[i] < 0 || reuse.count[i] > g_P)
+                throw std::runtime_error(path + " has an invalid reuse list");
+            reuse.offset[i + 1] = reuse.offset[i] + reuse.count[i];
+        }
+        if (reuse.offset.back() > remaining(file, file_size) / (int64_t)sizeof(tile_key_t)) {
+            file.setstate(std::ios::failbit);
+            break;
+        }
+
+        reuse.alloc();
+        read_array(file, reuse.key.data(), reuse.key.size());
+
+        read_vector(file, file_size, slot.footprint);
+        read_vector(file, file_size, slot.mask);
+        if (!file)
+            break;
+
+        if (!valid_reuse(reuse))
+            throw std::runtime_error(path + " has an invalid reuse list");
+        if (!valid_footprint(slot.footprint, slot.mask))
+            throw std::runtime_error(path + " has an invalid footprint");
+    }
+
+    if (!file)
+        throw std::runtime_error(path + " is truncated");
+
+    // Nothing below can fail, so a bad file leaves the backend as it was
+    g_num_ref = header.num_ref;
+    reset_reference();
+
+    g_curr_ref = header.curr_ref;
+    g_prev_ref = header.prev_ref;
+    g_iter = header.iter;
+
+    for (int ref = 0; ref < num_slot; ref++)
+        g_ref_valid[ref] = valid[ref];
+
+    for (state_slot_t &slot : slots) {
+        g_ref_pose[slot.ref] = slot.pose;
+        g_reuse_gaussian_per_tile[slot.ref] = std::move(slot.reuse);
+        g_footprint[slot.ref] = std::move(slot.footprint);
+        g_footprint_mask[slot.ref] = std::move(slot.mask);
+    }
+}
+
+} // namespace poc
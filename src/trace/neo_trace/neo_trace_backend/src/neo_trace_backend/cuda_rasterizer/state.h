@@ -0,0 +1,52 @@
+#ifndef STATE_H
+#define STATE_H
+
+#include <cstdint>
+#include <string>
+
+namespace poc {
+
+// Reuse state file (native byte order)
+//
+//   state_header_t
+//   per reference slot (num_ref + 1):
+//     uint8_t valid
+//     if valid and not curr_ref (the slot the next render overwrites):
+//       float        pose[16]
+//       int32_t      count[num_tile]
+//       tile_key_t   key[sum of count]      reuse lists, packed
+//       int64_t      num_footprint
+//       footprint_t  footprint[num_footprint]
+//       int64_t      num_mask
+//       uint64_t     mask[num_mask]
+//
+// This is everything a later render reads from earlier frames. The file only
+// loads into a backend with the same resolution, tiling and Gaussians.
+#define STATE_MAGIC "NEOSTATE"
+#define STATE_VERSION 1
+
+struct state_header_t {
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;
+    int32_t W, H;
+    int32_t tile_size;
+    int32_t min_tile_size;
+    int32_t P;
+    int32_t num_tile;
+    int32_t num_ref;
+    int32_t curr_ref;
+    int32_t prev_ref;
+    int32_t iter;
+};
+
+void save_state(const std::string path);
+
+// Replaces set_reference and set_iter; throws std::runtime_error if the file
+// cannot be read, is corrupt or was saved with another configuration, leaving
+// the state unchanged.
+void load_state(const std::string path);
+
+} // namespace poc
+
+#endif
@@ -0,0 +1,476 @@
+#include "footprint.h"
+#include "trace.h"
+#include "utils.h"
+#include "variable.h"
+
+#include <charconv>
+#include <cstring>
+#include <exception>
+#include <filesystem>
+#include <fstream>
+#include <functional>
+#include <iostream>
+#include <stdexcept>
+#include <thread>
+#include <utility>
+
+namespace poc {
+
+static const char padding[8] = {0};
+
+// Open trace container (see trace.h). Only the flush thread appends to it,
+// and it is opened and closed with no flush in flight.
+struct trace_container_t {
+    std::string path;
+    std::fstream file;
+    int64_t end = 0;
+    std::vector<container_record_t> index;
+
+    void append(const int frame, const int format, const std::string &data) {
+        container_record_t record;
+        std::memset(&record, 0, sizeof(record));
+        std::memcpy(record.magic, CONTAINER_RECORD_MAGIC, sizeof(record.magic));
+        record.frame = frame;
+        record.offset = end + sizeof(record);
+        record.size = data.size();
+        record.format = format;
+
+        file.write((const char *)&record, sizeof(record));
+        file.write(data.data(), data.size());
+        if (data.size() % 8 != 0)
+            file.write(padding, 8 - data.size() % 8);
+
+        // Flushed per trace, so a killed run keeps every complete record
+        file.flush();
+
+        // A record that failed is not indexed; the stream stays failed, so
+        // close() writes no footer and readers scan the complete records
+        if (!file)
+            throw std::runtime_error("Unable to append to trace container " + path);
+
+        index.push_back(record);
+        end = record.offset + (record.size + 7) / 8 * 8;
+    }
+
+    // Throws std::runtime_error, with the container closed, if an append or
+    // the index failed
+    void close() {
+        if (!file.is_open())
+            return;
+
+        if (file) {
+            container_footer_t footer;
+            footer.index_offset = end;
+            footer.num_trace = index.size();
+            std::memcpy(footer.magic, CONTAINER_FOOTER_MAGIC, sizeof(footer.magic));
+
+            file.write((const char *)index.data(), index.size() * sizeof(container_record_t));
+            file.write((const char *)&footer, sizeof(footer));
+            file.flush();
+        }
+
+        const bool failed = !file;
+        file.close();
+        index.clear();
+
+        if (failed)
+            throw std::runtime_error("Unable to write trace container " + path);
+    }
+
+    ~trace_container_t() {
+        try {
+            close();
+        } catch (const std::exception &e) {
+            std::cerr << e.what() << "\n";
+        }
+    }
+};
+
+// Declared before l_flush, so the last flush is joined before this closes
+static trace_container_t l_container;
+
+// Traces are built in memory during render() and written to disk on a
+// background thread, overlapping the next frame. One write is in flight at
+// a time, and the last one is joined at exit. A failed write is kept and
+// rethrown by the next flush_file, flush_trace or close_trace_container.
+struct trace_flush_t {
+    std::thread thread;
+    std::exception_ptr error;
+
+    void join() {
+        if (thread.joinable())
+            thread.join();
+    }
+
+    void wait() {
+        join();
+
+        if (error)
+            std::rethrow_exception(std::exchange(error, nullptr));
+    }
+
+    void start(std::function<void()> write) {
+        thread = std::thread([this, write = std::move(write)]() {
+            try {
+                write();
+            } catch (...) {
+                error = std::current_exception();
+            }
+        });
+    }
+
+    ~trace_flush_t() {
+        join();
+    }
+};
+
+static trace_flush_t l_flush;
+
+// Everything a trace file holds, copied out of the frame so that it is
+// encoded and written on the flush thread while the next frame renders. The
+// lists are packed in binary trace order (see trace.h).
+struct trace_frame_t {
+    int W, H;
+    int tile_size, min_tile_size, chunk_size;
+    int P, num_tile, num_subtile;
+
+    std::vector<int> is_frustum_culled;
+    std::vector<int64_t> gaussian_offset;
+    std::vector<int32_t> gaussian_tile;
+    std::vector<int32_t> num_new_duplicated_gaussian_per_tile;
+    std::vector<int32_t> num_reuse_duplicated_gaussian_per_tile;
+    std::vector<int64_t> tile_offset;
+    std::vector<int32_t> tile_gaussian;
+    std::vector<uint8_t> subtile_mask;
+
+    int subtile_mask_size() const {
+        return (num_subtile + 7) / 8;
+    }
+};
+
+static trace_frame_t capture_frame(const std::vector<int> &num_new_duplicated_gaussian_per_tile,
+                                   const std::vector<int> &num_reuse_duplicated_gaussian_per_tile) {
+    trace_frame_t frame;
+
+    const int factor = g_tile_size / g_min_tile_size;
+
+    frame.W = g_W;
+    frame.H = g_H;
+    frame.tile_size = g_tile_size;
+    frame.min_tile_size = g_min_tile_size;
+    frame.chunk_size = g_chunk_size;
+    frame.P = g_P;
+    frame.num_tile = NUM_TILE;
+    frame.num_subtile = factor * factor;
+
+    frame.is_frustum_culled.assign(g_gaussian_is_frustum_culled_cpu[g_curr_cam],
+                                   g_gaussian_is_frustum_culled_cpu[g_curr_cam] + g_P);
+
+    // g_duplicated_gaussian is packed (offset[i + 1] == offset[i] + count[i]),
+    // so its offset and key arrays are the gaussian_offset/gaussian_tile sections
+    frame.gaussian_offset = g_duplicated_gaussian.offset;
+    frame.gaussian_tile = g_duplicated_gaussian.key;
+
+    frame.num_new_duplicated_gaussian_per_tile = num_new_duplicated_gaussian_per_tile;
+    frame.num_reuse_duplicated_gaussian_per_tile = num_reuse_duplicated_gaussian_per_tile;
+
+    auto &reuse = g_reuse_gaussian_per_tile[g_curr_ref];
+
+    frame.tile_offset.assign(NUM_TILE + 1, 0);
+    for (int i = 0; i < NUM_TILE; i++)
+        frame.tile_offset[i + 1] = frame.tile_offset[i] + reuse.count[i];
+
+    const int mask_size = frame.subtile_mask_size();
+
+    frame.tile_gaussian.resize(frame.tile_offset[NUM_TILE]);
+    frame.subtile_mask.assign(frame.tile_offset[NUM_TILE] * mask_size, 0);
+    std::vector<bool> subtiles;
+
+    // Subtile masks depend on this frame's footprints, so they are resolved here
+    for (int i = 0; i < NUM_TILE; i++) {
+        int64_t entry = frame.tile_offset[i];
+
+        for (const tile_key_t *e = reuse.begin(i); e != reuse.end(i); e++) {
+            frame.tile_gaussian[entry] = e->idx;
+
+            footprint_subtile(g_curr_ref, g_curr_cam, i, e->idx, subtiles);
+
+            uint8_t *mask = &frame.subtile_mask[entry * mask_size];
+            for (int k = 0; k < frame.num_subtile; k++)
+                if (subtiles[k])
+                    mask[k / 8] |= (1 << (k % 8));
+
+            entry++;
+        }
+    }
+
+    return frame;
+}
+
+static void append_int(std::string &out, const int64_t value, const char separator) {
+    char buffer[24];
+    const auto result = std::to_chars(buffer, buffer + sizeof(buffer), value);
+
+    out.append(buffer, result.ptr);
+    out.push_back(separator);
+}
+
+static void encode_text_trace(const trace_frame_t &frame, std::string &out) {
+    append_int(out, frame.W, '\n');
+    append_int(out, frame.H, '\n');
+    append_int(out, frame.tile_size, '\n');
+    append_int(out, frame.min_tile_size, '\n');
+    append_int(out, frame.chunk_size, '\n');
+    append_int(out, frame.P, '\n');
+    append_int(out, frame.num_tile, '\n');
+
+    for (int i = 0; i < frame.P; i++) {
+        const int64_t begin = frame.gaussian_offset[i];
+        const int64_t end = frame.gaussian_offset[i + 1];
+
+        append_int(out, frame.is_frustum_culled[i], '\n');
+        append_int(out, end - begin, '\n');
+
+        for (int64_t e = begin; e < end; e++)
+            append_int(out, frame.gaussian_tile[e], ' ');
+
+        if (end > begin)
+            out.push_back('\n');
+    }
+
+    const int mask_size = frame.subtile_mask_size();
+
+    for (int i = 0; i < frame.num_tile; i++) {
+        const int64_t begin = frame.tile_offset[i];
+        const int64_t end = frame.tile_offset[i + 1];
+
+        append_int(out, frame.num_new_duplicated_gaussian_per_tile[i], '\n');
+        append_int(out, frame.num_reuse_duplicated_gaussian_per_tile[i], '\n');
+        append_int(out, end - begin, '\n');
+
+        for (int64_t e = begin; e < end; e++) {
+            append_int(out, frame.tile_gaussian[e], ' ');
+
+            const uint8_t *mask = &frame.subtile_mask[e * mask_size];
+            for (int k = 0; k < frame.num_subtile; k++) {
+                out.push_back((mask[k / 8] >> (k % 8)) & 1 ? '1' : '0');
+                out.push_back(' ');
+            }
+
+            out.push_back('\n');
+        }
+
+        if (end > begin)
+            out.push_back('\n');
+    }
+}
+
+static void write_section(std::string &out, const void *data, const size_t size) {
+    if (size > 0)
+        out.append((const char *)data, size);
+
+    if (size % 8 != 0)
+        out.append(padding, 8 - size % 8);
+}
+
+template <typename T>
+static void write_section(std::string &out, const std::vector<T> &v) {
+    write_section(out, v.data(), v.size() * sizeof(T));
+}
+
+static size_t section_size(const size_t size) {
+    return (size + 7) / 8 * 8;
+}
+
+static void encode_binary_trace(const trace_frame_t &frame, std::string &out) {
+    std::vector<uint8_t> is_frustum_culled(frame.P);
+
+    for (int i = 0; i < frame.P; i++)
+        is_frustum_culled[i] = frame.is_frustum_culled[i] ? 1 : 0;
+
+    trace_header_t header;
+    std::memset(&header, 0, sizeof(header));
+    std::memcpy(header.magic, TRACE_MAGIC, sizeof(header.magic));
+    header.version = TRACE_VERSION;
+    header.header_size = sizeof(trace_header_t);
+    header.W = frame.W;
+    header.H = frame.H;
+    header.tile_size = frame.tile_size;
+    header.min_tile_size = frame.min_tile_size;
+    header.chunk_size = frame.chunk_size;
+    header.P = frame.P;
+    header.num_tile = frame.num_tile;
+    header.num_subtile = frame.num_subtile;
+    header.num_duplicated_gaussian = frame.gaussian_offset[frame.P];
+    header.num_reuse_gaussian = frame.tile_offset[frame.num_tile];
+
+    out.reserve(section_size(sizeof(header)) +
+                section_size(is_frustum_culled.size()) +
+                section_size(frame.gaussian_offset.size() * sizeof(int64_t)) +
+                section_size(frame.gaussian_tile.size() * sizeof(int32_t)) +
+                2 * section_size(frame.num_tile * sizeof(int32_t)) +
+                section_size(frame.tile_offset.size() * sizeof(int64_t)) +
+                section_size(frame.tile_gaussian.size() * sizeof(int32_t)) +
+                section_size(frame.subtile_mask.size()));
+
+    write_section(out, &header, sizeof(header));
+    write_section(out, is_frustum_culled);
+    write_section(out, frame.gaussian_offset);
+    write_section(out, frame.gaussian_tile);
+    write_section(out, frame.num_new_duplicated_gaussian_per_tile);
+    write_section(out, frame.num_reuse_duplicated_gaussian_per_tile);
+    write_section(out, frame.tile_offset);
+    write_section(out, frame.tile_gaussian);
+    write_section(out, frame.subtile_mask);
+}
+
+// Encodes frame on the flush thread and writes it into g_trace_dir, or
+// appends it to the open container. Throws the failure of the previous write,
+// once this one is started, so a failure loses no later trace.
+static void flush_frame(trace_frame_t frame) {
+    l_flush.join();
+    const std::exception_ptr error = std::exchange(l_flush.error, nullptr);
+
+    const int format = g_trace_format;
+    const std::string name = format == BINARY_TRACE ? "poc.trace.bin" : "poc.trace";
+
+    auto encode = [format](const trace_frame_t &frame) {
+        std::string data;
+
+        if (format == BINARY_TRACE)
+            encode_binary_trace(frame, data);
+        else
+            encode_text_trace(frame, data);
+
+        return data;
+    };
+
+    if (l_container.file.is_open()) {
+        l_flush.start([encode, id = g_trace_frame, format, frame = std::move(frame)]() {
+            l_container.append(id, format, encode(frame));
+        });
+    } else {
+        l_flush.start([encode, path = g_trace_dir + "/" + name, frame = std::move(frame)]() {
+            const std::string data = encode(frame);
+
+            std::ofstream file(path, std::ios::binary);
+            if (!file.is_open())
+                throw std::runtime_error("Unable to open trace file " + path);
+
+            file.write(data.data(), data.size());
+            file.close();
+
+            if (!file)
+                throw std::runtime_error("Unable to write trace file " + path);
+        });
+    }
+
+    if (error)
+        std::rethrow_exception(error);
+}
+
+void write_trace(const std::vector<int> &num_new_duplicated_gaussian_per_tile,
+                 const std::vector<int> &num_reuse_duplicated_gaussian_per_tile) {
+    flush_frame(capture_frame(num_new_duplicated_gaussian_per_tile, num_reuse_duplicated_gaussian_per_tile));
+}
+
+void flush_trace() {
+    l_flush.wait();
+}
+
+// Reads the index of an existing container and returns the offset the next
+// record goes to: from the footer if it is valid, otherwise by scanning the
+// complete records
+static int64_t read_container(const std::string &path, std::vector<container_record_t> &index) {
+    std::ifstream file(path, std::ios::binary);
+    const int64_t file_size = std::filesystem::file_size(path);
+
+    container_header_t header;
+    file.read((char *)&header, sizeof(header));
+
+    if (!file || std::memcmp(header.magic, CONTAINER_MAGIC, sizeof(header.magic)) != 0 ||
+        header.version != CONTAINER_VERSION)
+        throw std::runtime_error(path + " is not a trace container");
+
+    index.clear();
+
+    container_footer_t footer;
+    if (file_size >= (int64_t)(header.header_size + sizeof(footer))) {
+        file.seekg(file_size - sizeof(footer));
+        file.read((char *)&footer, sizeof(footer));
+
+        if (file && std::memcmp(footer.magic, CONTAINER_FOOTER_MAGIC, sizeof(footer.magic)) == 0 &&
+            footer.index_offset + footer.num_trace * (int64_t)sizeof(container_record_t) + (int64_t)sizeof(footer) == file_size) {
+            index.resize(footer.num_trace);
+            file.seekg(footer.index_offset);
+            file.read((char *)index.data(), index.size() * sizeof(container_record_t));
+            return footer.index_offset;
+        }
+    }
+
+    file.clear();
+
+    int64_t end = header.header_size;
+    container_record_t record;
+
+    file.seekg(end);
+    while (file.read((char *)&record, sizeof(record)) &&
+           std::memcmp(record.magic, CONTAINER_RECORD_MAGIC, sizeof(record.magic)) == 0 &&
+           record.offset == end + (int64_t)sizeof(record) && record.size >= 0 &&
+           record.offset + record.size <= file_size) {
+        index.push_back(record);
+        end = record.offset + (record.size + 7) / 8 * 8;
+        file.seekg(end);
+    }
+
+    return end;
+}
+
+void open_trace_container(const std::string path) {
+    close_trace_container();
+
+    auto &container = l_container;
+    container.path = path;
+
+    if (std::filesystem::exists(path)) {
+        container.end = read_container(path, container.index);
+        std::filesystem::resize_file(path, container.end);
+
+        container.file.open(path, std::ios::in | std::ios::out | std::ios::binary);
+        container.file.seekp(container.end);
+    } else {
+        container_header_t header;
+        std::memcpy(header.magic, CONTAINER_MAGIC, sizeof(header.magic));
+        header.version = CONTAINER_VERSION;
+        header.header_size = sizeof(container_header_t);
+
+        container.file.open(path, std::ios::out | std::ios::binary);
+        container.file.write((const char *)&header, sizeof(header));
+        container.end = sizeof(header);
+    }
+
+    if (!container.file) {
+        container.file.close();
+        container.index.clear();
+        throw std::runtime_error("Unable to open trace container " + path);
+    }
+}
+
+// Closes the container even if the last append failed, then reports that
+// failure first
+void close_trace_container() {
+    l_flush.join();
+    const std::exception_ptr error = std::exchange(l_flush.error, nullptr);
+
+    try {
+        l_container.close();
+    } catch (...) {
+        if (!error)
+            throw;
+    }
+
+    if (error)
+        std::rethrow_exception(error);
+}
+
+} // namespace poc
@@ -0,0 +1,106 @@
+#ifndef TRACE_H
+#define TRACE_H
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace poc {
+
+// Binary trace layout (little-endian)
+//
+//   trace_header_t
+//   uint8_t  is_frustum_culled[P]
+//   int64_t  gaussian_offset[P + 1]
+//   int32_t  gaussian_tile[num_duplicated_gaussian]
+//   int32_t  num_new_duplicated_gaussian_per_tile[NUM_TILE]
+//   int32_t  num_reuse_duplicated_gaussian_per_tile[NUM_TILE]
+//   int64_t  tile_offset[NUM_TILE + 1]
+//   int32_t  tile_gaussian[num_reuse_gaussian]
+//   uint8_t  subtile_mask[num_reuse_gaussian][subtile_mask_size]
+//
+// Every section starts at an 8-byte aligned file offset. Subtile masks are
+// packed LSB-first, bit (factor * dy + dx) for subtile (dx, dy).
+#define TRACE_MAGIC "NEOTRACE"
+#define TRACE_VERSION 1
+
+struct trace_header_t {
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;
+    int32_t W, H;
+    int32_t tile_size;
+    int32_t min_tile_size;
+    int32_t chunk_size;
+    int32_t P;
+    int32_t num_tile;
+    int32_t num_subtile;
+    int64_t num_duplicated_gaussian;
+    int64_t num_reuse_gaussian;
+};
+
+static_assert(sizeof(trace_header_t) == 64, "trace_header_t must be 64 bytes");
+
+void write_trace(const std::vector<int> &num_new_duplicated_gaussian_per_tile,
+                 const std::vector<int> &num_reuse_duplicated_gaussian_per_tile);
+
+// Blocks until the last trace written is on disk. Throws std::runtime_error
+// if a trace could not be written (as does the next write_trace).
+void flush_trace();
+
+// Trace container layout (little-endian)
+//
+//   container_header_t
+//   per trace, in the order written:
+//     container_record_t
+//     uint8_t  data[size]          poc.trace or poc.trace.bin, by format
+//   container_record_t  index[num_trace]
+//   container_footer_t
+//
+// Records and the index start 8-byte aligned. In the index, offset is the
+// file offset of data. A container without a valid footer (e.g. the writer
+// was killed) is read by scanning the records.
+//
+// While a container is open, write_trace appends each trace to it under
+// g_trace_frame instead of writing a file into g_trace_dir. Opening an
+// existing container appends to it; a frame traced again supersedes its
+// earlier trace. The index and footer are written on close.
+#define CONTAINER_MAGIC "NEOTRCON"
+#define CONTAINER_RECORD_MAGIC "NEOFRAME"
+#define CONTAINER_FOOTER_MAGIC "NEOTRIDX"
+#define CONTAINER_VERSION 1
+
+struct container_header_t {
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;
+};
+
+struct container_record_t {
+    char magic[8];
+    int64_t frame;
+    int64_t offset;
+    int64_t size;
+    int32_t format;
+    int32_t reserved;
+};
+
+struct container_footer_t {
+    int64_t index_offset;
+    int64_t num_trace;
+    char magic[8];
+};
+
+static_assert(sizeof(container_record_t) == 40, "container_record_t must be 40 bytes");
+
+// Throws std::runtime_error if path exists and is not a container
+void open_trace_container(const std::string path);
+
+// Writes the index; does nothing if no container is open. Throws
+// std::runtime_error if a trace failed to append or the index failed to write;
+// the container is closed without an index and is read by scanning.
+void close_trace_container();
+
+} // namespace poc
+
+#endif
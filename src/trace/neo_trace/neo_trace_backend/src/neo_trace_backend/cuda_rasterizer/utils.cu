@@ -1,8 +1,125 @@
 #include "utils.h"
 #include "variable.h"
 
+#include <condition_variable>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <utility>
+#include <vector>
+
 namespace poc {
 
+// Set on pool workers and on a caller while it runs job 0
+static thread_local bool l_in_parallel = false;
+
+// Workers for run_parallel. Each waits for a new generation of jobs, runs
+// its own (worker t runs job t) and reports back; the pool is joined at exit.
+struct thread_pool_t {
+    std::mutex run_mutex;
+
+    std::mutex mutex;
+    std::condition_variable start;
+    std::condition_variable done;
+    std::vector<std::thread> workers;
+
+    const std::function<void(int)> *job = nullptr;
+    int num_job = 0;
+    int num_pending = 0;
+    int64_t generation = 0;
+    std::exception_ptr error;
+    bool stop = false;
+
+    void fail() {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (!error)
+            error = std::current_exception();
+    }
+
+    void work(const int t) {
+        l_in_parallel = true;
+        int64_t seen = 0;
+
+        std::unique_lock<std::mutex> lock(mutex);
+        while (true) {
+            start.wait(lock, [&]() { return stop || generation != seen; });
+            if (stop)
+                return;
+
+            seen = generation;
+            if (t >= num_job)
+                continue;
+
+            lock.unlock();
+            try {
+                (*job)(t);
+            } catch (...) {
+                fail();
+            }
+            lock.lock();
+
+            if (--num_pending == 0)
+                done.notify_one();
+        }
+    }
+
+    void run(const int n, const std::function<void(int)> &fn) {
+        std::lock_guard<std::mutex> run_lock(run_mutex);
+
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+
+            // Workers that fail to start leave the pool as it was
+            while ((int)workers.size() < n - 1)
+                workers.emplace_back(&thread_pool_t::work, this, (int)workers.size() + 1);
+
+            job = &fn;
+            num_job = n;
+            num_pending = n - 1;
+            error = nullptr;
+            generation++;
+        }
+        start.notify_all();
+
+        l_in_parallel = true;
+        try {
+            fn(0);
+        } catch (...) {
+            fail();
+        }
+        l_in_parallel = false;
+
+        std::unique_lock<std::mutex> lock(mutex);
+        done.wait(lock, [&]() { return num_pending == 0; });
+
+        if (error)
+            std::rethrow_exception(std::exchange(error, nullptr));
+    }
+
+    ~thread_pool_t() {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stop = true;
+        }
+        start.notify_all();
+
+        for (auto &worker : workers)
+            worker.join();
+    }
+};
+
+static thread_pool_t l_pool;
+
+void run_parallel(const int num_job, const std::function<void(int)> &job) {
+    if (num_job == 1 || l_in_parallel) {
+        for (int t = 0; t < num_job; t++)
+            job(t);
+        return;
+    }
+
+    l_pool.run(num_job, job);
+}
+
 static float inner_product(float2 a, float2 b) {
     return a.x * b.x + a.y * b.y;
 }
@@ -4,6 +4,11 @@
 #include <cuda.h>
 #include <cuda_runtime.h>
 
+#include <algorithm>
+#include <atomic>
+#include <functional>
+#include <vector>
+
 namespace poc {
 
 bool obb_test(const float2 p,
@@ -12,6 +17,59 @@ bool obb_test(const float2 p,
               const float eigen_val1, const float eigen_val2,
               const float tile_size);
 
+// Number of workers to use for n work items.
+inline int num_worker(const int num_thread, const int n) {
+    return std::max(1, std::min(num_thread, n));
+}
+
+// Calls job(t) for every t in [0, num_job) and returns once all have
+// finished. Job 0 runs on the calling thread and the others on a persistent
+// pool, grown to the largest num_job seen. The first exception a job throws
+// is rethrown here, after every job has finished. Calls made from inside a
+// job run their jobs serially.
+void run_parallel(const int num_job, const std::function<void(int)> &job);
+
+// Calls fn(thread, begin, end) on num_worker(num_thread, n) contiguous blocks
+// of [0, n). Block t always precedes block t + 1, so per-thread results can be
+// concatenated in thread order to reproduce the serial order.
+template <typename F>
+void parallel_range(const int num_thread, const int n, F fn) {
+    const int num_block = num_worker(num_thread, n);
+
+    if (num_block == 1) {
+        fn(0, 0, n);
+        return;
+    }
+
+    const int block_size = (n + num_block - 1) / num_block;
+
+    run_parallel(num_block, [&](const int t) {
+        const int begin = std::min(n, t * block_size);
+        const int end = std::min(n, begin + block_size);
+        fn(t, begin, end);
+    });
 }
 
+// Calls fn(thread, i) for every i in [0, n), handing indices out dynamically
+// so that uneven items (e.g. crowded tiles) are balanced across workers.
+template <typename F>
+void parallel_for(const int num_thread, const int n, F fn) {
+    const int num_block = num_worker(num_thread, n);
+
+    if (num_block == 1) {
+        for (int i = 0; i < n; i++)
+            fn(0, i);
+        return;
+    }
+
+    std::atomic<int> next(0);
+
+    run_parallel(num_block, [&](const int t) {
+        for (int i = next.fetch_add(1); i < n; i = next.fetch_add(1))
+            fn(t, i);
+    });
+}
+
+} // namespace poc
+
 #endif
@@ -8,6 +8,8 @@ int g_W, g_H;
 int g_tile_size;
 int g_min_tile_size;
 int g_chunk_size;
+int g_num_thread = 1;
+bool g_cpu_preprocess = false;
 
 // Camera Information
 cam_t g_cam[2];
@@ -43,19 +45,36 @@ int *g_gaussian_is_frustum_culled_cpu[2];
 
 // Trace Information
 bool g_trace = false;
+int g_trace_format = TEXT_TRACE;
 std::string g_trace_dir;
+int g_trace_frame = -1;
+
+bool g_image = true;
+int g_sort_mode = COMPARISON_SORT;
 
 int g_phase = INITIAL_PHASE;
 int g_iter = 0;
 int g_curr_cam = 0;
 int g_prev_cam = 1;
 
+int g_num_ref = 1;
+int g_curr_ref = 0;
+int g_prev_ref = 1;
+std::vector<bool> g_ref_valid(2, false);
+std::vector<std::array<float, 16>> g_ref_pose(2);
+
 // Rendering Information
-std::vector<std::vector<tile_key_t>> g_gaussian_per_tile;
-std::vector<std::vector<tile_key_t>> g_reuse_gaussian_per_tile;
-std::vector<std::vector<tile_key_t>> g_merge_gaussian_per_tile;
+csr_list_t<tile_key_t> g_gaussian_per_tile;
+std::vector<csr_list_t<tile_key_t>> g_reuse_gaussian_per_tile(2);
+csr_list_t<tile_key_t> g_merge_gaussian_per_tile;
+
+csr_list_t<int> g_duplicated_gaussian;
+
+std::vector<std::vector<footprint_t>> g_footprint(2);
+std::vector<std::vector<uint64_t>> g_footprint_mask(2);
+std::vector<std::vector<uint64_t>> g_footprint_subtile(2);
 
-std::vector<std::vector<int>> g_duplicated_gaussian;
+stats_t g_stats;
 
 float *g_raw_img = NULL;
 float *g_raw_T = NULL;
@@ -1,6 +1,8 @@
 #ifndef VARIABLE_H
 #define VARIABLE_H
 
+#include <array>
+#include <cstdint>
 #include <iostream>
 #include <string>
 #include <vector>
@@ -11,6 +13,8 @@ extern int g_W, g_H;
 extern int g_tile_size;
 extern int g_min_tile_size;
 extern int g_chunk_size;
+extern int g_num_thread;
+extern bool g_cpu_preprocess;
 
 #define TILE_WIDTH ((g_W + g_tile_size - 1) / g_tile_size)
 #define TILE_HEIGHT ((g_H + g_tile_size - 1) / g_tile_size)
@@ -57,10 +61,17 @@ extern float *g_gaussian_eigen_value_cpu[2][2];
 extern int *g_gaussian_is_frustum_culled_cpu[2];
 
 // Trace Information
+#define TEXT_TRACE 0
+#define BINARY_TRACE 1
+
 extern bool g_trace;
+extern int g_trace_format;
 extern std::string g_trace_dir;
+extern int g_trace_frame;
 
 // Rendering Information
+extern bool g_image;
+
 struct tile_key_t {
     float depth;
     int idx;
@@ -72,6 +83,11 @@ struct tile_key_t {
 #define H_START 192
 #define H_END 256
 
+#define COMPARISON_SORT 0
+#define RADIX_SORT 1
+
+extern int g_sort_mode;
+
 #define INITIAL_PHASE 0
 #define REUSE_PHASE 1
 
@@ -80,11 +96,90 @@ extern int g_iter;
 extern int g_curr_cam;
 extern int g_prev_cam;
 
-extern std::vector<std::vector<tile_key_t>> g_gaussian_per_tile;
-extern std::vector<std::vector<tile_key_t>> g_reuse_gaussian_per_tile;
-extern std::vector<std::vector<tile_key_t>> g_merge_gaussian_per_tile;
+// Reference frames for reuse. Each frame leaves its footprints, reuse lists
+// and camera pose (world-to-view matrix) in slot g_curr_ref. The slots form
+// a ring of g_num_ref + 1, so the last g_num_ref frames stay available, and
+// the reuse phase reuses from g_prev_ref, the one nearest the current pose.
+extern int g_num_ref;
+extern int g_curr_ref;
+extern int g_prev_ref;
+extern std::vector<bool> g_ref_valid;
+extern std::vector<std::array<float, 16>> g_ref_pose;
+
+// Lists stored back to back in one array (CSR). List i holds
+// key[offset[i], offset[i] + count[i]) and may grow up to offset[i + 1].
+// The buffers keep their capacity from frame to frame.
+template <typename T>
+struct csr_list_t {
+    std::vector<int64_t> offset;
+    std::vector<int> count;
+    std::vector<T> key;
+
+    void reset(const int n) {
+        offset.assign(n + 1, 0);
+        count.assign(n, 0);
+    }
+
+    // Sizes key once offset has been filled in
+    void alloc() {
+        key.resize(offset.back());
+    }
+
+    int size() const {
+        return count.size();
+    }
+
+    T *begin(const int i) {
+        return key.data() + offset[i];
+    }
+
+    T *end(const int i) {
+        return key.data() + offset[i] + count[i];
+    }
+};
+
+extern csr_list_t<tile_key_t> g_gaussian_per_tile;
+extern std::vector<csr_list_t<tile_key_t>> g_reuse_gaussian_per_tile;
+extern csr_list_t<tile_key_t> g_merge_gaussian_per_tile;
+
+extern csr_list_t<int> g_duplicated_gaussian;
+
+// Tile footprint of each Gaussian, per reference slot (see footprint.h)
+struct footprint_t {
+    int rect_min_x, rect_min_y;
+    int rect_max_x, rect_max_y;
+    int64_t mask_offset;
+    int64_t subtile_offset;
+};
+
+extern std::vector<std::vector<footprint_t>> g_footprint;
+extern std::vector<std::vector<uint64_t>> g_footprint_mask;
+extern std::vector<std::vector<uint64_t>> g_footprint_subtile;
+
+// Statistics of the last render (see get_stats)
+struct stats_t {
+    int phase;
+    int64_t num_new;        // Entries merged from the new lists
+    int64_t num_reuse;      // Entries merged from the reuse lists
+    int64_t num_merge;      // Entries in the merged lists
+    int64_t num_drop;       // Merged entries not kept for the next frame's reuse
+    int64_t num_duplicated; // Tile entries binned this frame
+    int num_culled;         // Gaussians culled by preprocess (radius 0)
+
+    // Per tile: new list, reuse list (before merging) and merged list sizes
+    std::vector<int> new_per_tile;
+    std::vector<int> reuse_per_tile;
+    std::vector<int> merge_per_tile;
+
+    // Wall time of each step of render() in milliseconds
+    double preprocess_ms;
+    double footprint_ms;
+    double sort_ms;
+    double rasterize_ms;
+    double trace_ms;
+};
 
-extern std::vector<std::vector<int>> g_duplicated_gaussian;
+extern stats_t g_stats;
 
 extern float *g_raw_img;
 extern float *g_raw_T;
@@ -1,15 +1,99 @@
+#include <pybind11/numpy.h>
 #include <torch/extension.h>
 
 #include "cuda_rasterizer/forward.h"
 
+// NumPy view of a per-tile array of stats, kept alive by the stats object
+template <std::vector<int> poc::stats_t::*array>
+static py::array_t<int> per_tile(py::object self) {
+    const std::vector<int> &v = self.cast<const poc::stats_t &>().*array;
+
+    return py::array_t<int>(v.size(), v.data(), self);
+}
+
+// Read-only NumPy view of backend memory, which the backend keeps owning
+template <typename T>
+static py::array_t<T> view(const T *data, std::vector<py::ssize_t> shape, std::vector<py::ssize_t> strides) {
+    // An empty vector has no data; NumPy then allocates the (empty) array
+    py::object base = data ? (py::object)py::capsule(data, [](void *) {}) : py::none();
+    py::array_t<T> array(shape, strides, data, base);
+    array.attr("setflags")(py::arg("write") = false);
+
+    return array;
+}
+
+// CSR arrays of a list: list i holds idx/depth[offset[i], offset[i] + count[i])
+static py::dict list_view(const poc::csr_list_t<poc::tile_key_t> &list) {
+    static const poc::tile_key_t empty = {};
+
+    const py::ssize_t num_key = list.key.size();
+    const py::ssize_t stride = sizeof(poc::tile_key_t);
+    const poc::tile_key_t *key = list.key.empty() ? &empty : list.key.data();
+
+    py::dict d;
+    d["offset"] = view<int64_t>(list.offset.data(), {(py::ssize_t)list.offset.size()}, {sizeof(int64_t)});
+    d["count"] = view<int>(list.count.data(), {(py::ssize_t)list.count.size()}, {sizeof(int)});
+    d["idx"] = view<int>(&key->idx, {num_key}, {stride});
+    d["depth"] = view<float>(&key->depth, {num_key}, {stride});
+
+    return d;
+}
+
+static py::dict get_lists() {
+    const std::vector<uint8_t> &subtile_mask = poc::get_subtile_mask();
+    const poc::csr_list_t<poc::tile_key_t> &reuse_list = poc::get_reuse_list();
+
+    const py::ssize_t num_key = reuse_list.key.size();
+    const py::ssize_t subtile_mask_size = num_key ? subtile_mask.size() / num_key : 0;
+
+    py::dict reuse = list_view(reuse_list);
+    reuse["subtile_mask"] = view<uint8_t>(subtile_mask.data(), {num_key, subtile_mask_size}, {subtile_mask_size, 1});
+
+    py::dict lists;
+    lists["merge"] = list_view(poc::get_merge_list());
+    lists["reuse"] = reuse;
+
+    return lists;
+}
+
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+    py::class_<poc::stats_t, std::shared_ptr<poc::stats_t>>(m, "Stats")
+        .def_readonly("phase", &poc::stats_t::phase)
+        .def_readonly("num_new", &poc::stats_t::num_new)
+        .def_readonly("num_reuse", &poc::stats_t::num_reuse)
+        .def_readonly("num_merge", &poc::stats_t::num_merge)
+        .def_readonly("num_drop", &poc::stats_t::num_drop)
+        .def_readonly("num_duplicated", &poc::stats_t::num_duplicated)
+        .def_readonly("num_culled", &poc::stats_t::num_culled)
+        .def_property_readonly("new_per_tile", &per_tile<&poc::stats_t::new_per_tile>)
+        .def_property_readonly("reuse_per_tile", &per_tile<&poc::stats_t::reuse_per_tile>)
+        .def_property_readonly("merge_per_tile", &per_tile<&poc::stats_t::merge_per_tile>)
+        .def_readonly("preprocess_ms", &poc::stats_t::preprocess_ms)
+        .def_readonly("footprint_ms", &poc::stats_t::footprint_ms)
+        .def_readonly("sort_ms", &poc::stats_t::sort_ms)
+        .def_readonly("rasterize_ms", &poc::stats_t::rasterize_ms)
+        .def_readonly("trace_ms", &poc::stats_t::trace_ms);
+
     m.def("set_config", &poc::set_config);
     m.def("set_cam", &poc::set_cam);
     m.def("set_gaussian", &poc::set_gaussian);
     m.def("set_trace", &poc::set_trace);
+    m.def("set_image", &poc::set_image);
+    m.def("set_sort_mode", &poc::set_sort_mode);
     m.def("set_phase", &poc::set_phase);
+    m.def("set_reference", &poc::set_reference);
+    m.def("set_iter", &poc::set_iter);
+
+    m.def("save_state", &poc::save_state);
+    m.def("load_state", &poc::load_state);
 
-    m.def("render", &poc::render);
+    // Host-side work only; lets Python threads run during a frame
+    m.def("render", &poc::render, py::call_guard<py::gil_scoped_release>());
+    m.def("flush_trace", &poc::flush_trace, py::call_guard<py::gil_scoped_release>());
+    m.def("open_trace_container", &poc::open_trace_container, py::call_guard<py::gil_scoped_release>());
+    m.def("close_trace_container", &poc::close_trace_container, py::call_guard<py::gil_scoped_release>());
 
     m.def("get_img", &poc::get_img);
+    m.def("get_stats", &poc::get_stats);
+    m.def("get_lists", &get_lists);
 }
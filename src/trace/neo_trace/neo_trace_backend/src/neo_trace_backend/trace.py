@@ -0,0 +1,296 @@
+import os
+
+import numpy as np
+
+TRACE_MAGIC = b"NEOTRACE"
+TRACE_VERSION = 1
+
+TEXT_TRACE_FILE = "poc.trace"
+BINARY_TRACE_FILE = "poc.trace.bin"
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("header_size", "<u4"),
+        ("W", "<i4"),
+        ("H", "<i4"),
+        ("tile_size", "<i4"),
+        ("min_tile_size", "<i4"),
+        ("chunk_size", "<i4"),
+        ("P", "<i4"),
+        ("num_tile", "<i4"),
+        ("num_subtile", "<i4"),
+        ("num_duplicated_gaussian", "<i8"),
+        ("num_reuse_gaussian", "<i8"),
+    ]
+)
+
+
+CONTAINER_MAGIC = b"NEOTRCON"
+CONTAINER_RECORD_MAGIC = b"NEOFRAME"
+CONTAINER_FOOTER_MAGIC = b"NEOTRIDX"
+CONTAINER_VERSION = 1
+
+CONTAINER_FILE = "trace.neotrace"
+
+CONTAINER_HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("header_size", "<u4"),
+    ]
+)
+
+CONTAINER_RECORD_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("frame", "<i8"),
+        ("offset", "<i8"),
+        ("size", "<i8"),
+        ("format", "<i4"),
+        ("reserved", "<i4"),
+    ]
+)
+
+CONTAINER_FOOTER_DTYPE = np.dtype(
+    [
+        ("index_offset", "<i8"),
+        ("num_trace", "<i8"),
+        ("magic", "S8"),
+    ]
+)
+
+# Trace formats, as in neo_trace_backend.TEXT_TRACE/BINARY_TRACE
+TRACE_FILE = {0: TEXT_TRACE_FILE, 1: BINARY_TRACE_FILE}
+
+
+class Trace:
+    def __init__(self, path, buffer=None):
+        if buffer is None:
+            if os.path.isdir(path):
+                path = os.path.join(path, BINARY_TRACE_FILE)
+
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+        self.path = path
+        self.buffer = buffer
+
+        header = self.buffer[: HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header["magic"] != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a binary Neo trace")
+        if header["version"] != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {header['version']} in {path}")
+
+        self.W = int(header["W"])
+        self.H = int(header["H"])
+        self.tile_size = int(header["tile_size"])
+        self.min_tile_size = int(header["min_tile_size"])
+        self.chunk_size = int(header["chunk_size"])
+        self.P = int(header["P"])
+        self.num_tile = int(header["num_tile"])
+        self.num_subtile = int(header["num_subtile"])
+        self.num_duplicated_gaussian = int(header["num_duplicated_gaussian"])
+        self.num_reuse_gaussian = int(header["num_reuse_gaussian"])
+        self.subtile_mask_size = (self.num_subtile + 7) // 8
+
+        self._offset = int(header["header_size"])
+
+        self.is_frustum_culled = self._section("u1", self.P)
+        self.gaussian_offset = self._section("<i8", self.P + 1)
+        self.gaussian_tile = self._section("<i4", self.num_duplicated_gaussian)
+        self.num_new_gaussian_per_tile = self._section("<i4", self.num_tile)
+        self.num_reuse_gaussian_per_tile = self._section("<i4", self.num_tile)
+        self.tile_offset = self._section("<i8", self.num_tile + 1)
+        self.tile_gaussian = self._section("<i4", self.num_reuse_gaussian)
+        self.subtile_mask = self._section(
+            "u1", self.num_reuse_gaussian * self.subtile_mask_size
+        ).reshape(self.num_reuse_gaussian, self.subtile_mask_size)
+
+    def _section(self, dtype, count):
+        dtype = np.dtype(dtype)
+        size = dtype.itemsize * count
+        array = self.buffer[self._offset : self._offset + size].view(dtype)
+        self._offset += (size + 7) // 8 * 8
+        return array
+
+    def tiles_of(self, gaussian):
+        begin, end = self.gaussian_offset[gaussian : gaussian + 2]
+        return self.gaussian_tile[begin:end]
+
+    def gaussians_of(self, tile):
+        begin, end = self.tile_offset[tile : tile + 2]
+        return self.tile_gaussian[begin:end]
+
+    def subtiles_of(self, tile):
+        begin, end = self.tile_offset[tile : tile + 2]
+        subtiles = np.unpackbits(
+            self.subtile_mask[begin:end], axis=1, bitorder="little"
+        )
+        return subtiles[:, : self.num_subtile].astype(bool)
+
+
+class TraceContainer:
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, CONTAINER_FILE)
+
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+        size = CONTAINER_HEADER_DTYPE.itemsize
+        if len(self.buffer) < size:
+            raise ValueError(f"{path} is not a trace container")
+
+        header = self.buffer[:size].view(CONTAINER_HEADER_DTYPE)[0]
+        if header["magic"] != CONTAINER_MAGIC:
+            raise ValueError(f"{path} is not a trace container")
+        if header["version"] != CONTAINER_VERSION:
+            raise ValueError(
+                f"Unsupported container version {header['version']} in {path}"
+            )
+
+        index = self._index()
+        if index is None:
+            index = self._scan(int(header["header_size"]))
+
+        # A frame traced again supersedes its earlier traces
+        self.records = {int(record["frame"]): record for record in index}
+
+    def _index(self):
+        size = CONTAINER_FOOTER_DTYPE.itemsize
+        if len(self.buffer) < size:
+            return None
+
+        footer = self.buffer[-size:].view(CONTAINER_FOOTER_DTYPE)[0]
+        index_offset = int(footer["index_offset"])
+        index_size = int(footer["num_trace"]) * CONTAINER_RECORD_DTYPE.itemsize
+
+        if footer[
+            "magic"
+        ] != CONTAINER_FOOTER_MAGIC or index_offset + index_size + size != len(
+            self.buffer
+        ):
+            return None
+
+        return self.buffer[index_offset : index_offset + index_size].view(
+            CONTAINER_RECORD_DTYPE
+        )
+
+    # Without a footer (the writer did not close it), walk the records
+    def _scan(self, offset):
+        size = CONTAINER_RECORD_DTYPE.itemsize
+        index = []
+
+        while offset + size <= len(self.buffer):
+            record = self.buffer[offset : offset + size].view(CONTAINER_RECORD_DTYPE)[0]
+
+            if (
+                record["magic"] != CONTAINER_RECORD_MAGIC
+                or record["offset"] != offset + size
+                or record["offset"] + record["size"] > len(self.buffer)
+            ):
+                break
+
+            index.append(record)
+            offset = int(record["offset"] + (record["size"] + 7) // 8 * 8)
+
+        return index
+
+    @property
+    def frames(self):
+        return sorted(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, frame):
+        return frame in self.records
+
+    def trace_file(self, frame):
+        """File name the frame's trace has in a per-frame trace directory."""
+        return TRACE_FILE[int(self.records[frame]["format"])]
+
+    def read(self, frame):
+        """The frame's trace file contents, a read-only view."""
+        record = self.records[frame]
+        offset = int(record["offset"])
+        return self.buffer[offset : offset + int(record["size"])]
+
+    def load(self, frame):
+        """The frame's binary trace (see load_trace)."""
+        return Trace(f"{self.path}:{frame}", self.read(frame))
+
+    def extract(self, output_path, frames=None):
+        """Write frames (all by default) as output_path/<frame>/poc.trace[.bin],
+        the layout of an uncontained run."""
+        for frame in self.frames if frames is None else frames:
+            trace_dir = os.path.join(output_path, str(frame))
+            os.makedirs(trace_dir, exist_ok=True)
+
+            with open(os.path.join(trace_dir, self.trace_file(frame)), "wb") as file:
+                file.write(self.read(frame))
+
+
+def merge_containers(path, paths):
+    """Write the traces of the containers at paths into one container at path.
+
+    Traces keep the order of paths, and a frame in several containers keeps
+    its trace from the last one, as if they had been appended in turn. path
+    is replaced, and may be one of paths.
+    """
+    records = dict()
+    for container in map(TraceContainer, paths):
+        for frame, record in container.records.items():
+            records[frame] = (container, record)
+
+    header = np.zeros(1, CONTAINER_HEADER_DTYPE)
+    header["magic"] = CONTAINER_MAGIC
+    header["version"] = CONTAINER_VERSION
+    header["header_size"] = CONTAINER_HEADER_DTYPE.itemsize
+
+    index = np.zeros(len(records), CONTAINER_RECORD_DTYPE)
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(header.tobytes())
+
+        for i, (frame, (container, record)) in enumerate(records.items()):
+            index[i]["magic"] = CONTAINER_RECORD_MAGIC
+            index[i]["frame"] = frame
+            index[i]["offset"] = file.tell() + CONTAINER_RECORD_DTYPE.itemsize
+            index[i]["size"] = record["size"]
+            index[i]["format"] = record["format"]
+
+            data = container.read(frame)
+            file.write(index[i].tobytes())
+            file.write(data)
+            file.write(bytes(-len(data) % 8))
+
+        footer = np.zeros(1, CONTAINER_FOOTER_DTYPE)
+        footer["index_offset"] = file.tell()
+        footer["num_trace"] = len(index)
+        footer["magic"] = CONTAINER_FOOTER_MAGIC
+
+        file.write(index.tobytes())
+        file.write(footer.tobytes())
+
+    os.replace(path + ".tmp", path)
+
+
+def load_container(path):
+    """Memory-map a trace container written while ``trace_container`` is set.
+
+    ``path`` may be the container itself or the run's output directory.
+    Traces are looked up by frame id; ``read`` and ``load`` return views into
+    the mapped file.
+    """
+    return TraceContainer(path)
+
+
+def load_trace(path):
+    """Memory-map a binary trace written with ``trace_format=BINARY_TRACE``.
+
+    ``path`` may be the trace file itself or the per-frame trace directory.
+    All arrays are read-only views into the mapped file.
+    """
+    return Trace(path)
@@ -1,5 +1,7 @@
+import multiprocessing
 import os
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
 import torch
 import torchvision
@@ -7,86 +9,199 @@ from tqdm import tqdm
 
 from . import mode
 from .arguments import ModelParams, PipelineParams, get_combined_args
+from .mode.scheduler import get_scheduler
 from .scene import Scene
 from .scene.gaussian_model import GaussianModel
-from .utils.custom_utils import get_config, get_resolution, set_config
+from .utils.custom_utils import get_config, get_frame, get_resolution, set_config
+from .utils.writer_utils import AsyncWriter
 
 try:
     import neo_trace_backend
 except:
     pass
 
+CONTAINER_FILE = "trace.neotrace"
+
+
+def save_images(render_path, gts_path, idx, view, future):
+    gt = view.original_image[0:3, :, :]
+    rendering = future.result()
+
+    torchvision.utils.save_image(
+        rendering, os.path.join(render_path, "{0:05d}".format(idx) + ".png")
+    )
+    torchvision.utils.save_image(
+        gt, os.path.join(gts_path, "{0:05d}".format(idx) + ".png")
+    )
+
+
+def shard_container_file(begin, end):
+    """Container a shard of frames [begin, end) traces into; render_shards
+    merges them into CONTAINER_FILE."""
+    return f"trace_{begin}_{end}.neotrace"
+
 
 def render_set(
     output_path,
     views,
+    begin=0,
+    end=None,
+    state_path=None,
 ):
+    """Render and trace frames [begin, end) of views.
+
+    The first frame rendered is scratch-sorted and not traced. For begin > 0
+    this is the warm-up frame begin - 1, which only builds the reuse state
+    and is not saved either. If state_path is given, the reuse state saved
+    after frame begin - 1 (see neo_trace_backend.save_state) is loaded
+    instead, and every frame is rendered as usual.
+
+    Traces go to trace/<idx>/, or with trace_container set, into a single
+    container file in output_path (see neo_trace_backend.load_container).
+    """
     TRACE_MODE = get_config()["trace_mode"]
     REUSE_MODE = get_config()["reuse_mode"]
     IMAGE_MODE = get_config()["image_mode"]
+    TRACE_CONTAINER = get_config().get("trace_container", False)
+    TRACE_FORMAT = (
+        neo_trace_backend.BINARY_TRACE
+        if get_config().get("trace_format", "text") == "binary"
+        else neo_trace_backend.TEXT_TRACE
+    )
+
+    neo_trace_backend.set_image(IMAGE_MODE)
 
     if IMAGE_MODE:
+        width, height = get_resolution()
         render_path = os.path.join(output_path, "renders")
         gts_path = os.path.join(output_path, "gt")
         os.makedirs(render_path, exist_ok=True)
         os.makedirs(gts_path, exist_ok=True)
 
-    if TRACE_MODE:
+    if end is None:
+        end = len(views)
+
+    if TRACE_MODE and TRACE_CONTAINER:
+        # One container per frame range, so shards never share one
+        container = (
+            CONTAINER_FILE
+            if begin == 0 and end == len(views)
+            else shard_container_file(begin, end)
+        )
+        os.makedirs(output_path, exist_ok=True)
+        neo_trace_backend.open_trace_container(os.path.join(output_path, container))
+    elif TRACE_MODE:
         os.makedirs(os.path.join(output_path, "trace"), exist_ok=True)
 
-    for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
-        if idx == 0:
+    if state_path is not None:
+        start = begin
+        neo_trace_backend.load_state(state_path)
+    else:
+        start = max(begin - 1, 0)
+
+        # Start from empty references and the frame's iteration parity, as if
+        # views had been rendered from the first one
+        neo_trace_backend.set_reference(get_config().get("num_reference", 1))
+        neo_trace_backend.set_iter(start)
+
+    # Images are encoded and written off the frame loop. A writer waits on
+    # the frame's render future, so frame idx is saved while idx + 1 renders.
+    writer = AsyncWriter(get_config().get("num_writer", 2))
+    scheduler = get_scheduler(get_config())
+
+    if state_path is not None:
+        scheduler.reset(begin - 1)
+
+    for idx in tqdm(range(start, end), desc="Rendering progress"):
+        view = views[idx]
+
+        if idx == start and state_path is None:
+            neo_trace_backend.set_trace(False, "", TRACE_FORMAT)
             neo_trace_backend.set_phase(neo_trace_backend.INITIAL_PHASE)
             neo_trace_backend.set_cam(views[idx])
+            scheduler.reset(idx)
         else:
-            if TRACE_MODE:
+            stats = neo_trace_backend.get_stats()
+            refresh_idx = scheduler.refresh(idx)
+
+            if refresh_idx is not None:
+                neo_trace_backend.set_trace(False, "", TRACE_FORMAT)
+                neo_trace_backend.set_phase(neo_trace_backend.INITIAL_PHASE)
+                neo_trace_backend.set_cam(views[refresh_idx])
+                neo_trace_backend.render()
+
+            if TRACE_MODE and TRACE_CONTAINER:
+                neo_trace_backend.set_trace(TRACE_MODE, "", TRACE_FORMAT, idx)
+            elif TRACE_MODE:
                 TRACE_PATH = os.path.join(output_path, "trace", str(idx))
                 os.makedirs(TRACE_PATH, exist_ok=True)
-                neo_trace_backend.set_trace(TRACE_MODE, TRACE_PATH)
+                neo_trace_backend.set_trace(TRACE_MODE, TRACE_PATH, TRACE_FORMAT)
 
-            if REUSE_MODE:
+            if REUSE_MODE and not scheduler.scratch(idx, stats):
                 neo_trace_backend.set_phase(neo_trace_backend.REUSE_PHASE)
             else:
                 neo_trace_backend.set_phase(neo_trace_backend.INITIAL_PHASE)
 
             neo_trace_backend.set_cam(views[idx])
 
-        neo_trace_backend.render()
+        future = (
+            neo_trace_backend.render_async(width, height)
+            if IMAGE_MODE
+            else neo_trace_backend.render_async()
+        )
 
-        if IMAGE_MODE:
-            width, height = get_resolution()
+        if IMAGE_MODE and idx >= begin:
+            view.prefetch_image()
+            writer.submit(save_images, render_path, gts_path, idx, view, future)
 
-            gt = view.original_image[0:3, :, :]
-            rendering = neo_trace_backend.get_img(width, height)
+    writer.close()
 
-            torchvision.utils.save_image(
-                rendering, os.path.join(render_path, "{0:05d}".format(idx) + ".png")
-            )
-            torchvision.utils.save_image(
-                gt, os.path.join(gts_path, "{0:05d}".format(idx) + ".png")
-            )
+    # Wait for the last frame's trace
+    neo_trace_backend.render_wait()
 
+    if TRACE_MODE and TRACE_CONTAINER:
+        neo_trace_backend.close_trace_container()
 
-def render_sets(dataset: ModelParams, pipeline: PipelineParams, output_path):
-    with torch.no_grad():
-        width, height = get_resolution()
-        config = get_config()
-
-        neo_trace_backend.set_config(
-            width,
-            height,
-            config["tile_size"],
-            config["subtile_size"],
-            config["chunk_size"],
-        )
 
-        gaussians = GaussianModel(dataset.sh_degree)
-        scene = Scene(dataset, gaussians, load_iteration=-1, shuffle=False)
+def configure_backend():
+    """Pass the current config's resolution and tiling to the backend."""
+    width, height = get_resolution()
+    config = get_config()
 
-        neo_trace_backend.set_gaussian(gaussians)
+    neo_trace_backend.set_config(
+        width,
+        height,
+        config["tile_size"],
+        config["subtile_size"],
+        config["chunk_size"],
+        config.get("num_thread", 1),
+    )
+    neo_trace_backend.set_sort_mode(
+        neo_trace_backend.RADIX_SORT
+        if config.get("sort_mode", "comparison") == "radix"
+        else neo_trace_backend.COMPARISON_SORT
+    )
+
+
+def load_scene(dataset: ModelParams):
+    """Configure the backend and load the Gaussians and cameras into it."""
+    configure_backend()
+
+    # Gaussians on the CPU make the backend run its CPU preprocess
+    device = get_config().get("device", "cuda")
+    dataset.data_device = device
+
+    gaussians = GaussianModel(dataset.sh_degree, device=device)
+    scene = Scene(dataset, gaussians, load_iteration=-1, shuffle=False)
 
-        bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
-        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    neo_trace_backend.set_gaussian(gaussians)
+
+    return scene
+
+
+def render_sets(dataset: ModelParams, pipeline: PipelineParams, output_path):
+    with torch.no_grad():
+        scene = load_scene(dataset)
 
         render_set(
             output_path,
@@ -94,7 +209,76 @@ def render_sets(dataset: ModelParams, pipeline: PipelineParams, output_path):
         )
 
 
-def run(dataset_path, model_path, output_path, yaml_path):
+# Views of a sharded runner worker, loaded once per process
+_worker_views = None
+
+
+def _init_worker(dataset_path, model_path, yaml_path):
+    global _worker_views
+
+    dataset, _ = load_args(dataset_path, model_path, yaml_path)
+
+    torch.set_grad_enabled(False)
+    _worker_views = load_scene(dataset).getTrainCameras()
+
+
+def _render_shard(output_path, begin, end):
+    render_set(output_path, _worker_views, begin, end)
+
+
+def render_shards(dataset_path, model_path, output_path, yaml_path):
+    """Render the frames in contiguous shards on a process pool.
+
+    Each shard starts from its own warm-up frame, so shards are independent
+    and write disjoint trace/<idx> directories of the usual layout. With
+    trace_container set, each shard writes its own container, and these are
+    merged into output_path/trace.neotrace once all shards are done.
+    """
+    config = get_config()
+    num_frame = len(get_frame())
+    num_shard = min(config["num_shard"], num_frame)
+    num_process = config.get("num_process", num_shard)
+
+    bound = [num_frame * shard // num_shard for shard in range(num_shard + 1)]
+
+    # CUDA cannot be used in forked children
+    with ProcessPoolExecutor(
+        max_workers=num_process,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(dataset_path, model_path, yaml_path),
+    ) as executor:
+        futures = [
+            executor.submit(_render_shard, output_path, bound[shard], bound[shard + 1])
+            for shard in range(num_shard)
+        ]
+
+        for future in futures:
+            future.result()
+
+    # A single shard is the whole run and already wrote CONTAINER_FILE
+    if num_shard > 1 and config["trace_mode"] and config.get("trace_container", False):
+        merge_shard_containers(output_path, bound)
+
+
+def merge_shard_containers(output_path, bound):
+    """Merge the shards' containers into the one an unsharded run writes,
+    after the traces it already holds, and remove them."""
+    container = os.path.join(output_path, CONTAINER_FILE)
+    shards = [
+        os.path.join(output_path, shard_container_file(begin, end))
+        for begin, end in zip(bound[:-1], bound[1:])
+    ]
+
+    neo_trace_backend.merge_containers(
+        container, ([container] if os.path.exists(container) else []) + shards
+    )
+
+    for shard in shards:
+        os.remove(shard)
+
+
+def load_args(dataset_path, model_path, yaml_path):
     set_config(yaml_path)
 
     parser = ArgumentParser(description="Testing script parameters")
@@ -107,9 +291,51 @@ def run(dataset_path, model_path, output_path, yaml_path):
     pipeline = PipelineParams(parser)
     args = get_combined_args(parser, dataset_path, model_path)
 
+    return model.extract(args), pipeline.extract(args)
+
+
+def sweep(dataset_path, model_path, runs):
+    """Render one scene under several configurations in a single process.
+
+    runs is a list of (output_path, yaml_path) pairs. The Gaussians and
+    cameras are loaded once, with the first configuration. Each run then
+    reconfigures the backend and renders into its own output_path, as run
+    would. Configurations may vary tile_size, subtile_size, chunk_size,
+    resolution and the trace options, but not frame or device, which decide
+    what is loaded. num_shard is ignored.
+    """
+    dataset, _ = load_args(dataset_path, model_path, runs[0][1])
+    frame = get_frame()
+    device = get_config().get("device", "cuda")
+
+    with torch.no_grad():
+        scene = load_scene(dataset)
+        views = scene.getTrainCameras()
+
+        for output_path, yaml_path in runs:
+            set_config(yaml_path)
+
+            if get_frame() != frame or get_config().get("device", "cuda") != device:
+                raise ValueError(
+                    f"{yaml_path}: frame and device must match the first configuration"
+                )
+
+            configure_backend()
+            neo_trace_backend.set_gaussian(scene.gaussians)
+
+            for view in views:
+                view.set_resolution(get_resolution())
+
+            print(f"Rendering {model_path} with {yaml_path}")
+            render_set(output_path, views)
+
+
+def run(dataset_path, model_path, output_path, yaml_path):
+    dataset, pipeline = load_args(dataset_path, model_path, yaml_path)
+
     print(f"Rendering {model_path} on dataset {dataset_path}")
-    render_sets(
-        model.extract(args),
-        pipeline.extract(args),
-        output_path,
-    )
+
+    if get_config().get("num_shard", 1) > 1:
+        render_shards(dataset_path, model_path, output_path, yaml_path)
+    else:
+        render_sets(dataset, pipeline, output_path)
@@ -1 +1 @@
-from . import background_sorting, periodic_sorting
+from . import background_sorting, periodic_sorting, scheduler
@@ -1,6 +1,5 @@
 import math
 import os
-import random
 from argparse import ArgumentParser
 
 import torch
@@ -11,6 +10,8 @@ from ..arguments import ModelParams, PipelineParams, get_combined_args
 from ..scene import Scene
 from ..scene.gaussian_model import GaussianModel
 from ..utils.custom_utils import get_config, get_resolution, set_config
+from ..utils.writer_utils import AsyncWriter
+from .scheduler import BackgroundScheduler
 
 try:
     import periodic_sorting_trace_backend
@@ -37,25 +38,28 @@ def render_set(
     if TRACE_MODE:
         os.makedirs(os.path.join(output_path, "trace"), exist_ok=True)
 
-    REFRESH_IDX = 0
+    writer = AsyncWriter(get_config().get("num_writer", 2))
+
+    scheduler = BackgroundScheduler(SKIP_WINDOW)
+
     for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
         if idx == 0:
             periodic_sorting_trace_backend.set_phase(
                 periodic_sorting_trace_backend.INITIAL_PHASE
             )
             periodic_sorting_trace_backend.set_cam(views[idx])
+            scheduler.reset(idx)
+
+        refresh_idx = scheduler.refresh(idx)
 
-        if (idx - REFRESH_IDX) == SKIP_WINDOW:
+        if refresh_idx is not None:
             periodic_sorting_trace_backend.set_phase(
                 periodic_sorting_trace_backend.INITIAL_PHASE
             )
-            MISS_RANGE = random.randint(0, SKIP_WINDOW // 2)
-            periodic_sorting_trace_backend.set_cam(views[idx - MISS_RANGE])
+            periodic_sorting_trace_backend.set_cam(views[refresh_idx])
             periodic_sorting_trace_backend.set_trace(False, "placeholder")
             periodic_sorting_trace_backend.render()
 
-            REFRESH_IDX = idx
-
         if idx != 0:
             if TRACE_MODE:
                 TRACE_PATH = os.path.join(output_path, "trace", str(idx))
@@ -79,15 +83,22 @@ def render_set(
             width, height = get_resolution()
 
             gt = view.original_image[0:3, :, :]
-            rendering = periodic_sorting_trace_backend.get_img(width, height)
+            # The backend reuses its image buffer for the next frame
+            rendering = periodic_sorting_trace_backend.get_img(width, height).clone()
 
-            torchvision.utils.save_image(
-                rendering, os.path.join(render_path, "{0:05d}".format(idx) + ".png")
+            writer.submit(
+                torchvision.utils.save_image,
+                rendering,
+                os.path.join(render_path, "{0:05d}".format(idx) + ".png"),
             )
-            torchvision.utils.save_image(
-                gt, os.path.join(gts_path, "{0:05d}".format(idx) + ".png")
+            writer.submit(
+                torchvision.utils.save_image,
+                gt,
+                os.path.join(gts_path, "{0:05d}".format(idx) + ".png"),
             )
 
+    writer.close()
+
 
 def render_sets(dataset: ModelParams, pipeline: PipelineParams, output_path):
     with torch.no_grad():
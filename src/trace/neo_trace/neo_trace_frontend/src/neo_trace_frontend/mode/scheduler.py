@@ -0,0 +1,94 @@
+import random
+
+
+class Scheduler:
+    """Per-frame sort refresh policy of a render_set loop.
+
+    The first frame of a run is always sorted from scratch and passed to
+    ``reset``. For every later frame idx, the loop first calls
+    ``refresh(idx)``. If that returns a view index, the loop sorts that view
+    from scratch without tracing it, to refresh the reuse state. Then it
+    renders frame idx from scratch if ``scratch(idx, stats)`` is true, and in
+    the reuse phase otherwise. ``stats`` holds the backend statistics of the
+    previous render, or None if the backend has none.
+
+    The base class reuses every frame.
+    """
+
+    def reset(self, idx):
+        pass
+
+    def refresh(self, idx):
+        return None
+
+    def scratch(self, idx, stats):
+        return False
+
+
+class PeriodicScheduler(Scheduler):
+    """Sort every period-th frame from scratch."""
+
+    def __init__(self, period=30):
+        self.period = period
+
+    def scratch(self, idx, stats):
+        return idx % self.period == 0
+
+
+class BackgroundScheduler(Scheduler):
+    """Every window frames, sort a view up to window / 2 frames back from
+    scratch, as a background sort finishing late would."""
+
+    def __init__(self, window=6):
+        self.window = window
+        self.refresh_idx = 0
+
+    def reset(self, idx):
+        self.refresh_idx = idx
+
+    def refresh(self, idx):
+        if idx - self.refresh_idx != self.window:
+            return None
+
+        self.refresh_idx = idx
+        return idx - random.randint(0, self.window // 2)
+
+
+class AdaptiveScheduler(Scheduler):
+    """Sort from scratch once the previous reuse frame got too expensive.
+
+    That is when the entries merged from the new lists exceed new_ratio times
+    those merged from the reuse lists, or when more than churn of the merged
+    entries dropped out of the reuse lists.
+    """
+
+    def __init__(self, new_ratio=0.5, churn=0.5):
+        self.new_ratio = new_ratio
+        self.churn = churn
+
+    def scratch(self, idx, stats):
+        if stats is None or stats.num_reuse == 0:
+            return False
+
+        new_ratio = stats.num_new / stats.num_reuse
+        churn = stats.num_drop / max(stats.num_merge, 1)
+
+        return new_ratio > self.new_ratio or churn > self.churn
+
+
+def get_scheduler(config):
+    scheduler = config.get("scheduler", "reuse")
+
+    if scheduler == "reuse":
+        return Scheduler()
+    elif scheduler == "periodic":
+        return PeriodicScheduler(config.get("refresh_period", 30))
+    elif scheduler == "background":
+        return BackgroundScheduler(config.get("refresh_window", 6))
+    elif scheduler == "adaptive":
+        return AdaptiveScheduler(
+            config.get("refresh_new_ratio", 0.5),
+            config.get("refresh_churn", 0.5),
+        )
+
+    raise ValueError(f"Unknown scheduler: {scheduler}")
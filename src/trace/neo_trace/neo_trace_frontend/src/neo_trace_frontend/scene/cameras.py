@@ -9,6 +9,8 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 import torch
@@ -17,6 +19,9 @@ from torch import nn
 from ..utils.general_utils import PILtoTorch
 from ..utils.graphics_utils import getProjectionMatrix, getWorld2View2
 
+# Decodes ground-truth images for Camera.prefetch_image
+_image_executor = ThreadPoolExecutor(thread_name_prefix="camera_image")
+
 
 class Camera(nn.Module):
     def __init__(
@@ -28,7 +33,7 @@ class Camera(nn.Module):
         FoVx,
         FoVy,
         depth_params,
-        image,
+        image_loader,
         invdepthmap,
         image_name,
         uid,
@@ -58,30 +63,25 @@ class Camera(nn.Module):
             )
             self.data_device = torch.device("cuda")
 
-        resized_image_rgb = PILtoTorch(image, resolution)
-        gt_image = resized_image_rgb[:3, ...]
-        self.alpha_mask = None
-        if resized_image_rgb.shape[0] == 4:
-            self.alpha_mask = resized_image_rgb[3:4, ...].to(self.data_device)
-        else:
-            self.alpha_mask = torch.ones_like(
-                resized_image_rgb[0:1, ...].to(self.data_device)
-            )
-
-        if train_test_exp and is_test_view:
-            if is_test_dataset:
-                self.alpha_mask[..., : self.alpha_mask.shape[-1] // 2] = 0
-            else:
-                self.alpha_mask[..., self.alpha_mask.shape[-1] // 2 :] = 0
+        # The ground-truth image is only decoded when first used (see
+        # original_image), so trace-only runs never read the image files
+        self.resolution = resolution
+        self.image_loader = image_loader
+        self.train_test_exp = train_test_exp
+        self.is_test_dataset = is_test_dataset
+        self.is_test_view = is_test_view
+        self._image = None
+        self._image_future = None
 
-        self.original_image = gt_image.clamp(0.0, 1.0).to(self.data_device)
-        self.image_width = self.original_image.shape[2]
-        self.image_height = self.original_image.shape[1]
+        self.image_width = resolution[0]
+        self.image_height = resolution[1]
 
         self.invdepthmap = None
         self.depth_reliable = False
         if invdepthmap is not None:
-            self.depth_mask = torch.ones_like(self.alpha_mask)
+            self.depth_mask = torch.ones(
+                (1, self.image_height, self.image_width), device=self.data_device
+            )
             self.invdepthmap = cv2.resize(invdepthmap, resolution)
             self.invdepthmap[self.invdepthmap < 0] = 0
             self.depth_reliable = True
@@ -113,14 +113,16 @@ class Camera(nn.Module):
         self.scale = scale
 
         self.world_view_transform = (
-            torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).cuda()
+            torch.tensor(getWorld2View2(R, T, trans, scale))
+            .transpose(0, 1)
+            .to(self.data_device)
         )
         self.projection_matrix = (
             getProjectionMatrix(
                 znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy
             )
             .transpose(0, 1)
-            .cuda()
+            .to(self.data_device)
         )
         self.full_proj_transform = (
             self.world_view_transform.unsqueeze(0).bmm(
@@ -129,6 +131,58 @@ class Camera(nn.Module):
         ).squeeze(0)
         self.camera_center = self.world_view_transform.inverse()[3, :3]
 
+    def load_image(self):
+        resized_image_rgb = PILtoTorch(self.image_loader(), self.resolution)
+        gt_image = resized_image_rgb[:3, ...]
+        if resized_image_rgb.shape[0] == 4:
+            alpha_mask = resized_image_rgb[3:4, ...].to(self.data_device)
+        else:
+            alpha_mask = torch.ones_like(
+                resized_image_rgb[0:1, ...].to(self.data_device)
+            )
+
+        if self.train_test_exp and self.is_test_view:
+            if self.is_test_dataset:
+                alpha_mask[..., : alpha_mask.shape[-1] // 2] = 0
+            else:
+                alpha_mask[..., alpha_mask.shape[-1] // 2 :] = 0
+
+        return gt_image.clamp(0.0, 1.0).to(self.data_device), alpha_mask
+
+    def set_resolution(self, resolution):
+        """Render and load the ground-truth image at another resolution."""
+        if resolution == self.resolution:
+            return
+
+        self.resolution = resolution
+        self.image_width = resolution[0]
+        self.image_height = resolution[1]
+        self._image = None
+        self._image_future = None
+
+    def prefetch_image(self):
+        """Start decoding the ground-truth image on a background thread."""
+        if self._image is None and self._image_future is None:
+            self._image_future = _image_executor.submit(self.load_image)
+
+    def _get_image(self):
+        if self._image is None:
+            if self._image_future is not None:
+                self._image = self._image_future.result()
+                self._image_future = None
+            else:
+                self._image = self.load_image()
+
+        return self._image
+
+    @property
+    def original_image(self):
+        return self._get_image()[0]
+
+    @property
+    def alpha_mask(self):
+        return self._get_image()[1]
+
 
 class MiniCam:
     def __init__(
@@ -49,8 +49,9 @@ class GaussianModel:
 
         self.rotation_activation = torch.nn.functional.normalize
 
-    def __init__(self, sh_degree, optimizer_type="default"):
+    def __init__(self, sh_degree, optimizer_type="default", device="cuda"):
         self.active_sh_degree = 0
+        self.device = device
         self.optimizer_type = optimizer_type
         self.max_sh_degree = sh_degree
         self._xyz = torch.empty(0)
@@ -351,7 +352,7 @@ class GaussianModel:
                 self.pretrained_exposures = {
                     image_name: torch.FloatTensor(exposures[image_name])
                     .requires_grad_(False)
-                    .cuda()
+                    .to(self.device)
                     for image_name in exposures
                 }
                 print(f"Pretrained exposures loaded.")
@@ -408,16 +409,18 @@ class GaussianModel:
             rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
 
         self._xyz = nn.Parameter(
-            torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True)
+            torch.tensor(xyz, dtype=torch.float, device=self.device).requires_grad_(
+                True
+            )
         )
         self._features_dc = nn.Parameter(
-            torch.tensor(features_dc, dtype=torch.float, device="cuda")
+            torch.tensor(features_dc, dtype=torch.float, device=self.device)
             .transpose(1, 2)
             .contiguous()
             .requires_grad_(True)
         )
         self._features_rest = nn.Parameter(
-            torch.tensor(features_extra, dtype=torch.float, device="cuda")
+            torch.tensor(features_extra, dtype=torch.float, device=self.device)
             .transpose(1, 2)
             .contiguous()
             .requires_grad_(True)
@@ -426,21 +429,25 @@ class GaussianModel:
             (self._features_dc, self._features_rest), dim=1
         )
         self._opacity = nn.Parameter(
-            torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(
-                True
-            )
+            torch.tensor(
+                opacities, dtype=torch.float, device=self.device
+            ).requires_grad_(True)
         )
         self._early_activate_opacity = self.opacity_activation(
             self._opacity
         ).contiguous()
         self._scaling = nn.Parameter(
-            torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True)
+            torch.tensor(scales, dtype=torch.float, device=self.device).requires_grad_(
+                True
+            )
         )
         self._early_activate_scaling = self.scaling_activation(
             self._scaling
         ).contiguous()
         self._rotation = nn.Parameter(
-            torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True)
+            torch.tensor(rots, dtype=torch.float, device=self.device).requires_grad_(
+                True
+            )
         )
         self._early_activate_rotation = self.rotation_activation(
             self._rotation
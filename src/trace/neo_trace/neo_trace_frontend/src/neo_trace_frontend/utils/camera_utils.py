@@ -9,6 +9,8 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+from functools import partial
+
 import cv2
 import numpy as np
 from PIL import Image
@@ -17,14 +19,15 @@ from ..scene.cameras import Camera
 from ..utils.custom_utils import get_resolution
 from ..utils.graphics_utils import fov2focal
 
-WARNED = False
-
 
-def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dataset):
+def loadImage(image_path):
     try:
-        image = Image.open(cam_info.image_path)
+        return Image.open(image_path)
     except:
-        image = Image.new("RGB", get_resolution(), (255, 255, 255))
+        return Image.new("RGB", get_resolution(), (255, 255, 255))
+
+
+def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dataset):
 
     if cam_info.depth_path != "":
         try:
@@ -55,31 +58,6 @@ def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dat
     else:
         invdepthmap = None
 
-    orig_w, orig_h = image.size
-    if args.resolution in [1, 2, 4, 8]:
-        resolution = (
-            round(orig_w / (resolution_scale * args.resolution)),
-            round(orig_h / (resolution_scale * args.resolution)),
-        )
-    else:  # should be a type that converts to float
-        if args.resolution == -1:
-            if orig_w > 1600:
-                global WARNED
-                if not WARNED:
-                    print(
-                        "[ INFO ] Encountered quite large input images (>1.6K pixels width), rescaling to 1.6K.\n "
-                        "If this is not desired, please explicitly specify '--resolution/-r' as 1"
-                    )
-                    WARNED = True
-                global_down = orig_w / 1600
-            else:
-                global_down = 1
-        else:
-            global_down = orig_w / args.resolution
-
-        scale = float(global_down) * float(resolution_scale)
-        resolution = (int(orig_w / scale), int(orig_h / scale))
-
     resolution = get_resolution()
 
     return Camera(
@@ -90,7 +68,7 @@ def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dat
         FoVx=cam_info.FovX,
         FoVy=cam_info.FovY,
         depth_params=cam_info.depth_params,
-        image=image,
+        image_loader=partial(loadImage, cam_info.image_path),
         invdepthmap=invdepthmap,
         image_name=cam_info.image_name,
         uid=id,
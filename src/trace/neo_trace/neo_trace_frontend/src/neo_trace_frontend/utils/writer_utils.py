@@ -0,0 +1,74 @@
+import queue
+import threading
+
+
+class AsyncWriter:
+    """Run output jobs (PNG encoding, file writes) on background threads.
+
+    At most ``max_pending`` jobs wait in the queue; ``submit`` blocks beyond
+    that, so a slow disk throttles the frame loop instead of buffering every
+    frame in memory. Jobs must own their data, e.g. cloned tensors.
+
+    The first job error is raised again from the next ``submit`` or from
+    ``close``, which waits for every submitted job. Use as a context manager
+    to close on exit.
+    """
+
+    def __init__(self, num_worker=2, max_pending=4):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._work, name=f"writer_{i}", daemon=True)
+            for i in range(num_worker)
+        ]
+
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+
+            if job is None:
+                self.queue.task_done()
+                return
+
+            fn, args = job
+            try:
+                fn(*args)
+            except BaseException as e:
+                with self.lock:
+                    if self.error is None:
+                        self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        with self.lock:
+            error, self.error = self.error, None
+
+        if error is not None:
+            raise error
+
+    def submit(self, fn, *args):
+        self._raise_error()
+        self.queue.put((fn, args))
+
+    def close(self):
+        if self.threads:
+            for _ in self.threads:
+                self.queue.put(None)
+
+            for thread in self.threads:
+                thread.join()
+
+            self.threads = []
+
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
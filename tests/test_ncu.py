@@ -0,0 +1,112 @@
+import csv
+import importlib.util
+import math
+import os
+
+# Load ncu.py alone; importing the neo_ae package pulls in torch
+spec = importlib.util.spec_from_file_location(
+    "ncu",
+    os.path.join(os.path.dirname(__file__), "..", "src", "neo_ae", "ncu.py"),
+)
+ncu = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ncu)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "ncu_raw.csv")
+
+gs_processType_function = [
+    ("feature extraction", "preprocessCUDA"),
+    ("sorting", "DeviceScanInitKernel"),
+    ("sorting", "DeviceScanKernel"),
+    ("sorting", "duplicateWithKeys"),
+    ("sorting", "DeviceRadixSortHistogramKernel"),
+    ("sorting", "DeviceRadixSortExclusiveSumKernel"),
+    ("sorting", "DeviceRadixSortOnesweepKernel"),
+    ("sorting", "identifyTileRanges"),
+    ("rasterization", "renderCUDA"),
+]
+
+neo_processType_function = [
+    ("feature extraction", "preprocessCUDA"),
+    ("feature extraction", "preprocess_reuseCUDA"),
+    ("sorting", "DeviceScanInitKernel"),
+    ("sorting", "DeviceScanKernel"),
+    ("sorting", "duplicateWithKeys"),
+    ("sorting", "duplicateWithKeys_reuse"),
+    ("sorting", "DeviceRadixSortHistogramKernel"),
+    ("sorting", "DeviceRadixSortExclusiveSumKernel"),
+    ("sorting", "DeviceRadixSortOnesweepKernel"),
+    ("sorting", "identifyTileRanges"),
+    ("sorting", "optimized_mergingCUDA"),
+    ("rasterization", "renderCUDA"),
+    ("rasterization", "render_reuseCUDA"),
+]
+
+
+def load_rows(csv_file_path, processType_function, skip_until=None):
+    """The per-row loop load_ncu replaced in postprocess_figure_5/10/16."""
+    runtime_breakdown = dict()
+    memory_breakdown = dict()
+    for proc_type, _ in processType_function:
+        runtime_breakdown[proc_type] = 0
+        memory_breakdown[proc_type] = 0
+
+    skip_flag = skip_until is not None
+
+    with open(csv_file_path, mode="r") as readfile:
+        reader = csv.DictReader(readfile)
+        for row in reader:
+            kernel_name = row["Kernel Name"]
+
+            if skip_flag:
+                if skip_until in kernel_name:
+                    skip_flag = False
+                continue
+
+            for proc_type, kernel in processType_function:
+                if kernel in kernel_name:
+                    read_sectors = float(row["lts__d_sectors_fill_sysmem.sum"] or 0.0)
+                    write_sectors = float(
+                        row["lts__t_sectors_aperture_sysmem_op_write.sum"] or 0.0
+                    )
+                    memory_breakdown[proc_type] += (read_sectors + write_sectors) * 32
+                    runtime_breakdown[proc_type] += float(
+                        row["gpu__time_duration.avg"] or 0.0
+                    )
+                    break
+
+    return runtime_breakdown, memory_breakdown
+
+
+def assert_breakdown(actual, expected):
+    for actual_breakdown, expected_breakdown in zip(actual, expected):
+        assert actual_breakdown.keys() == expected_breakdown.keys()
+        for proc_type in expected_breakdown:
+            assert math.isclose(
+                actual_breakdown[proc_type], expected_breakdown[proc_type]
+            )
+
+
+def test_load_ncu_gs():
+    assert_breakdown(
+        ncu.load_ncu(FIXTURE, gs_processType_function),
+        load_rows(FIXTURE, gs_processType_function),
+    )
+
+
+def test_load_ncu_neo_skips_first_frame():
+    assert_breakdown(
+        ncu.load_ncu(FIXTURE, neo_processType_function, skip_until="renderCUDA"),
+        load_rows(FIXTURE, neo_processType_function, skip_until="renderCUDA"),
+    )
+
+
+def test_load_ncu_units_row():
+    runtime_breakdown, memory_breakdown = ncu.load_ncu(FIXTURE, gs_processType_function)
+
+    # Only the two renderCUDA rows; render_reuseCUDA is not a 3DGS kernel
+    assert math.isclose(runtime_breakdown["rasterization"], 401312 + 399808)
+    # The kernel names with commas are still one column each
+    assert math.isclose(
+        memory_breakdown["sorting"],
+        (0 + 4 + 22 + 19 + 1023 + 20480 + 40960 * 2 + 2048 + 512 + 512 + 16384) * 32,
+    )
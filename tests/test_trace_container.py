@@ -0,0 +1,104 @@
+import importlib.util
+import os
+
+import numpy as np
+
+# Load trace.py alone; importing neo_trace_backend pulls in torch and _C
+spec = importlib.util.spec_from_file_location(
+    "trace",
+    os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "src",
+        "trace",
+        "neo_trace",
+        "neo_trace_backend",
+        "src",
+        "neo_trace_backend",
+        "trace.py",
+    ),
+)
+trace = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(trace)
+
+
+def write_container(path, traces, footer=True):
+    """A container as the backend writes it; traces are (frame, format, data)
+    and without footer it is left as by a writer that never closed it."""
+    header = np.zeros(1, trace.CONTAINER_HEADER_DTYPE)
+    header["magic"] = trace.CONTAINER_MAGIC
+    header["version"] = trace.CONTAINER_VERSION
+    header["header_size"] = trace.CONTAINER_HEADER_DTYPE.itemsize
+
+    index = np.zeros(len(traces), trace.CONTAINER_RECORD_DTYPE)
+
+    with open(path, "wb") as file:
+        file.write(header.tobytes())
+
+        for record, (frame, format, data) in zip(index, traces):
+            record["magic"] = trace.CONTAINER_RECORD_MAGIC
+            record["frame"] = frame
+            record["offset"] = file.tell() + trace.CONTAINER_RECORD_DTYPE.itemsize
+            record["size"] = len(data)
+            record["format"] = format
+
+            file.write(record.tobytes())
+            file.write(data)
+            file.write(bytes(-len(data) % 8))
+
+        if footer:
+            footer = np.zeros(1, trace.CONTAINER_FOOTER_DTYPE)
+            footer["index_offset"] = file.tell()
+            footer["num_trace"] = len(index)
+            footer["magic"] = trace.CONTAINER_FOOTER_MAGIC
+
+            file.write(index.tobytes())
+            file.write(footer.tobytes())
+
+
+def contents(container):
+    return {
+        frame: (container.trace_file(frame), bytes(container.read(frame)))
+        for frame in container.frames
+    }
+
+
+def test_merge_shards(tmp_path):
+    shards = [
+        [(1, 0, b"frame 1\n"), (2, 1, b"NEOTRACE" + bytes(range(21)))],
+        [(3, 0, b"frame 3, unpadded")],
+        [(4, 1, b"")],
+    ]
+    paths = [str(tmp_path / f"trace_{i}.neotrace") for i in range(len(shards))]
+    for i, (path, traces) in enumerate(zip(paths, shards)):
+        # The second shard was not closed, so it has no index
+        write_container(path, traces, footer=i != 1)
+
+    trace.merge_containers(str(tmp_path / trace.CONTAINER_FILE), paths)
+    merged = trace.load_container(str(tmp_path))
+
+    assert merged._index() is not None
+    assert merged.frames == [1, 2, 3, 4]
+    assert contents(merged) == {
+        frame: (trace.TRACE_FILE[format], data)
+        for traces in shards
+        for frame, format, data in traces
+    }
+
+
+def test_merge_into_existing(tmp_path):
+    path = str(tmp_path / trace.CONTAINER_FILE)
+    shard = str(tmp_path / "trace_1_3.neotrace")
+
+    write_container(path, [(0, 0, b"frame 0"), (1, 0, b"old frame 1")])
+    write_container(shard, [(1, 0, b"new frame 1"), (2, 0, b"frame 2")])
+
+    trace.merge_containers(path, [path, shard])
+    merged = trace.load_container(path)
+
+    # As if the shard had been appended: its frame 1 supersedes the old one
+    assert merged.frames == [0, 1, 2]
+    assert bytes(merged.read(0)) == b"frame 0"
+    assert bytes(merged.read(1)) == b"new frame 1"
+    assert bytes(merged.read(2)) == b"frame 2"
+    assert not os.path.exists(path + ".tmp")